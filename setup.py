@@ -8,7 +8,7 @@ data_files = [
     ('share/man/man1', ['man/en/sos-report.1', 'man/en/sos.1',
                         'man/en/sos-collect.1', 'man/en/sos-clean.1',
                         'man/en/sos-mask.1', 'man/en/sos-help.1',
-                        'man/en/sos-upload.1']),
+                        'man/en/sos-upload.1', 'man/en/sos-rebuild.1']),
     ('share/man/man5', ['man/en/sos.conf.5']),
     ('config', ['sos.conf', 'tmpfiles/tmpfilesd-sos-rh.conf'])
 ]
@@ -25,6 +25,8 @@ setup(
     # to avoid a packaging dependency on older RHELs
     # we only declare it on recent Python versions
     install_requires=['pexpect', 'pyyaml', 'packaging;python_version>="3.11"'],
+    # zstd compression is native from Python 3.14 on
+    extras_require={'zstd': ['zstandard;python_version<"3.14"']},
     description=(
         'A set of tools to gather troubleshooting information from a system'
     ),
@@ -23,6 +23,8 @@ Obsoletes: sos-collector <= 1.9
 BuildRequires: systemd
 # Mandatory just for uploading to an S3 bucket:
 Recommends: python3-boto3
+# Mandatory just for zstd compressed archives before Python 3.14:
+Recommends: python3-zstandard
 
 %description
 Sos is a set of tools that gathers information about system
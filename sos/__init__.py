@@ -54,11 +54,13 @@ class SoS():
         import sos.report
         import sos.cleaner
         import sos.help
+        import sos.rebuild
         import sos.upload
         self._components = {
             'report': (sos.report.SoSReport, ['rep']),
             'clean': (sos.cleaner.SoSCleaner, ['cleaner', 'mask']),
             'help': (sos.help.SoSHelper, []),
+            'rebuild': (sos.rebuild.SoSRebuild, []),
             'upload': (sos.upload.SoSUpload, [])
         }
         # some distros do not want pexpect as a default dep, so try to load
@@ -152,9 +154,18 @@ class SoS():
 
         global_grp.add_argument('-z', '--compression-type',
                                 dest="compression_type",
-                                choices=['auto', 'gzip', 'xz',
+                                choices=['auto', 'gzip', 'xz', 'zstd',
                                          'none'],
                                 help="compression technology to use")
+        global_grp.add_argument('--zstd-level', dest="zstd_level", type=int,
+                                choices=range(1, 20), metavar='LEVEL',
+                                help="compression level to use with zstd, "
+                                     "from 1 to 19")
+        global_grp.add_argument('--archive-index', dest="archive_index",
+                                action="store_true", default=False,
+                                help="compress gzip and xz archives in "
+                                     "blocks and write an index of their "
+                                     "members alongside them")
 
         # Group to make tarball encryption (via GPG/password) exclusive
         encrypt_grp = global_grp.add_mutually_exclusive_group()
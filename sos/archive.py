@@ -15,9 +15,20 @@ import shutil
 import logging
 import codecs
 import errno
+import gzip
+import hashlib
+import io
+import json
+import fcntl
 import stat
 import re
+import time
+from bisect import bisect_right
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from fnmatch import fnmatch
 from threading import Lock
 
 from importlib.util import find_spec
@@ -31,12 +42,712 @@ except ImportError:
     # the sos archive
     pass
 
+# zstd support is provided natively from python 3.14, or by the zstandard
+# module on older versions
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 P_FILE = "file"
 P_LINK = "link"
 P_NODE = "node"
 P_DIR = "dir"
 P_CONTFILE = "contaner file"
 
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# the window used for zstd long distance matching. 128MiB is the largest
+# window that zstd decompresses without being given --long explicitly
+ZSTD_WINDOW_LOG = 27
+ZSTD_DEFAULT_LEVEL = 9
+
+# references to the files of a baseline report, in delta reports
+DELTA_INDEX = 'sos_reports/delta.json'
+
+# suffix of the member index written alongside block compressed archives
+ARCHIVE_INDEX_SUFFIX = '.index'
+
+# ioctl request cloning the extents of one file into another (a reflink) on
+# filesystems that share data blocks between files, such as XFS and btrfs
+FICLONE = 0x40049409
+
+
+def _kernel_copy(fsrc, fdst, method):
+    """Copy the content of `fsrc` to `fdst` inside the kernel, with either
+    `copy_file_range()` or `sendfile()`.
+
+    Returns False without copying anything if `method` cannot be used for
+    these files, including files such as those in /proc that report a size of
+    zero and that these system calls cannot read content from.
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    blocksize = min(max(os.fstat(infd).st_size, 2 ** 23), 2 ** 30)
+    copied = 0
+    while True:
+        try:
+            if method == 'copy_file_range':
+                done = os.copy_file_range(infd, outfd, blocksize)
+            else:
+                done = os.sendfile(outfd, infd, copied, blocksize)
+        except OSError:
+            if copied:
+                raise
+            return False
+        if not done:
+            return copied > 0
+        copied += done
+
+
+def copy_file_data(fsrc, fdst):
+    """Copy the content of the open file `fsrc` to the open, empty, file
+    `fdst`, using the cheapest method the files support: a reflink, then
+    `copy_file_range()`, then `sendfile()`, and finally reading and writing
+    the data.
+
+    :param fsrc: The file to copy from, opened for binary reading
+    :type fsrc: ``file``
+
+    :param fdst: The file to copy to, opened for binary writing
+    :type fdst: ``file``
+
+    :returns: The name of the method used
+    :rtype: ``str``
+    """
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return 'reflink'
+    except OSError:
+        pass
+    for method in ('copy_file_range', 'sendfile'):
+        if hasattr(os, method) and _kernel_copy(fsrc, fdst, method):
+            return method
+    shutil.copyfileobj(fsrc, fdst)
+    return 'read/write'
+
+
+def break_hardlink(path):
+    """Give a regular file that is hardlinked to other files a copy of the
+    data of its own, so that it can be rewritten in place without changing
+    the other files.
+
+    :param path: The path of the file on disk
+    :type path: ``str``
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return
+    if not stat.S_ISREG(st.st_mode) or st.st_nlink < 2:
+        return
+    tmp = f"{path}.sos-unlink"
+    shutil.copy2(path, tmp)
+    try:
+        os.chown(tmp, st.st_uid, st.st_gid)
+    except OSError:
+        pass
+    os.replace(tmp, path)
+
+
+def file_digest(path):
+    """Hash the content of a file
+
+    :param path: The path of the file on disk
+    :type path: ``str``
+
+    :returns: The SHA-256 digest of the file
+    :rtype: ``bytes``
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def file_sub(path, subs):
+    """Apply a list of regexp substitutions, in order, to the file at `path`
+    reading and rewriting its content only once.
+
+    This is a module level function so that batches of files may be handed
+    to worker processes.
+
+    :param path: The path of the file on disk
+    :type path: ``str``
+
+    :param subs: The substitutions to apply, as (pattern, flags, subst)
+    :type subs: ``list`` of ``tuple``
+
+    :returns: Number of replacements made
+    :rtype: ``int``
+    """
+    with codecs.open(path, "r", encoding='utf-8', errors='ignore') as readable:
+        content = readable.read()
+    replacements = 0
+    for pattern, flags, subst in subs:
+        content, count = re.subn(pattern, subst, content, flags=flags)
+        replacements += count
+    if replacements:
+        break_hardlink(path)
+        with codecs.open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    return replacements
+
+
+def timed_file_sub(path, subs):
+    """Apply substitutions to a file as file_sub() does, timing the work
+
+    :returns: Number of replacements made, and the seconds it took
+    :rtype: ``tuple``, ``(int, float)``
+    """
+    start = time.monotonic()
+    replacements = file_sub(path, subs)
+    return replacements, time.monotonic() - start
+
+
+def zstd_available():
+    """Check whether archives may be compressed with zstd
+
+    :returns: True if python has zstd support, natively or via zstandard
+    :rtype: ``bool``
+    """
+    return zstd is not None or zstandard is not None
+
+
+def is_zstd(path):
+    """Check whether the file at `path` is zstd compressed"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(4) == ZSTD_MAGIC
+    except OSError:
+        return False
+
+
+def zstd_open(path, mode='rb', level=ZSTD_DEFAULT_LEVEL, threads=1):
+    """Open a zstd compressed file for binary reading or writing.
+
+    Files are written with long distance matching, which finds the many
+    near-duplicate files of a report (e.g. rotated logs, or the same command
+    run in each network namespace) far beyond the reach of xz or gzip.
+
+    :param path: The path of the file, or a file object
+    :type path: ``str`` or ``file``
+
+    :param mode: Either 'rb' or 'wb'
+    :type mode: ``str``
+
+    :param level: The compression level, from 1 to 19
+    :type level: ``int``
+
+    :param threads: The number of threads to compress with
+    :type threads: ``int``
+
+    :returns: A file object the uncompressed data is read from or written to
+    :rtype: ``file``
+
+    :raises: ``ImportError`` if python has no zstd support
+    """
+    writing = 'w' in mode
+    if zstd is not None:
+        if not writing:
+            return zstd.open(path, 'rb')
+        param = zstd.CompressionParameter
+        options = {
+            param.compression_level: level,
+            param.enable_long_distance_matching: 1,
+            param.window_log: ZSTD_WINDOW_LOG
+        }
+        if threads > 1:
+            options[param.nb_workers] = threads
+        return zstd.open(path, 'wb', options=options)
+    if zstandard is not None:
+        if not writing:
+            return zstandard.open(path, 'rb')
+        params = zstandard.ZstdCompressionParameters.from_level(
+            level, enable_ldm=True, window_log=ZSTD_WINDOW_LOG,
+            threads=threads if threads > 1 else 0
+        )
+        cctx = zstandard.ZstdCompressor(compression_params=params)
+        return zstandard.open(path, 'wb', cctx=cctx)
+    raise ImportError("zstd compression requires python 3.14 or later, or "
+                      "the python zstandard module")
+
+
+class ZstdReader():
+    """A read-only file object over a zstd compressed file that, unlike the
+    readers of the zstandard module, may also seek backwards, as tarfile
+    needs to in order to extract single members.
+
+    Seeking backwards restarts decompression from the start of the file, in
+    the same way that python's gzip module does.
+
+    :param path: The path of the zstd compressed file
+    :type path: ``str``
+    """
+
+    def __init__(self, path):
+        self.name = path
+        self._fileobj = None
+        self._pos = 0
+        self._rewind()
+
+    def _rewind(self):
+        if self._fileobj:
+            self._fileobj.close()
+        self._fileobj = zstd_open(self.name, 'rb')
+        self._pos = 0
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._pos += len(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can only seek from the start of "
+                                          "zstd files")
+        if offset < self._pos:
+            self._rewind()
+        while self._pos < offset:
+            if not self.read(min(offset - self._pos, 1024 * 1024)):
+                break
+        return self._pos
+
+    def close(self):
+        self._fileobj.close()
+
+
+def open_tarfile(path):
+    """Open an existing tar archive for reading, whatever the compression it
+    uses, including zstd on python versions whose tarfile module does not
+    support it natively.
+
+    :param path: The path of the archive
+    :type path: ``str``
+
+    :returns: The opened archive
+    :rtype: ``tarfile.TarFile``
+    """
+    if zstd is not None or not is_zstd(path):
+        return tarfile.open(path)
+    fileobj = ZstdReader(path)
+    try:
+        tar = tarfile.open(fileobj=fileobj, mode='r:')
+    except Exception:
+        fileobj.close()
+        raise
+    # have the archive close our reader when it is closed, as tarfile does
+    # itself for the compressed files it opens
+    # pylint: disable-next=protected-access
+    tar._extfileobj = False
+    return tar
+
+
+def is_tarfile(path):
+    """Check whether `path` is a tar archive, the way `tarfile.is_tarfile()`
+    does, but also recognising zstd compressed archives.
+
+    :param path: The path to check
+    :type path: ``str``
+
+    :returns: True if `path` is a tar archive sos can read
+    :rtype: ``bool``
+    """
+    if not is_zstd(path):
+        return tarfile.is_tarfile(path)
+    try:
+        with open_tarfile(path):
+            return True
+    except Exception:
+        return False
+
+
+def extract_tarfile(archive_path, path):
+    """Extract a report archive, making sure that none of its members are
+    written outside of the target directory.
+
+    :param archive_path: The path of the archive to extract
+    :type archive_path: ``str``
+
+    :param path: The directory to extract the archive into
+    :type path: ``str``
+
+    :returns: The path of the extracted report directory
+    :rtype: ``str``
+    """
+    with open_tarfile(archive_path) as archive:
+        # set extract filter since python 3.12 (see PEP-706 for more)
+        # Because python 3.10 and 3.11 raises false alarms as exceptions
+        # (see #3330 for examples), we can't use data filter but must
+        # fully trust the archive (legacy behaviour)
+        archive.extraction_filter = getattr(tarfile, 'fully_trusted_filter',
+                                            (lambda member, path: member))
+
+        # Guard against "Arbitrary file write during tarfile extraction"
+        # Checks the extracted files don't stray out of the target directory.
+        not_root = os.getuid() != 0
+        members = archive.getmembers()
+        for member in members:
+            member_path = os.path.join(path, member.name)
+            abs_directory = os.path.abspath(path)
+            abs_target = os.path.abspath(member_path)
+            prefix = os.path.commonprefix([abs_directory, abs_target])
+            if prefix != abs_directory:
+                raise Exception(f"Attempted path traversal in tarfle"
+                                f"{prefix} != {abs_directory}")
+            # Directories collected from the host may lack u+w or u+x
+            # permissions, preventing child members from being created during
+            # extract
+            if not_root and member.isdir():
+                member.mode |= stat.S_IWUSR | stat.S_IXUSR
+        archive.extractall(path, members=members)
+        return os.path.join(path, archive.name.split('/')[-1].split('.tar')[0])
+
+
+def report_content_index(path):
+    """Hash the content of every file in a report archive, reading the
+    archive only once.
+
+    :param path: The path of the report archive
+    :type path: ``str``
+
+    :returns: The name of the top level directory of the archive, and the
+              hex SHA-256 digest of each file by its path relative to it
+    :rtype: ``tuple`` of ``str`` and ``dict``
+    """
+    top = None
+    files = {}
+    with open_tarfile(path) as tar:
+        for member in tar:
+            name, _, rel_path = member.name.partition('/')
+            top = top or name
+            if member.isreg():
+                digest = hashlib.sha256()
+                fobj = tar.extractfile(member)
+                for block in iter(lambda: fobj.read(1024 * 1024), b''):
+                    digest.update(block)
+                files[rel_path] = digest.hexdigest()
+            elif member.islnk():
+                target = member.linkname.partition('/')[2]
+                if target in files:
+                    files[rel_path] = files[target]
+    return top, files
+
+
+def compress_block(method, block, **kwargs):
+    """Compress `block` as a complete gzip member or xz stream, so that the
+    results of consecutive blocks may simply be concatenated.
+
+    :param method: The compression method, either 'gzip' or 'xz'
+    :type method: ``str``
+
+    :param block: The data to compress
+    :type block: ``bytes``
+
+    :param kwargs: Passed to `gzip.compress()` or `lzma.compress()`, e.g.
+                   `compresslevel` or `preset`
+
+    :returns: The compressed data
+    :rtype: ``bytes``
+    """
+    if method == 'gzip':
+        return gzip.compress(block, **kwargs)
+    import lzma
+    return lzma.compress(block, format=lzma.FORMAT_XZ, **kwargs)
+
+
+class ParallelCompressor():
+    """A write-only file object that splits the data written to it into
+    blocks and compresses the blocks concurrently, writing them out in order.
+
+    The result is a multi-member gzip file or a multi-stream xz file, both of
+    which are read transparently by the standard gzip and xz tools as well as
+    by python's gzip, lzma and tarfile modules. Both zlib and lzma release the
+    GIL while compressing, so threads are enough to use several cores.
+
+    :param fileobj: The file to write the compressed data to
+    :type fileobj: ``file``
+
+    :param method: The compression method, either 'gzip' or 'xz'
+    :type method: ``str``
+
+    :param threads: The number of blocks to compress concurrently
+    :type threads: ``int``
+
+    :param kwargs: Compression options, passed to `compress_block()`
+    """
+
+    # large enough for the xz dictionary of the presets we use to be filled
+    # several times over, so that splitting costs little compression ratio
+    block_size = 16 * 1024 * 1024
+
+    def __init__(self, fileobj, method, threads, **kwargs):
+        self._fileobj = fileobj
+        self._method = method
+        self._kwargs = kwargs
+        self._pool = ThreadPoolExecutor(threads)
+        # bound memory use to a couple of blocks per thread
+        self._max_pending = threads * 2
+        self._pending = deque()
+        self._buf = bytearray()
+        self._pos = 0
+        self._blocks = 0
+        self._written = 0
+        # (uncompressed, compressed) offset of the start of each block
+        self.block_offsets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for future in self._pending:
+                future.cancel()
+            self._pool.shutdown()
+
+    def _submit(self, block):
+        self._pending.append(self._pool.submit(
+            compress_block, self._method, block, **self._kwargs
+        ))
+        self._blocks += 1
+        while len(self._pending) > self._max_pending:
+            self._write_block()
+
+    def _write_block(self):
+        data = self._pending.popleft().result()
+        self.block_offsets.append(
+            (len(self.block_offsets) * self.block_size, self._written)
+        )
+        self._fileobj.write(data)
+        self._written += len(data)
+
+    def write(self, data):
+        self._buf += data
+        self._pos += len(data)
+        while len(self._buf) >= self.block_size:
+            self._submit(bytes(self._buf[:self.block_size]))
+            del self._buf[:self.block_size]
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        """Compress the remaining data and wait for every block to be
+        written out"""
+        if self._buf or not self._blocks:
+            self._submit(bytes(self._buf))
+            self._buf = bytearray()
+        while self._pending:
+            self._write_block()
+        self._pool.shutdown()
+
+
+class DigestWriter():
+    """A write-only file object that hashes the data written through it to
+    another file, so that the checksum of a file is known as soon as it has
+    been written, without reading it back.
+
+    :param fileobj: The file to write the data to
+    :type fileobj: ``file``
+
+    :param hash_name: The name of the hashlib algorithm to hash the data with
+    :type hash_name: ``str``
+    """
+
+    def __init__(self, fileobj, hash_name):
+        self._fileobj = fileobj
+        self.hash_name = hash_name
+        self._digest = hashlib.new(hash_name)
+        # compressors record the name of the file they write to
+        self.name = getattr(fileobj, 'name', None)
+
+    def write(self, data):
+        self._digest.update(data)
+        return self._fileobj.write(data)
+
+    def tell(self):
+        return self._fileobj.tell()
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def close(self):
+        self._fileobj.close()
+
+    @property
+    def closed(self):
+        return self._fileobj.closed
+
+    def hexdigest(self):
+        """Return the checksum of the data written so far"""
+        return self._digest.hexdigest()
+
+
+class IndexingTarFile(tarfile.TarFile):
+    """A TarFile that records where in the tar stream the data of each
+    member it writes is stored, which tarfile only does for the members of
+    the archives it reads.
+    """
+
+    def addfile(self, tarinfo, fileobj=None, *args, **kwargs):
+        start = self.offset
+        super().addfile(tarinfo, fileobj, *args, **kwargs)
+        member = self.members[-1]
+        blocks, remainder = divmod(member.size if member.isreg() else 0,
+                                   tarfile.BLOCKSIZE)
+        if remainder:
+            blocks += 1
+        member.offset = start
+        member.offset_data = self.offset - blocks * tarfile.BLOCKSIZE
+
+
+class ArchiveIndex():
+    """An index of the members of a block compressed archive, as written by
+    `ParallelCompressor`, giving random access to any member without
+    decompressing the archive from its start.
+
+    The index maps the name of each file in the archive to the offset and
+    size of its data in the uncompressed tar stream, and records the
+    compressed offset at which each block of that stream starts. Reading a
+    member only decompresses the block its data starts in and those it spans.
+    It is stored alongside the archive, with the ``.index`` suffix, when the
+    archive is written with ``--archive-index``.
+
+    :param path: The path of the archive
+    :type path: ``str``
+
+    :param compression: The compression of the archive, 'gzip' or 'xz'
+    :type compression: ``str``
+
+    :param blocks: The (uncompressed, compressed) offset of each block
+    :type blocks: ``list``
+
+    :param members: The (offset, size) of the data of each file, by name
+    :type members: ``dict``
+    """
+
+    version = 1
+
+    def __init__(self, path, compression, blocks, members):
+        self.path = path
+        self.compression = compression
+        self.blocks = [tuple(block) for block in blocks]
+        self.members = members
+        self._starts = [block[0] for block in self.blocks]
+
+    @classmethod
+    def build(cls, path, compression, blocks, tarinfos):
+        """Index the members of an archive that has just been written.
+
+        :param tarinfos: The members written to the archive, in order
+        :type tarinfos: ``list`` of ``tarfile.TarInfo``
+        """
+        members = {}
+        symlinks = []
+        for tarinfo in tarinfos:
+            if tarinfo.isreg():
+                members[tarinfo.name] = (tarinfo.offset_data, tarinfo.size)
+            elif tarinfo.islnk() and tarinfo.linkname in members:
+                members[tarinfo.name] = members[tarinfo.linkname]
+            elif tarinfo.issym():
+                symlinks.append(tarinfo)
+        # symlinks to files within the archive are read as their target, as
+        # tarfile does, including those pointing to other symlinks
+        while symlinks:
+            unresolved = []
+            for tarinfo in symlinks:
+                target = os.path.normpath(os.path.join(
+                    os.path.dirname(tarinfo.name), tarinfo.linkname
+                ))
+                if target in members:
+                    members[tarinfo.name] = members[target]
+                else:
+                    unresolved.append(tarinfo)
+            if len(unresolved) == len(symlinks):
+                break
+            symlinks = unresolved
+        return cls(path, compression, blocks, members)
+
+    @classmethod
+    def load(cls, path):
+        """Load the index of an archive, if it has a valid one.
+
+        :param path: The path of the archive
+        :type path: ``str``
+
+        :returns: The index of the archive, or None if it has no index or
+                  the index does not match the archive
+        :rtype: ``ArchiveIndex`` or ``None``
+        """
+        try:
+            with open(path + ARCHIVE_INDEX_SUFFIX, 'r',
+                      encoding='utf-8') as index_file:
+                index = json.load(index_file)
+            if (index['version'] != cls.version or
+                    index['archive_size'] != os.stat(path).st_size):
+                return None
+            return cls(path, index['compression'], index['blocks'],
+                       index['members'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write(self):
+        """Write the index alongside the archive"""
+        index = {
+            'version': self.version,
+            'compression': self.compression,
+            'archive_size': os.stat(self.path).st_size,
+            'blocks': self.blocks,
+            'members': self.members
+        }
+        with open(self.path + ARCHIVE_INDEX_SUFFIX, 'w',
+                  encoding='utf-8') as index_file:
+            json.dump(index, index_file)
+
+    def getnames(self):
+        """Return the names of the files in the index"""
+        return list(self.members)
+
+    def read(self, name):
+        """Return the content of a file of the archive.
+
+        :param name: The name of the file in the archive
+        :type name: ``str``
+
+        :returns: The content of the file
+        :rtype: ``bytes``
+
+        :raises: ``KeyError`` if the file is not in the index
+        """
+        offset, size = self.members[name]
+        block = bisect_right(self._starts, offset) - 1
+        start, compressed_start = self.blocks[block]
+        with open(self.path, 'rb') as raw:
+            raw.seek(compressed_start)
+            if self.compression == 'xz':
+                import lzma
+                decompressed = lzma.LZMAFile(raw)
+            else:
+                decompressed = gzip.GzipFile(fileobj=raw)
+            with decompressed:
+                decompressed.seek(offset - start)
+                data = decompressed.read(size)
+        if len(data) != size:
+            raise ValueError(f"Truncated data for {name} in {self.path}")
+        return data
+
 
 class Archive:
     """Abstract base class for archives."""
@@ -89,6 +800,9 @@ class Archive:
     def add_binary(self, content, dest):
         raise NotImplementedError
 
+    def add_chunks(self, chunks, dest, binary=False):
+        raise NotImplementedError
+
     def add_link(self, source, link_name):
         raise NotImplementedError
 
@@ -138,6 +852,7 @@ class FileCacheArchive(Archive):
     _tmp_dir = ""
     _archive_root = ""
     _archive_name = ""
+    dedup = False
 
     def __init__(self, name, tmpdir, policy, threads, enc_opts, sysroot,
                  manifest=None):
@@ -152,6 +867,15 @@ class FileCacheArchive(Archive):
         self.sysroot = sysroot or '/'
         self.manifest = manifest
         self._archive_root = os.path.join(tmpdir, name)
+        # host path -> (stat, SELinux context) of the files copied from it
+        self._host_metadata = {}
+        # (size, mode, uid, gid) -> content digest -> (path, inode, ctime)
+        # of the first file seen, the digest being None until another file
+        # of the same size is added
+        self._dedup_index = {}
+        self._dedup_lock = Lock()
+        self.dedup_files = 0
+        self.dedup_bytes = 0
         with self._path_lock:
             os.makedirs(self._archive_root, 0o700)
         self.log_info("initialised empty FileCacheArchive at "
@@ -337,10 +1061,18 @@ class FileCacheArchive(Archive):
             return None
         return dest
 
-    def _copy_attributes(self, src, dest):
+    def _record_host_metadata(self, src, dest, fstat, context=None):
+        """Remember the metadata of the host file copied to `dest`, so that
+        the host file does not need to be looked up again when the archive is
+        built"""
+        path = os.sep + os.path.relpath(dest, self._archive_root)
+        self._host_metadata[path] = (fstat, context)
+
+    def _copy_attributes(self, src, dest, _stat=None):
         # copy file attributes, skip SELinux xattrs for /sys and /proc
         try:
-            _stat = os.stat(src)
+            _stat = _stat or os.stat(src)
+            self._record_host_metadata(src, dest, _stat)
             if src.startswith("/sys/") or src.startswith("/proc/"):
                 shutil.copymode(src, dest)
                 os.utime(dest, ns=(_stat.st_atime_ns, _stat.st_mtime_ns))
@@ -350,41 +1082,137 @@ class FileCacheArchive(Archive):
         except Exception as e:
             self.log_debug(f"caught '{e}' setting attributes of '{dest}'")
 
+    def _dedup_file(self, dest):
+        """Replace a file just added to the archive by a hardlink to an
+        identical file already in the archive, if deduplication is enabled.
+
+        Files are only hashed once another file with the same size, mode and
+        owner has been added, and a file found to have changed since it was
+        indexed is not linked to.
+
+        :param dest: The path of the file in the archive on disk
+        :type dest: ``str``
+        """
+        if not self.dedup:
+            return
+        rel_path = os.path.relpath(dest, self._archive_root)
+        # these are added to the tarball separately, and may not be the
+        # target of a hardlink
+        if (rel_path == 'version.txt' or
+                rel_path.startswith(('sos_logs', 'sos_reports'))):
+            return
+        try:
+            st = os.lstat(dest)
+        except OSError:
+            return
+        if (not stat.S_ISREG(st.st_mode) or st.st_nlink > 1 or
+                st.st_size == 0):
+            return
+
+        def is_current(entry):
+            try:
+                _st = os.lstat(entry[0])
+            except OSError:
+                return False
+            return (_st.st_ino, _st.st_ctime_ns) == entry[1:]
+
+        key = (st.st_size, st.st_mode, st.st_uid, st.st_gid)
+        with self._dedup_lock:
+            seen = self._dedup_index.setdefault(key, {})
+            if not seen:
+                seen[None] = (dest, st.st_ino, st.st_ctime_ns)
+                return
+            first = seen.pop(None, None)
+        first_digest = None
+        try:
+            if first and is_current(first):
+                first_digest = file_digest(first[0])
+            digest = file_digest(dest)
+        except OSError as err:
+            self.log_debug(f"could not hash '{dest}': {err}")
+            return
+        with self._dedup_lock:
+            if first_digest:
+                seen.setdefault(first_digest, first)
+            target = seen.get(digest)
+            if not target or target[0] == dest or not is_current(target):
+                seen[digest] = (dest, st.st_ino, st.st_ctime_ns)
+                return
+            tmp = f"{dest}.sos-dedup"
+            try:
+                os.link(target[0], tmp)
+                os.replace(tmp, dest)
+                _st = os.lstat(target[0])
+            except OSError as err:
+                self.log_debug(f"could not link '{dest}' to '{target[0]}': "
+                               f"{err}")
+                return
+            seen[digest] = (target[0], _st.st_ino, _st.st_ctime_ns)
+            self.dedup_files += 1
+            self.dedup_bytes += st.st_size
+        self.log_debug(f"deduplicated '{dest}' as a link to '{target[0]}'")
+
     def add_file(self, src, dest=None, force=False):
-        with self._path_lock:
-            if not dest:
-                dest = src
+        if not dest:
+            dest = src
+        is_path = not getattr(src, "read", None)
+
+        def not_collected(err):
+            # Filter out IO errors on virtual file systems.
+            if not (src.startswith("/sys/") or src.startswith("/proc/")):
+                self.log_info(f"File {src} not collected: '{err}'")
 
+        # Only the creation of the destination and its leading paths needs to
+        # be serialized: once the destination exists other threads adding the
+        # same path skip it, so the data itself is copied without the lock.
+        with self._path_lock:
             dest = self.check_path(dest, P_FILE, force=force)
             if not dest:
                 return
-
-            # Handle adding a file from either a string respresenting
-            # a path, or a File object open for reading.
-            if not getattr(src, "read", None):
-                # path case
+            if is_path:
+                fsrc = None
                 try:
-                    shutil.copy(src, dest)
+                    src_stat = os.stat(src)
+                    if stat.S_ISFIFO(src_stat.st_mode):
+                        raise shutil.SpecialFileError(
+                            f"`{src}` is a named pipe")
+                    fsrc = open(src, 'rb')
+                    if force and self.dedup:
+                        break_hardlink(dest)
+                    fdst = open(dest, 'wb')
                 except OSError as e:
-                    # Filter out IO errors on virtual file systems.
-                    if src.startswith("/sys/") or src.startswith("/proc/"):
-                        pass
-                    else:
-                        self.log_info(f"File {src} not collected: '{e}'")
-
-                self._copy_attributes(src, dest)
-                file_name = f"'{src}'"
+                    if fsrc:
+                        fsrc.close()
+                    not_collected(e)
+                    return
             else:
-                # Open file case: first rewind the file to obtain
-                # everything written to it.
-                src.seek(0)
-                with open(dest, "w", encoding='utf-8') as f:
-                    for line in src:
-                        f.write(line)
-                file_name = "open file"
-
-            self.log_debug(f"added {file_name} to FileCacheArchive "
-                           f"'{self._archive_root}'")
+                fdst = open(dest, "w", encoding='utf-8')
+
+        # Handle adding a file from either a string respresenting
+        # a path, or a File object open for reading.
+        if is_path:
+            # path case
+            try:
+                with fsrc, fdst:
+                    method = copy_file_data(fsrc, fdst)
+                self.log_debug(f"copied '{src}' using {method}")
+            except OSError as e:
+                not_collected(e)
+
+            self._copy_attributes(src, dest, src_stat)
+            self._dedup_file(dest)
+            file_name = f"'{src}'"
+        else:
+            # Open file case: first rewind the file to obtain
+            # everything written to it.
+            src.seek(0)
+            with fdst:
+                for line in src:
+                    fdst.write(line)
+            file_name = "open file"
+
+        self.log_debug(f"added {file_name} to FileCacheArchive "
+                       f"'{self._archive_root}'")
 
     def add_string(self, content, dest, mode='w'):
         with self._path_lock:
@@ -395,6 +1223,8 @@ class FileCacheArchive(Archive):
             # the Plugin postprocessing hooks to perform regex substitution
             # on file content.
             dest = self.check_path(dest, P_FILE, force=True)
+            if self.dedup:
+                break_hardlink(dest)
 
             with codecs.open(dest, mode, encoding='utf-8') as f:
                 if isinstance(content, bytes):
@@ -404,6 +1234,7 @@ class FileCacheArchive(Archive):
                     self._copy_attributes(src, dest)
                 self.log_debug(f"added string at '{src}' to FileCacheArchive "
                                f"'{self._archive_root}'")
+        self._dedup_file(dest)
 
     def add_binary(self, content, dest):
         with self._path_lock:
@@ -415,6 +1246,45 @@ class FileCacheArchive(Archive):
                 f.write(content)
             self.log_debug(f"added binary content at '{dest}' to archive "
                            f"'{self._archive_root}'")
+        self._dedup_file(dest)
+
+    def add_chunks(self, chunks, dest, binary=False):
+        """Add content given as an iterable of ``bytes`` chunks, such as the
+        output of a command, without holding it whole in memory.
+
+        Text content is written the same way as by `add_string()`, and binary
+        content the same way as by `add_binary()`.
+
+        :param chunks: The content to add
+        :type chunks: iterable of ``bytes``
+
+        :param dest: The path of the file in the archive
+        :type dest: ``str``
+
+        :param binary: Whether the content is binary rather than text
+        :type binary: ``bool``
+        """
+        # as with add_file(), the content is written without the lock
+        with self._path_lock:
+            dest = self.check_path(dest, P_FILE, force=not binary)
+            if not dest:
+                return
+            if self.dedup:
+                break_hardlink(dest)
+            fdst = open(dest, 'wb')
+        decoder = None
+        if not binary:
+            decoder = codecs.getincrementaldecoder('utf8')('ignore')
+        with fdst:
+            for chunk in chunks:
+                if decoder:
+                    chunk = decoder.decode(chunk).encode('utf8')
+                fdst.write(chunk)
+            if decoder:
+                fdst.write(decoder.decode(b'', final=True).encode('utf8'))
+        self.log_debug(f"added streamed content at '{dest}' to archive "
+                       f"'{self._archive_root}'")
+        self._dedup_file(dest)
 
     def add_link(self, source, link_name):
         self.log_debug(f"adding symlink at '{link_name}' -> '{source}'")
@@ -602,6 +1472,69 @@ class FileCacheArchive(Archive):
             replacements = 0
         return replacements
 
+    def do_file_subs(self, subs, workers=1, times=None):
+        """Apply batches of regexp substitutions to files in the archive.
+
+        All substitutions queued for a file are applied in the order given,
+        with a single read and a single rewrite of the file, and files are
+        spread across up to `workers` processes.
+
+        :param subs: Substitutions per path in the archive, as lists of
+                     (pattern, flags, subst)
+        :type subs: ``dict``
+
+        :param workers: Maximum number of worker processes to use
+        :type workers: ``int``
+
+        :param times: If given, filled with the seconds spent applying the
+                      substitutions of each path in the archive
+        :type times: ``dict``
+
+        :returns: Number of replacements made per path in the archive
+        :rtype: ``dict``
+        """
+        jobs = {path: (self.dest_path(path), _subs)
+                for path, _subs in subs.items() if _subs}
+        # callable substitutions cannot be handed to other processes
+        local = [path for path, job in jobs.items()
+                 if any(callable(sub[2]) for sub in job[1])]
+        remote = [path for path in jobs if path not in local]
+        outcomes = {}
+        if workers > 1 and len(remote) > 1:
+            with ProcessPoolExecutor(min(workers, len(remote))) as pool:
+                futures = {path: pool.submit(timed_file_sub, *jobs[path])
+                           for path in remote}
+                for path, future in futures.items():
+                    outcomes[path] = future.exception() or future.result()
+        else:
+            local = remote + local
+        for path in local:
+            try:
+                outcomes[path] = timed_file_sub(*jobs[path])
+            except Exception as err:
+                outcomes[path] = err
+
+        results = {}
+        for path in jobs:
+            outcome = outcomes[path]
+            if isinstance(outcome, Exception):
+                # if trying to regexp a non-existing file, dont log it as an
+                # error to stdout
+                if getattr(outcome, 'errno', None) == errno.ENOENT:
+                    self.log_debug(f"file '{path}' not collected, "
+                                   "substitution skipped")
+                else:
+                    self.log_error(f"regex substitution failed for '{path}' "
+                                   f"with: '{outcome}'")
+                outcome = (0, 0.0)
+            elif outcome[0] and os.path.exists(path):
+                with self._path_lock:
+                    self._copy_attributes(path, jobs[path][0])
+            results[path] = outcome[0]
+            if times is not None:
+                times[path] = outcome[1]
+        return results
+
     def tar_subdirs(self, paths):
         """Replace one or more collected directories with a single tarball.
 
@@ -644,6 +1577,52 @@ class FileCacheArchive(Archive):
                     os.unlink(tarpath)
         return packed
 
+    def drop_unchanged(self, baseline):
+        """Remove the files of the archive whose content is identical to
+        that of the same file in a baseline report, so that only the changed
+        files are kept.
+
+        The version file and the ``sos_logs`` and ``sos_reports`` directories
+        always describe this run, and are never removed.
+
+        :param baseline: The hex SHA-256 digest of each file in the baseline
+                         report, by its path relative to the report root
+        :type baseline: ``dict``
+
+        :returns: The digest of each removed file by its relative path, and
+                  the total size of the removed files
+        :rtype: ``tuple`` of ``dict`` and ``int``
+        """
+        dropped = {}
+        size = 0
+        for dirname, dirs, files in os.walk(self._archive_root):
+            rel_dir = os.path.relpath(dirname, self._archive_root)
+            if rel_dir == '.':
+                dirs[:] = [d for d in dirs
+                           if d not in ('sos_logs', 'sos_reports')]
+                rel_dir = ''
+            for name in files:
+                rel_path = os.path.join(rel_dir, name)
+                if rel_path == 'version.txt' or rel_path not in baseline:
+                    continue
+                path = os.path.join(dirname, name)
+                try:
+                    st = os.lstat(path)
+                    if (not stat.S_ISREG(st.st_mode) or
+                            file_digest(path).hex() != baseline[rel_path]):
+                        continue
+                    os.unlink(path)
+                except OSError as err:
+                    self.log_debug(f"Could not compare '{rel_path}' to the "
+                                   f"baseline: {err}")
+                    continue
+                self._host_metadata.pop(os.sep + rel_path, None)
+                dropped[rel_path] = baseline[rel_path]
+                size += st.st_size
+        self.log_info(f"dropped {len(dropped)} files unchanged since the "
+                      f"baseline ({size} bytes)")
+        return dropped, size
+
     def finalize(self, method):
         self.log_info(f"finalizing archive '{self._archive_root}' using method"
                       f" '{method}'")
@@ -659,7 +1638,11 @@ class FileCacheArchive(Archive):
 
         if self.enc_opts['encrypt']:
             try:
-                return self._encrypt(res)
+                res = self._encrypt(res)
+                # the checksum computed while writing is that of the
+                # unencrypted archive
+                self._checksum = None
+                return res
             except Exception as e:
                 exp_msg = "An error occurred encrypting the archive:"
                 self.log_error(f"{exp_msg} {e}")
@@ -716,7 +1699,10 @@ class TarFileArchive(FileCacheArchive):
     """ archive class using python TarFile to create tar archives"""
 
     method = None
+    zstd_level = ZSTD_DEFAULT_LEVEL
+    write_index = False
     _with_selinux_context = False
+    _checksum = None
 
     def __init__(self, name, tmpdir, policy, threads, enc_opts, sysroot,
                  manifest=None):
@@ -738,23 +1724,32 @@ class TarFileArchive(FileCacheArchive):
         tar_info.uid = fstat.st_uid
         tar_info.gid = fstat.st_gid
 
+    def _record_host_metadata(self, src, dest, fstat, context=None):
+        if self._with_selinux_context:
+            context = self.get_selinux_context(src)
+        super()._record_host_metadata(src, dest, fstat, context)
+
     # this can be used to set permissions if using the
     # tarfile.add() interface to add directory trees.
     def copy_permissions_filter(self, tarinfo):
         orig_path = tarinfo.name[len(os.path.split(self._archive_root)[-1]):]
         if not orig_path:
             orig_path = self._archive_root
-        skips = ['/version.txt$', '/sos_logs(/.*)?', '/sos_reports(/.*)?']
-        if any(re.match(skip, orig_path) for skip in skips):
+        if (orig_path == '/version.txt' or
+                orig_path.startswith(('/sos_logs', '/sos_reports'))):
             return None
-        try:
-            fstat = os.stat(orig_path)
-        except OSError:
-            return tarinfo
-        if self._with_selinux_context:
-            context = self.get_selinux_context(orig_path)
-            if context:
-                tarinfo.pax_headers['RHT.security.selinux'] = context
+        # use the metadata recorded when the file was copied, and only go
+        # back to the host for paths that were not copied as files
+        fstat, context = self._host_metadata.pop(orig_path, (None, None))
+        if fstat is None:
+            try:
+                fstat = os.stat(orig_path)
+            except OSError:
+                return tarinfo
+            if self._with_selinux_context:
+                context = self.get_selinux_context(orig_path)
+        if context:
+            tarinfo.pax_headers['RHT.security.selinux'] = context
         self.set_tarinfo_from_stat(tarinfo, fstat)
         return tarinfo
 
@@ -768,14 +1763,17 @@ class TarFileArchive(FileCacheArchive):
     def name(self):
         return f"{self._archive_root}.{self._suffix}"
 
-    def _build_archive(self, method):
+    @contextmanager
+    def _open_tar(self, method):
+        """Open the final tarball for writing, compressed using `method`,
+        and set the archive name to match the compression used"""
         _mode = 'w'
         if method == 'auto':
             method = 'xz' if find_spec('lzma') is not None else 'gzip'
         if method == 'none':
             method = None
         if method is not None:
-            _comp_mode = method.strip('ip')
+            _comp_mode = 'zst' if method == 'zstd' else method.strip('ip')
             self._archive_name = f"{self._archive_name}.{_comp_mode}"
             self._suffix += f".{_comp_mode}"
             _mode = f"w:{_comp_mode}"
@@ -786,22 +1784,292 @@ class TarFileArchive(FileCacheArchive):
             'gzip': {'compresslevel': 6},
             'xz':   {'preset': 3}
         }
-        with tarfile.open(self._archive_name,
-                          mode=_mode,
-                          **kwargs[method]) as tar:
-            # Add commonly reviewed files first, so that they can be more
-            # easily read from memory without needing to extract
-            # the whole archive
-            for _content in ['version.txt', 'sos_reports', 'sos_logs']:
-                if os.path.exists(os.path.join(self._archive_root, _content)):
-                    tar.add(
-                        os.path.join(self._archive_root, _content),
-                        arcname=f"{self._name}/{_content}"
-                    )
-            # we need to pass the absolute path to the archive root but we
-            # want the names used in the archive to be relative.
-            tar.add(self._archive_root, arcname=self._name,
-                    filter=self.copy_permissions_filter)
+        # more compression threads than usable CPUs would only slow us down
+        threads = min(self._threads, len(os.sched_getaffinity(0)))
+        self._checksum = None
+        index = None
+        # the archive is hashed as it is written out, so that it does not
+        # have to be read back to compute its checksum
+        with open(self._archive_name, 'wb') as raw:
+            fileobj = DigestWriter(raw,
+                                   self._policy.get_preferred_hash_name())
+            if method == 'zstd':
+                with zstd_open(fileobj, 'wb', level=self.zstd_level,
+                               threads=threads) as zfileobj, \
+                        tarfile.open(fileobj=zfileobj, mode='w') as tar:
+                    yield tar
+            elif method is not None and (threads > 1 or self.write_index):
+                # compressing in independent blocks also allows the members
+                # to be indexed for random access
+                self.log_debug(f"compressing archive with {threads} threads")
+                tarclass = IndexingTarFile if self.write_index else \
+                    tarfile.TarFile
+                with ParallelCompressor(fileobj, method, threads,
+                                        **kwargs[method]) as compressor, \
+                        tarclass.open(fileobj=compressor, mode='w') as tar:
+                    yield tar
+                if self.write_index:
+                    index = ArchiveIndex.build(self._archive_name, method,
+                                               compressor.block_offsets,
+                                               tar.members)
+            else:
+                with tarfile.open(fileobj=fileobj, mode=_mode,
+                                  **kwargs[method]) as tar:
+                    yield tar
+            self._checksum = (fileobj.hash_name, fileobj.hexdigest())
+        if index is not None:
+            try:
+                index.write()
+            except OSError as err:
+                self.log_warn(f"Could not write archive index: {err}")
+
+    def _build_archive(self, method):
+        with self._open_tar(method) as tar:
+            self._add_archive_content(tar)
+        return self.name()
+
+    def get_checksum(self, hash_name):
+        """Return the checksum of the final archive, as computed while the
+        archive was written.
+
+        :param hash_name: The name of the hashlib algorithm of the checksum
+        :type hash_name: ``str``
+
+        :returns: The hex digest of the archive, or None if it is not known,
+                  e.g. as the archive was encrypted once written
+        :rtype: ``str`` or ``None``
+        """
+        if self._checksum and self._checksum[0] == hash_name:
+            return self._checksum[1]
+        return None
+
+    def _add_archive_content(self, tar):
+        # Add commonly reviewed files first, so that they can be more
+        # easily read from memory without needing to extract
+        # the whole archive
+        for _content in ['version.txt', 'sos_reports', 'sos_logs']:
+            if os.path.exists(os.path.join(self._archive_root, _content)):
+                tar.add(
+                    os.path.join(self._archive_root, _content),
+                    arcname=f"{self._name}/{_content}"
+                )
+        # we need to pass the absolute path to the archive root but we
+        # want the names used in the archive to be relative.
+        tar.add(self._archive_root, arcname=self._name,
+                filter=self.copy_permissions_filter)
+
+
+class StreamedPathError(Exception):
+    """A file that was already streamed to the archive was to be rewritten,
+    for example to be sanitized, which can no longer be done.
+
+    :param paths: The paths in the archive of the streamed files
+    :type paths: ``list``
+    """
+
+    def __init__(self, paths):
+        self.paths = sorted(paths)
+        super().__init__("rewrite of files already streamed to the archive: "
+                         f"{', '.join(self.paths)}")
+
+
+class StreamingTarFileArchive(TarFileArchive):
+    """ TarFileArchive that writes collected files to the compressed tarball
+    while the collection is still running, instead of building the whole
+    tarball from the temporary directory once everything is collected.
+
+    Clients claim the paths that they may still add or rewrite using
+    `claim()`, and hand the files they are done with over using `release()`.
+    A released regular file is appended to the tarball, and removed from the
+    temporary directory, as soon as no client claims it any more. Directories,
+    links, and files that were never released, or that match one of
+    `hold_paths`, are added when the archive is finalized.
+
+    A streamed file can no longer be changed. Rewriting or substituting the
+    content of one raises `StreamedPathError`, and the path is recorded in
+    `streamed_writes`, so that an archive missing a rewrite, such as the
+    sanitizing of a file, is never handed out.
+    """
+
+    method = 'auto'
+    hold_paths = []
+
+    def __init__(self, name, tmpdir, policy, threads, enc_opts, sysroot,
+                 manifest=None):
+        super().__init__(name, tmpdir, policy, threads,
+                         enc_opts, sysroot, manifest)
+        self._stream_lock = Lock()
+        self._stack = None
+        self._tar = None
+        # archive path -> owners claiming it and anything below it
+        self._claims = {}
+        self._owned = {}
+        self._released = set()
+        self._streamed = set()
+        self.streamed_writes = set()
+
+    def _resolve(self, dest):
+        """Resolve the leading directories of a destination path, which may be
+        symbolic links within the archive, so that every file is streamed
+        under a single name"""
+        head, tail = os.path.split(dest)
+        real = os.path.realpath(head)
+        root = os.path.realpath(self._archive_root)
+        if real == root or real.startswith(root + os.sep):
+            return os.path.join(self._archive_root,
+                                os.path.relpath(real, root), tail)
+        return dest
+
+    def _is_streamed(self, dest):
+        return bool(self._streamed) and self._resolve(dest) in self._streamed
+
+    def _streamed_write(self, paths):
+        """Record and refuse writes to files already in the tarball"""
+        for path in paths:
+            self.log_error(f"'{path}' was streamed to the archive before "
+                           "being rewritten")
+        self.streamed_writes.update(paths)
+        raise StreamedPathError(paths)
+
+    def check_path(self, src, path_type, dest=None, force=False):
+        dest = dest or self.dest_path(src)
+        if self._is_streamed(dest):
+            # the file is already in the tarball, and no longer on disk
+            if not force:
+                return None
+            self._streamed_write([os.path.relpath(dest, self._archive_root)])
+        return super().check_path(src, path_type, dest=dest, force=force)
+
+    def do_file_sub(self, path, regexp, subst):
+        if self._is_streamed(self.dest_path(path)):
+            self._streamed_write([path])
+        return super().do_file_sub(path, regexp, subst)
+
+    def do_file_subs(self, subs, workers=1, times=None):
+        streamed = [path for path in subs
+                    if self._is_streamed(self.dest_path(path))]
+        results = super().do_file_subs(
+            {path: _subs for path, _subs in subs.items()
+             if path not in streamed},
+            workers=workers, times=times
+        )
+        if streamed:
+            self._streamed_write(streamed)
+        return results
+
+    def claim(self, owner, paths):
+        """Record that `owner` may still add or rewrite any of `paths`, or
+        anything below them, so that they are not streamed before `owner`
+        releases them.
+
+        :param owner: Name of the client claiming the paths
+        :type owner: ``str``
+
+        :param paths: Paths in the archive
+        :type paths: ``list``
+        """
+        with self._stream_lock:
+            owned = self._owned.setdefault(owner, set())
+            for path in paths:
+                # files are streamed under their resolved path, which the
+                # archive mirrors from the host
+                real = os.path.relpath(
+                    os.path.realpath(self.join_sysroot(path)), self.sysroot
+                )
+                for _path in {self.dest_path(path), self.dest_path(real)}:
+                    self._claims.setdefault(_path, set()).add(owner)
+                    owned.add(_path)
+
+    def release(self, owner, paths):
+        """Drop the claims of `owner` and hand over the files it added, then
+        stream every released file that is no longer claimed.
+
+        :param owner: Name of the client releasing the paths
+        :type owner: ``str``
+
+        :param paths: Paths in the archive of the files added by `owner`
+        :type paths: ``list``
+
+        :returns: Number of files streamed to the tarball
+        :rtype: ``int``
+        """
+        with self._stream_lock:
+            for path in self._owned.pop(owner, ()):
+                owners = self._claims[path]
+                owners.discard(owner)
+                if not owners:
+                    del self._claims[path]
+            self._released.update(self._resolve(self.dest_path(path))
+                                  for path in paths)
+            ready = sorted(path for path in self._released
+                           if not self._is_claimed(path))
+            self._released.difference_update(ready)
+            return sum(self._stream_file(path) for path in ready)
+
+    def _is_claimed(self, path):
+        while path.startswith(self._archive_root + os.sep):
+            if path in self._claims:
+                return True
+            path = os.path.dirname(path)
+        return False
+
+    def _start_stream(self):
+        self._stack = ExitStack()
+        self._tar = self._stack.enter_context(self._open_tar(self.method))
+        os.chmod(self._archive_name, 0o600)
+        self.log_info(f"streaming archive to '{self._archive_name}'")
+
+    def _stream_file(self, path):
+        rel_path = os.path.relpath(path, self._archive_root)
+        if any(fnmatch(rel_path, hold) for hold in self.hold_paths):
+            return False
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return False
+        if path in self._streamed or not stat.S_ISREG(st.st_mode):
+            return False
+        if self._tar is None:
+            self._start_stream()
+        inode = (st.st_ino, st.st_dev)
+        linkname = self._tar.inodes.get(inode)
+        tarinfo = self._tar.gettarinfo(
+            path, arcname=os.path.join(self._name, rel_path)
+        )
+        # a file hardlinked to files that were already streamed, and removed,
+        # is still stored as a link to the first of them
+        if tarinfo.isreg() and linkname:
+            tarinfo.type = tarfile.LNKTYPE
+            tarinfo.linkname = linkname
+            tarinfo.size = 0
+            self._tar.inodes[inode] = linkname
+        tarinfo = self.copy_permissions_filter(tarinfo)
+        if tarinfo is None:
+            return False
+        if tarinfo.isreg():
+            with open(path, 'rb') as f:
+                self._tar.addfile(tarinfo, f)
+        else:
+            self._tar.addfile(tarinfo)
+        with self._path_lock:
+            os.unlink(path)
+            self._streamed.add(path)
+        if st.st_nlink == 1:
+            # the inode may now be reused by an unrelated file
+            self._tar.inodes.pop(inode, None)
+        return True
+
+    def _build_archive(self, method):
+        with self._stream_lock:
+            if self._tar is None:
+                self.method = method
+                self._start_stream()
+            try:
+                self._add_archive_content(self._tar)
+            finally:
+                self._stack.close()
+        self.log_info(f"streamed {len(self._streamed)} files to the archive "
+                      "during collection")
         return self.name()
 
 
@@ -24,6 +24,7 @@ from pwd import getpwuid
 import sos.cleaner.preppers
 
 from sos import __version__
+from sos.archive import ARCHIVE_INDEX_SUFFIX
 from sos.component import SoSComponent
 from sos.cleaner.parsers.ip_parser import SoSIPParser
 from sos.cleaner.parsers.mac_parser import SoSMacParser
@@ -506,6 +507,10 @@ third party.
         )
         shutil.move(arc_path, final_path)
         arcstat = os.stat(final_path)
+        index_path = None
+        if os.path.exists(arc_path + ARCHIVE_INDEX_SUFFIX):
+            index_path = final_path + ARCHIVE_INDEX_SUFFIX
+            shutil.move(arc_path + ARCHIVE_INDEX_SUFFIX, index_path)
 
         # while these messages won't be included in the log file in the archive
         # some facilities, such as our avocado test suite, will sometimes not
@@ -519,6 +524,11 @@ third party.
 
         self.ui_log.info(f"\tSize\t{get_human_readable(arcstat.st_size)}")
         self.ui_log.info(f"\tOwner\t{getpwuid(arcstat.st_uid).pw_name}\n")
+        if index_path:
+            self.ui_log.info(
+                f"The index of the archive members is available at\n\t"
+                f"{index_path}\n"
+            )
         self.ui_log.info(
             "Please send the obfuscated archive to your support\n"
             "representative and keep the mapping file private."
@@ -617,8 +627,13 @@ third party.
 
     def get_new_checksum(self, archive_path):
         """Calculate a new checksum for the obfuscated archive, as the previous
-        checksum will no longer be valid
+        checksum will no longer be valid. The checksum computed while the
+        archive was re-compressed is used when there is one.
         """
+        for arc in self.completed_reports:
+            if (arc.final_archive_path == archive_path and arc.checksum and
+                    arc.checksum[0] == self.hash_name):
+                return arc.checksum[1] + '\n'
         try:
             hash_size = 1024**2  # Hash 1MiB of content at a time.
             with open(archive_path, 'rb') as archive_fp:
@@ -697,10 +712,17 @@ third party.
         """
         for archive in self.completed_reports:
             os.remove(archive.archive_path)
+            # the index of the original archive would reveal its file names
+            if os.path.exists(archive.archive_path + ARCHIVE_INDEX_SUFFIX):
+                os.remove(archive.archive_path + ARCHIVE_INDEX_SUFFIX)
             dest = self.nested_archive.extracted_path
             tarball = archive.final_archive_path.split('/')[-1]
             dest_name = os.path.join(dest, tarball)
             shutil.move(archive.final_archive_path, dest)
+            if os.path.exists(archive.final_archive_path +
+                              ARCHIVE_INDEX_SUFFIX):
+                shutil.move(archive.final_archive_path + ARCHIVE_INDEX_SUFFIX,
+                            dest)
             archive.final_archive_path = dest_name
 
     def generate_parser_item_regexes(self):
@@ -943,7 +965,9 @@ third party.
                         archive.rename_top_dir(
                             self.obfuscate_string(archive.archive_name)
                         )
-                        archive.compress(method)
+                        archive.compress(method, self.opts.zstd_level,
+                                         self.hash_name,
+                                         index=self.opts.archive_index)
                     except Exception as err:
                         self.log_debug(f"Archive {archive.archive_name} failed"
                                        f" to compress: {err}")
@@ -18,6 +18,9 @@ import tempfile
 import re
 
 from concurrent.futures import ProcessPoolExecutor
+from sos.archive import (ZSTD_DEFAULT_LEVEL, ArchiveIndex, DigestWriter,
+                         IndexingTarFile, ParallelCompressor, break_hardlink,
+                         extract_tarfile, is_tarfile, open_tarfile, zstd_open)
 from sos.utilities import (file_is_binary, sos_get_command_output,
                            file_is_certificate)
 
@@ -26,34 +29,7 @@ from sos.utilities import (file_is_binary, sos_get_command_output,
 # process for extraction if this method is a part of the SoSObfuscationArchive
 # class. So, the simplest solution is to remove it from the class.
 def extract_archive(archive_path, tmpdir):
-    with tarfile.open(archive_path) as archive:
-        path = os.path.join(tmpdir, 'cleaner')
-        # set extract filter since python 3.12 (see PEP-706 for more)
-        # Because python 3.10 and 3.11 raises false alarms as exceptions
-        # (see #3330 for examples), we can't use data filter but must
-        # fully trust the archive (legacy behaviour)
-        archive.extraction_filter = getattr(tarfile, 'fully_trusted_filter',
-                                            (lambda member, path: member))
-
-        # Guard against "Arbitrary file write during tarfile extraction"
-        # Checks the extracted files don't stray out of the target directory.
-        not_root = os.getuid() != 0
-        members = archive.getmembers()
-        for member in members:
-            member_path = os.path.join(path, member.name)
-            abs_directory = os.path.abspath(path)
-            abs_target = os.path.abspath(member_path)
-            prefix = os.path.commonprefix([abs_directory, abs_target])
-            if prefix != abs_directory:
-                raise Exception(f"Attempted path traversal in tarfle"
-                                f"{prefix} != {abs_directory}")
-            # Directories collected from the host may lack u+w or u+x
-            # permissions, preventing child members from being created during
-            # extract
-            if not_root and member.isdir():
-                member.mode |= stat.S_IWUSR | stat.S_IXUSR
-        archive.extractall(path, members=members)
-        return os.path.join(path, archive.name.split('/')[-1].split('.tar')[0])
+    return extract_tarfile(archive_path, os.path.join(tmpdir, 'cleaner'))
 
 
 class SoSObfuscationArchive():
@@ -67,6 +43,11 @@ class SoSObfuscationArchive():
     files_obfuscated_count = 0
     total_sub_count = 0
     removed_file_count = 0
+    index = None
+    # whether the archive had a member index, kept once it is extracted
+    indexed = False
+    # (hash name, hex digest) of the re-compressed archive
+    checksum = None
     type_name = 'undetermined'
     description = 'undetermined'
     is_nested = False
@@ -240,6 +221,9 @@ class SoSObfuscationArchive():
                                            f"{rel_name}: {err}")
                 tfile.seek(0)
                 if subs:
+                    # the file may be deduplicated with other files that
+                    # still need to be obfuscated on their own
+                    break_hardlink(filename)
                     shutil.copyfile(tfile.name, filename)
                     self.update_sub_count(subs)
 
@@ -265,7 +249,13 @@ class SoSObfuscationArchive():
     def _load_self(self):
         if self.is_tarfile:
             # pylint: disable=consider-using-with
-            self.tarobj = tarfile.open(self.archive_path)
+            self.tarobj = open_tarfile(self.archive_path)
+            # an index written alongside the archive allows reading single
+            # files without decompressing the archive from its start
+            self.index = ArchiveIndex.load(self.archive_path)
+            if self.index:
+                self.indexed = True
+                self.log_debug("Using the member index of the archive")
 
     def get_nested_archives(self):
         """Return a list of ObfuscationArchives that represent additional
@@ -324,7 +314,7 @@ class SoSObfuscationArchive():
     @property
     def is_tarfile(self):
         try:
-            return tarfile.is_tarfile(self.archive_path)
+            return is_tarfile(self.archive_path)
         except Exception:
             return False
 
@@ -370,6 +360,17 @@ class SoSObfuscationArchive():
         """
         if self.is_extracted is False and self.is_tarfile:
             filename = self.format_file_name(fname)
+            if self.index:
+                try:
+                    return self.index.read(filename).decode('utf-8')
+                except KeyError:
+                    self.log_debug(
+                        f"Unable to retrieve {fname}: no such file in archive"
+                    )
+                    return ''
+                except Exception as err:
+                    self.log_debug(f"Unable to read {fname} using the archive"
+                                   f" index, falling back: {err}")
             try:
                 return self.tarobj.extractfile(filename).read().decode('utf-8')
             except KeyError:
@@ -393,6 +394,7 @@ class SoSObfuscationArchive():
             self.extracted_path = self.extract_self()
             self.is_extracted = True
             self.tarobj = None    # we can't pickle this & not further needed
+            self.index = None
         else:
             self.extracted_path = self.archive_path
         # if we're running as non-root (e.g. collector), then we can have a
@@ -443,11 +445,17 @@ class SoSObfuscationArchive():
         if self.is_tarfile:
             if self.archive_path.endswith('xz'):
                 return 'xz'
+            if self.archive_path.endswith('zst'):
+                return 'zst'
             return 'gz'
         return None
 
-    def build_tar_file(self, method):
-        """Pack the extracted archive as a tarfile to then be re-compressed
+    def build_tar_file(self, method, zstd_level=ZSTD_DEFAULT_LEVEL,
+                       hash_name='sha256', index=False):
+        """Pack the extracted archive as a tarfile to then be re-compressed,
+        computing its checksum as it is written. If `index` is set, gzip and
+        xz archives are compressed in blocks and the index of their members
+        is written alongside them.
         """
         mode = 'w'
         tarpath = self.extracted_path + '-obfuscated.tar'
@@ -460,17 +468,49 @@ class SoSObfuscationArchive():
             else:
                 compr_args = {'compresslevel': 6}
         self.log_debug(f"Building tar file {tarpath}")
-        with tarfile.open(tarpath, mode=mode, **compr_args) as tar:
-            tar.add(self.extracted_path,
-                    arcname=os.path.split(self.archive_name)[1])
+        arc_index = None
+        with open(tarpath, 'wb') as raw:
+            fileobj = DigestWriter(raw, hash_name)
+            if method == 'zst':
+                with zstd_open(fileobj, 'wb', level=zstd_level) as zfileobj, \
+                        tarfile.open(fileobj=zfileobj, mode='w') as tar:
+                    tar.add(self.extracted_path,
+                            arcname=os.path.split(self.archive_name)[1])
+            elif method and index:
+                compression = 'gzip' if method == 'gz' else method
+                with ParallelCompressor(fileobj, compression, 1,
+                                        **compr_args) as compressor, \
+                        IndexingTarFile.open(fileobj=compressor,
+                                             mode='w') as tar:
+                    tar.add(self.extracted_path,
+                            arcname=os.path.split(self.archive_name)[1])
+                arc_index = ArchiveIndex.build(tarpath, compression,
+                                               compressor.block_offsets,
+                                               tar.members)
+            else:
+                with tarfile.open(fileobj=fileobj, mode=mode,
+                                  **compr_args) as tar:
+                    tar.add(self.extracted_path,
+                            arcname=os.path.split(self.archive_name)[1])
+            self.checksum = (hash_name, fileobj.hexdigest())
+        if arc_index is not None:
+            try:
+                arc_index.write()
+            except OSError as err:
+                self.log_debug(f"Could not write archive index: {err}")
         return tarpath
 
-    def compress(self, method):
+    def compress(self, method, zstd_level=ZSTD_DEFAULT_LEVEL,
+                 hash_name='sha256', index=False):
         """Execute the compression command, and set the appropriate final
-        archive path for later reference by SoSCleaner on a per-archive basis
+        archive path for later reference by SoSCleaner on a per-archive basis.
+        The obfuscated archive is indexed if `index` is set or if the original
+        archive was.
         """
         try:
-            self.final_archive_path = self.build_tar_file(method)
+            self.final_archive_path = self.build_tar_file(
+                method, zstd_level, hash_name, index=index or self.indexed
+            )
         except Exception as err:
             self.log_debug(f"Exception while re-compressing archive: {err}")
             raise
@@ -590,6 +630,7 @@ class SoSObfuscationArchive():
         obvious_removes = [
             r'.*\.gz$',  # TODO: support flat gz/xz extraction
             r'.*\.xz$',
+            r'.*\.zst$',
             r'.*\.bzip2$',
             r'.*\.tar\..*',  # TODO: support archive unpacking
             r'.*\.txz$',
@@ -9,8 +9,8 @@
 # See the LICENSE file in the source distribution for further information.
 
 import os
-import tarfile
 
+from sos.archive import is_tarfile
 from sos.cleaner.archives import SoSObfuscationArchive
 
 
@@ -41,7 +41,7 @@ class TarballArchive(SoSObfuscationArchive):
     @classmethod
     def check_is_type(cls, arc_path):
         try:
-            return tarfile.is_tarfile(arc_path)
+            return is_tarfile(arc_path)
         except Exception:
             return False
 
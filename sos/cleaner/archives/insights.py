@@ -8,8 +8,7 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
-import tarfile
-
+from sos.archive import is_tarfile
 from sos.cleaner.archives import SoSObfuscationArchive
 
 
@@ -24,7 +23,7 @@ class InsightsArchive(SoSObfuscationArchive):
     @classmethod
     def check_is_type(cls, arc_path):
         try:
-            return tarfile.is_tarfile(arc_path) and 'insights-' in arc_path
+            return is_tarfile(arc_path) and 'insights-' in arc_path
         except Exception:
             return False
 
@@ -9,8 +9,8 @@
 # See the LICENSE file in the source distribution for further information.
 
 import os
-import tarfile
 
+from sos.archive import is_tarfile
 from sos.cleaner.archives import SoSObfuscationArchive
 
 
@@ -25,7 +25,7 @@ class SoSReportArchive(SoSObfuscationArchive):
     @classmethod
     def check_is_type(cls, arc_path):
         try:
-            return tarfile.is_tarfile(arc_path) and 'sosreport-' in arc_path
+            return is_tarfile(arc_path) and 'sosreport-' in arc_path
         except Exception:
             return False
 
@@ -58,7 +58,7 @@ class SoSCollectorArchive(SoSObfuscationArchive):
     @classmethod
     def check_is_type(cls, arc_path):
         try:
-            return (tarfile.is_tarfile(arc_path) and 'sos-collect' in arc_path)
+            return (is_tarfile(arc_path) and 'sos-collect' in arc_path)
         except Exception:
             return False
 
@@ -68,7 +68,7 @@ class SoSCollectorArchive(SoSObfuscationArchive):
         archives = []
         for fname in os.listdir(_path):
             arc_name = os.path.join(_path, fname)
-            if 'sosreport-' in fname and tarfile.is_tarfile(arc_name):
+            if 'sosreport-' in fname and is_tarfile(arc_name):
                 archives.append(SoSReportArchive(arc_name, self.tmpdir,
                                                  self.keep_binary_files,
                                                  self.treat_certificates))
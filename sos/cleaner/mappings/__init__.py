@@ -8,12 +8,150 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
+import fcntl
+import json
 import re
 import os
-import tempfile
+import string
+from collections import deque
 from pathlib import Path
 
 
+class ItemMatcher():
+    """An Aho-Corasick automaton of the known items of a map, which finds
+    every occurrence of every item in a string in a single pass over it,
+    however many items there are.
+
+    Items added once the automaton is built are kept in a trie of pending
+    items, which is only walked from the offsets of a string that one of
+    them starts with. The automaton is rebuilt with the pending items at the
+    next search once they amount to a fraction of its items. Adding an item
+    thus costs amortized time proportional to its length, rather than a
+    rebuild of the automaton each time.
+
+    Items are added as keys, normalised by ``SoSMap.get_match_key()``, and
+    each key is reported along with the item it was added for.
+    """
+
+    # rebuild the automaton once there are more pending keys than this
+    # fraction of its keys, and than min_pending
+    rebuild_ratio = 8
+    min_pending = 32
+
+    def __init__(self):
+        # the transitions, failure link, and (length, item) pairs of the keys
+        # ending at each state, including through its failure links
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._keys = {}
+        self._built_keys = 0
+        # each node of the pending trie maps the next characters to their
+        # nodes, and None to the item of the key ending at the node
+        self._pending = {}
+        self._pending_keys = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, item):
+        """Add ``key`` to the matcher, to be reported as ``item``
+
+        :param key:     The normalised form of the item
+        :type key:      ``str``
+
+        :param item:    The item to report for the key
+        :type item:     ``str``
+        """
+        if not key or key in self._keys:
+            return
+        self._keys[key] = item
+        node = self._pending
+        for char in key:
+            node = node.setdefault(char, {})
+        node[None] = item
+        self._pending_keys += 1
+
+    def _build(self):
+        """Build the automaton of every key, computing the failure links and
+        outputs of every state breadth first from the root"""
+        goto = [{}]
+        own = {}
+        for key, item in self._keys.items():
+            state = 0
+            for char in key:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    goto[state][char] = nxt
+                state = nxt
+            own[state] = ((len(key), item),)
+        fail = [0] * len(goto)
+        out = [()] * len(goto)
+        queue = deque()
+        for nxt in goto[0].values():
+            out[nxt] = own.get(nxt, ())
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                link = goto[link].get(char, 0)
+                fail[nxt] = link
+                out[nxt] = own.get(nxt, ()) + out[link]
+                queue.append(nxt)
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self._built_keys = len(self._keys)
+        self._pending = {}
+        self._pending_keys = 0
+
+    def finditer(self, text):
+        """Find every occurrence of every key in ``text``, overlapping ones
+        included
+
+        :param text:    The normalised string to search
+        :type text:     ``str``
+
+        :returns:   The start and end offsets of each occurrence, and the
+                    item of its key
+        :rtype:     ``generator`` of ``tuple``
+        """
+        if self._pending_keys > max(self.min_pending,
+                                    self._built_keys // self.rebuild_ratio):
+            self._build()
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        state = 0
+        for end, char in enumerate(text, 1):
+            nxt = goto[state].get(char)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(char)
+            state = nxt or 0
+            if out[state]:
+                for length, item in out[state]:
+                    yield end - length, end, item
+        if not self._pending_keys:
+            return
+        pending = self._pending
+        for start, char in enumerate(text):
+            node = pending.get(char)
+            end = start + 1
+            while node is not None:
+                if None in node:
+                    yield start, end, node[None]
+                if end == len(text):
+                    break
+                node = node.get(text[end])
+                end += 1
+
+
 class SoSMap():
     """Standardized way to store items with their obfuscated counterparts.
 
@@ -34,13 +172,25 @@ class SoSMap():
     use_token_lookup = False
 
     _token_split_re = re.compile(r'[^a-z0-9]+')
+    _word_chars = frozenset(string.ascii_lowercase + string.digits)
+    # translates the bytes that _token_split_re splits on to spaces
+    _word_bytes = bytes(
+        byte if chr(byte) in string.ascii_lowercase + string.digits else 32
+        for byte in range(256)
+    )
 
     def __init__(self, workdir, _static_regex=re.compile(r'(?!)')):
         self.initializing = True
         self.dataset = {}
+        # the number of items of dataset obfuscated to each value, to tell
+        # whether a string is already an obfuscated value without a scan of
+        # every value of dataset
+        self._values = {}
         self._regexes_made = set()
-        self.compiled_regexes = []
-        self.compiled_search = re.compile('(?!)')  # no match
+        self._matcher = ItemMatcher()
+        # the first word of each item of the matcher, for lines without any
+        # of them to be skipped without walking the matcher over them
+        self._first_words = set()
         self._simple_tokens = set()
         self._complex_items = []
         self._regex_dict = {}
@@ -49,9 +199,10 @@ class SoSMap():
         # workdir's default value '/tmp' is used just by avocado tests,
         # otherwise we override it to /etc/sos/cleaner (or map_file dir)
         self.workdir = workdir
-        self.cache_dir = os.path.join(self.workdir, 'cleaner_cache',
-                                      self.cname)
-        self.cache_counter = 0  # number of expected items in cache_dir
+        # the log of the items added to this map by every process, in order
+        self.cache_file = os.path.join(self.workdir, 'cleaner_cache',
+                                       f"{self.cname}.log")
+        self.cache_offset = 0  # how far cache_file has been replayed
         self.load_entries()
         self.initializing = False
         self.generate_compiled_regexes()
@@ -64,19 +215,22 @@ class SoSMap():
         so we need to update self.dataset up to date.
 
         Keep in mind that size of self.dataset is usually bigger than number
-        of files in the corresponding cleaner's directory: directory contains
+        of records in the corresponding cleaner's cache file: it contains
         just whole items (e.g. IP addresses) while dataset contains more
         derived objects (e.g. subnets).
         """
 
-        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
-        self.load_new_entries_from_dir()
+        Path(os.path.dirname(self.cache_file)).mkdir(parents=True,
+                                                     exist_ok=True)
+        with open(self.cache_file, 'ab+') as cache:
+            fcntl.flock(cache, fcntl.LOCK_SH)
+            self.load_new_entries_from_cache(cache)
 
     def ignore_item(self, item):
         """Some items need to be completely ignored, for example link-local or
         loopback addresses should not be obfuscated
         """
-        if not item or item in self.skip_keys or item in self.dataset.values()\
+        if not item or item in self.skip_keys or self.value_in_dataset(item)\
                 or (self.ignore_short_items and len(item) <= 3):
             return True
         for skip in self.ignore_matches:
@@ -84,8 +238,26 @@ class SoSMap():
                 return True
         return False
 
+    def value_in_dataset(self, value):
+        """Check if a string is the obfuscated value of any item of the map
+
+        :param value: The string to look for among the obfuscated values
+        :type value: ``str``
+
+        :returns: True if an item of the map is obfuscated to `value`
+        :rtype: ``bool``
+        """
+        return value in self._values
+
     def insert_to_dataset(self, item, value):
+        old = self.dataset.get(item)
+        if old is not None:
+            if self._values[old] == 1:
+                del self._values[old]
+            else:
+                self._values[old] -= 1
         self.dataset[item] = value
+        self._values[value] = self._values.get(value, 0) + 1
 
     def add_sanitised_item_to_dataset(self, item):
         try:
@@ -98,26 +270,25 @@ class SoSMap():
         if self.compile_regexes:
             self.add_regex_item(item)
 
-    def load_new_entries_from_dir(self):
-        # Load all new items from the cache_dir. "New" = any numbered file not
-        # lower than self.cache_counter.
-        # The ">=" is essential for calls from self.add(item) / FileExistsError
-        # Update self.cache_counter at the end.
-        with os.scandir(self.cache_dir) as it:
-            num_files = [
-                f.name
-                for f in it
-                if f.name.isdigit() and int(f.name) >= self.cache_counter
-            ]
-        num_files.sort(key=int)
-        for file_name in num_files:
-            fname = os.path.join(self.cache_dir, file_name)
-            with open(fname, 'r', encoding='utf-8') as f:
-                item = f.read()
+    def load_new_entries_from_cache(self, cache):
+        """Replay the items appended to the cache file since we last read it,
+        in the order they were appended. That order is the order in which
+        every process of this map called add(), so replaying it gives the
+        same dataset as theirs.
+
+        The caller must hold a lock on the cache file, so that no record is
+        half written.
+
+        :param cache: The cache file, opened for reading in binary mode
+        :type cache: ``file``
+        """
+        cache.seek(self.cache_offset)
+        data = cache.read()
+        self.cache_offset += len(data)
+        for record in data.splitlines():
+            item = json.loads(record)
             if not self.dataset.get(item, False):
                 self.add_sanitised_item_to_dataset(item)
-        if num_files:
-            self.cache_counter = int(num_files[-1])  # last/biggest number
 
     def add(self, item):
         """Add a particular item to the map, generating an obfuscated pair
@@ -130,27 +301,25 @@ class SoSMap():
         if self.ignore_item(item):
             return item
 
-        tmpfile = None
-        while not self.dataset.get(item, False):
-            if not tmpfile:
-                # pylint: disable=consider-using-with
-                tmpfile = tempfile.NamedTemporaryFile(dir=self.cache_dir)
-                with open(tmpfile.name, 'w', encoding='utf-8') as f:
-                    f.write(item)
-            try:
-                self.cache_counter += 1
-                os.link(tmpfile.name,
-                        os.path.join(self.cache_dir,
-                                     f"{self.cache_counter}"))
-                self.add_sanitised_item_to_dataset(item)
-            except FileExistsError:
-                self.load_new_entries_from_dir()
+        if not self.dataset.get(item, False):
+            # other processes may have added items since we last read the
+            # cache, which must be replayed first for us to obfuscate this
+            # one as they would have. The lock is released on close.
+            with open(self.cache_file, 'ab+') as cache:
+                fcntl.flock(cache, fcntl.LOCK_EX)
+                self.load_new_entries_from_cache(cache)
+                if not self.dataset.get(item, False):
+                    record = json.dumps(item).encode('utf-8') + b'\n'
+                    cache.write(record)
+                    self.cache_offset += len(record)
+                    self.add_sanitised_item_to_dataset(item)
 
         return self.dataset[item]
 
     def add_regex_item(self, item):
-        """Add an item to the regexes dict and then re-sort the list that the
-        parsers will use during parse_line()
+        """Add an item to the regexes dict, or to the matcher, that the
+        parsers will use during parse_line(). This only costs a walk along
+        the item, however many items are known.
 
         :param item:    The unobfuscated item to generate a regex for
         :type item:     ``str``
@@ -163,33 +332,21 @@ class SoSMap():
                 not self._static_regex.fullmatch(item)):
             # we do re.I everywhere, so unify the item
             item = item.lower()
-            # save the item in a set to avoid clobbering existing regexes,
-            # as searching this set is significantly faster than searching
-            # through the actual compiled_regexes list, especially for very
-            # large collections of entries
+            # save the item in a set to avoid clobbering existing regexes
             self._regexes_made.add(item)
-            # don't iteratively build compiled_regexes and compiled_search
-            # during initialisation, that is redundant;
-            # generate_compiled_regexes is called at the end of init
+            # don't iteratively build the regexes or the matcher during
+            # initialisation, that is redundant; generate_compiled_regexes
+            # is called at the end of init
             if self.initializing:
                 return
-            # add the item, Pattern tuple directly to the compiled_regexes list
-            # and then sort the existing list, rather than rebuild the list
-            # from scratch every time we add something like we would do if we
-            # tracked/saved the item and the Pattern() object in a dict or in
-            # the set above
-            _reg = self.get_regex_result(item)
             if self.use_token_lookup:
-                self._regex_dict[item] = _reg
+                self._regex_dict[item] = self.get_regex_result(item)
                 if item.isalnum():
                     self._simple_tokens.add(item)
                 else:
                     self._complex_items.append(item)
             else:
-                self.compiled_regexes.append((item, _reg))
-                self.compiled_regexes.sort(
-                    key=lambda x: len(x[0]), reverse=True)
-                self.generate_compiled_regexes(only_search=True)
+                self._add_to_matcher(item)
 
     def generate_compiled_regexes(self, only_search=False):
         keys = sorted(self._regexes_made, key=len, reverse=True)
@@ -205,15 +362,10 @@ class SoSMap():
                 item for item in self._regexes_made if not item.isalnum()
             ]
         else:
-            if not only_search:
-                self.compiled_regexes = [
-                    (item, self.get_regex_result(item)) for item in keys
-                ]
-            pattern = "|".join([f'{self.get_regex_escape(k)}' for k in keys])
-            self.compiled_search = re.compile(
-                self.get_regex_fullword(pattern),
-                flags=re.I
-            )
+            self._matcher = ItemMatcher()
+            self._first_words = set()
+            for item in keys:
+                self._add_to_matcher(item)
 
     def get_matched_items(self, line):
         """Return (item, regex) pairs for items that match in the line.
@@ -222,8 +374,8 @@ class SoSMap():
         set intersection / substring matching, rather than the full
         compiled_regexes list.
 
-        For regex-based maps, falls back to returning all compiled_regexes
-        when compiled_search matches (original behavior).
+        For other maps, returns the items found in the line by the
+        matcher of the map, longest first.
         """
         if self.use_token_lookup:
             line_lower = line.lower()
@@ -240,9 +392,152 @@ class SoSMap():
             if len(result) > 1:
                 result.sort(key=lambda x: len(x[0]), reverse=True)
             return result
-        if self.compiled_search.search(line):
-            return self.compiled_regexes
-        return []
+        items = {item for start, end, item in self._find_items(line)}
+        result = []
+        for item in sorted(items, key=len, reverse=True):
+            if item not in self._regex_dict:
+                self._regex_dict[item] = self.get_regex_result(item)
+            result.append((item, self._regex_dict[item]))
+        return result
+
+    def _add_to_matcher(self, item):
+        key = self.get_match_key(item)
+        self._matcher.add(key, item)
+        words = self._split_words(key)
+        if words and key[0] in self._word_chars:
+            self._first_words.add(words[0])
+        else:
+            # an item that does not start with a word could be found at any
+            # offset of any line
+            self._first_words.add(b'')
+
+    @classmethod
+    def _split_words(cls, key):
+        """Split a key into its words of lowercase ASCII letters and digits,
+        as bytes, which is a lot faster than _token_split_re.split()
+        """
+        return key.encode('utf-8', 'replace').translate(
+            cls._word_bytes).split()
+
+    def _find_items(self, line):
+        """Find the occurrences of known items in the line, with the matcher
+
+        :returns:   The start and end offsets, and the item, of each one
+        :rtype:     ``list`` of ``tuple``
+        """
+        key = self.get_match_key(line)
+        if self.match_full_words_only and b'' not in self._first_words:
+            # an item matching as a full word starts at the start of a word
+            # of the line, which is the first word of the item
+            if self._first_words.isdisjoint(self._split_words(key)):
+                return []
+        return [match for match in self._matcher.finditer(key)
+                if self.is_full_word(line, match[0], match[1])]
+
+    @property
+    def single_pass_replace(self):
+        """Whether the parsers replace the known items of a line with
+        ``replace_items()``, rather than with the regex of each item found
+        """
+        return self.match_full_words_only and not self.use_token_lookup
+
+    def replace_items(self, line):
+        """Replace the known items found in the line with their obfuscated
+        counterparts, in a single pass over the line whatever the number of
+        known items.
+
+        Occurrences are matched case insensitively and as full words, the
+        way the regex made of ``get_regex_escape()`` and
+        ``get_regex_fullword()`` would match them. Where occurrences overlap
+        the longest one is replaced, as items are replaced longest first by
+        their regexes.
+
+        This is only for maps that match full words only and do not use the
+        token lookup, see ``single_pass_replace``. Elsewhere an item may be
+        found within another item, or within the obfuscated value of another
+        item, so items must be replaced one after another by their regexes,
+        as listed by ``get_matched_items()``.
+
+        :param line:    The line to obfuscate the known items of
+        :type line:     ``str``
+
+        :returns:   The obfuscated line and the number of changes made
+        :rtype:     ``str``, ``int``
+
+        :raises:    ``ValueError`` if the map does not replace items in a
+                    single pass
+        """
+        if not self.single_pass_replace:
+            raise ValueError(f"{self.cname} does not replace items in a "
+                             "single pass")
+        found = self._find_items(line)
+        if not found:
+            return line, 0
+        found.sort(key=lambda match: (match[0] - match[1], match[0]))
+        replaced = []
+        for start, end, item in found:
+            if all(end <= _start or start >= _end
+                   for _start, _end, _item in replaced):
+                replaced.append((start, end, item))
+        replaced.sort()
+        parts = []
+        pos = 0
+        for start, end, item in replaced:
+            parts.append(line[pos:start])
+            parts.append(self.get(item))
+            pos = end
+        parts.append(line[pos:])
+        return ''.join(parts), len(replaced)
+
+    def get_match_key(self, text):
+        """Normalise a string for the matcher of the map, so that it matches
+        items the way ``get_regex_escape()`` would. The key must be as long
+        as the string, for the offsets of matches to apply to both.
+
+        :param text:    The item or line to normalise
+        :type text:     ``str``
+
+        :returns:       The lowercase string
+        :rtype:         ``str``
+        """
+        key = text.lower()
+        if len(key) != len(text):
+            # a few characters, such as 'İ', lowercase to more than one
+            key = ''.join(c.lower() if len(c.lower()) == 1 else c
+                          for c in text)
+        return key
+
+    def is_full_word(self, text, start, end):
+        """Check the boundaries of an occurrence of an item in a string the
+        way ``get_regex_fullword()`` does, if ``match_full_words_only`` is
+        set.
+
+        :param text:    The string the item was found in
+        :type text:     ``str``
+
+        :param start:   The offset of the occurrence
+        :type start:    ``int``
+
+        :param end:     The offset of the end of the occurrence
+        :type end:      ``int``
+
+        :returns:   ``True`` if the occurrence should be obfuscated
+        :rtype:     ``bool``
+        """
+        if not self.match_full_words_only:
+            return True
+        # (?<![a-z0-9])
+        if start and text[start - 1].isascii() and text[start - 1].isalnum():
+            return False
+        # (?=\b|_|-)
+        if end == len(text) or text[end] in '_-':
+            return True
+        return self._is_word_char(text[end - 1]) != \
+            self._is_word_char(text[end])
+
+    @staticmethod
+    def _is_word_char(char):
+        return char.isalnum() or char == '_'
 
     def get_regex_escape(self, item):
         return rf'{re.escape(item)}'
@@ -302,4 +597,5 @@ class SoSMap():
             :param config:    A dict of mappings with the form of
                               {clean_entry: 'obfuscated_entry'}
         """
-        self.dataset.update(config)
+        for item, value in config.items():
+            self.insert_to_dataset(item, value)
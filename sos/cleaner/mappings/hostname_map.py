@@ -63,6 +63,19 @@ class SoSHostnameMap(SoSMap):
         # we do match_full_words_only, so always wrap
         return rf'(?<![a-z0-9])(?:{item})(?![a-z0-9])'
 
+    def get_match_key(self, text):
+        """Override the base get_match_key() so that, like the regex from
+        get_regex_escape(), dots in items also match underscores.
+        """
+        return super().get_match_key(text).replace('_', '.')
+
+    def is_full_word(self, text, start, end):
+        # (?<![a-z0-9]) and (?![a-z0-9]), as in get_regex_fullword()
+        return not any(
+            0 <= pos < len(text) and text[pos].isascii() and
+            text[pos].isalnum() for pos in (start - 1, end)
+        )
+
     def get_regex_escape(self, item):
         """Override the base get_regex_escape() to provide a regex that, if
         this is an FQDN or a straight domain, will include an underscore
@@ -198,7 +211,7 @@ class SoSHostnameMap(SoSMap):
                 # unrelated bits and paths
                 ob_hostname = 'unknown'
             ob_domain = self.sanitize_domain(domain)
-            self.dataset[item] = ob_domain
+            self.insert_to_dataset(item, ob_domain)
             _fqdn = '.'.join([ob_hostname, ob_domain])
             if all(h.isupper() for h in host):
                 _fqdn = _fqdn.upper()
@@ -215,7 +228,7 @@ class SoSHostnameMap(SoSMap):
             ob_host = f"host{self.host_count}"
             self.hosts[hostname] = ob_host
             self.host_count += 1
-            self.dataset[hostname] = ob_host
+            self.insert_to_dataset(hostname, ob_host)
             self.add_regex_item(hostname)
         return self.dataset[hostname]
 
@@ -231,7 +244,7 @@ class SoSHostnameMap(SoSMap):
         dname = '.'.join(domain[0:-1]).lower()
         ob_domain = self._new_obfuscated_domain(dname)
         ob_domain = '.'.join([ob_domain, top_domain])
-        self.dataset['.'.join(domain)] = ob_domain
+        self.insert_to_dataset('.'.join(domain), ob_domain)
         return ob_domain
 
     def _new_obfuscated_domain(self, dname):
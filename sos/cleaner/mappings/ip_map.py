@@ -9,6 +9,7 @@
 # See the LICENSE file in the source distribution for further information.
 
 import ipaddress
+import re
 
 from sos.cleaner.mappings import SoSMap
 
@@ -41,6 +42,14 @@ class SoSIPMap(SoSMap):
     ]
 
     _networks = {}
+    # the prefix lengths of the known networks, and the first known network
+    # of each broadcast address, to find the network of an address without
+    # a walk over all of them
+    _network_prefixlens = set()
+    _broadcast_networks = {}
+    # the first host address of each obfuscated network that may still be
+    # free, as host addresses are handed out in order and never released
+    _next_hosts = {}
     obfuscated_ips = set()
     network_first_octet = 100
     skip_network_octets = ['127', '169', '172', '192']
@@ -51,17 +60,18 @@ class SoSIPMap(SoSMap):
     # (an attempt to prevent confusion)
     _saddr_cnt = 2886795264
 
-    def conf_update(self, config):
-        """Override the base conf_update() so that we can add items into
-        obfuscated_ips.
-        """
-        for value in config.values():
-            self.obfuscated_ips.add(value.split('/', maxsplit=1)[0])
-        super().conf_update(config)
+    def __init__(self, workdir, _static_regex=re.compile(r'(?!)')):
+        # the obfuscated address of the first item of dataset with a CIDR
+        # notation, by its address without the notation
+        self._cidr_addresses = {}
+        super().__init__(workdir, _static_regex)
 
     def insert_to_dataset(self, item, value):
         self.obfuscated_ips.add(value.split('/', maxsplit=1)[0])
-        self.dataset[item] = value
+        if '/' in item:
+            self._cidr_addresses.setdefault(item.split('/', maxsplit=1)[0],
+                                            value.split('/')[0])
+        super().insert_to_dataset(item, value)
 
     def ip_in_dataset(self, ipaddr):
         """There are multiple ways in which an ip address could be handed to us
@@ -90,10 +100,8 @@ class SoSIPMap(SoSMap):
         # it's not in there, but let's make sure we haven't previously added
         # an address with a CIDR notation and we're now looking for it without
         # that notation
-        if '/' not in item:
-            for key, value in self.dataset.items():
-                if key.startswith(item):
-                    return value.split('/')[0]
+        if '/' not in item and item in self._cidr_addresses:
+            return self._cidr_addresses[item]
 
         # fallback to the default map behavior of adding it fresh
         return self.add(item)
@@ -104,20 +112,18 @@ class SoSIPMap(SoSMap):
         object we're tracking. This allows us to match ip addresses with or
         without a CIDR notation and maintain proper network relationships.
         """
-        nets = []
-        for net in self._networks:
-            if addr.ip == net.broadcast_address:
-                addr.network = net
-                return
-            if addr.ip in net:
-                nets.append(net)
+        if addr.ip in self._broadcast_networks:
+            addr.network = self._broadcast_networks[addr.ip]
+            return
         # assign the address to the smallest network that was matched. This is
         # necessary due to certain files specifying addresses that cause the
         # ipaddress library to create artificially huge subnets that will
         # include the actual subnets used by the system
-        if nets:
-            nets.sort(key=lambda n: n.prefixlen, reverse=True)
-            addr.network = nets[0]
+        for prefixlen in sorted(self._network_prefixlens, reverse=True):
+            net = ipaddress.ip_network((addr.ip, prefixlen), strict=False)
+            if net in self._networks:
+                addr.network = net
+                return
 
     def sanitize_item(self, item):
         """Given an IP address, sanitize it to an obfuscated network or host
@@ -167,27 +173,52 @@ class SoSIPMap(SoSMap):
 
             # otherwise within that obfuscated network grab the next available
             # address from it
-            for _ip in _obf_network.hosts():
-                if not self.ip_in_dataset(_ip):
-                    # the ipaddress module does not assign the network's
-                    # netmask to hosts in the hosts() generator for some reason
-                    return f"{str(_ip)}/{_obf_network.prefixlen}"
+            _ip = self._next_free_host(_obf_network)
+            if _ip is not None:
+                # the ipaddress module does not assign the network's netmask
+                # to host addresses
+                return f"{str(_ip)}/{_obf_network.prefixlen}"
 
         # ip is a single ip address without the netmask
         return self._new_obfuscated_single_address()
 
+    def _next_free_host(self, network):
+        """Return the first host address of an obfuscated network, as given
+        by its hosts() generator, that is not handed out yet, or None if all
+        of them are. The search starts from the address this returned the
+        last time for the network, as the ones before it are all taken.
+
+            :param network:     An ipaddress.IPv4Network object
+        """
+        last = network.broadcast_address
+        if network.prefixlen < network.max_prefixlen - 1:
+            # neither the network nor the broadcast address are hosts
+            last -= 1
+            first = network.network_address + 1
+        else:
+            first = network.network_address
+        _ip = self._next_hosts.get(network, first)
+        while self.ip_in_dataset(_ip):
+            if _ip == last:
+                return None
+            _ip += 1
+        self._next_hosts[network] = _ip
+        return _ip
+
     def _new_obfuscated_single_address(self):
-        # increment the counter and ignore *.0 and *.255 addresses
-        self._saddr_cnt += 1
-        while self._saddr_cnt % 256 in (0, 255):
+        while True:
+            # increment the counter and ignore *.0 and *.255 addresses
             self._saddr_cnt += 1
-        # split the counter value to four octets (i.e. % 256) to get an
-        # obfuscated IP address
-        _addr = f"{self._saddr_cnt >> 24}.{(self._saddr_cnt >> 16) % 256}." \
-            f"{(self._saddr_cnt >> 8) % 256}.{self._saddr_cnt % 256}"
-        if _addr in self.dataset.values():
-            return self._new_obfuscated_single_address()
-        return _addr
+            while self._saddr_cnt % 256 in (0, 255):
+                self._saddr_cnt += 1
+            # split the counter value to four octets (i.e. % 256) to get an
+            # obfuscated IP address, skipping those already handed out, e.g.
+            # by the mapping of a previous run
+            _addr = f"{self._saddr_cnt >> 24}." \
+                f"{(self._saddr_cnt >> 16) % 256}." \
+                f"{(self._saddr_cnt >> 8) % 256}.{self._saddr_cnt % 256}"
+            if not self.value_in_dataset(_addr):
+                return _addr
 
     def _new_obfuscated_network(self, network):
         """Generate an obfuscated network address for the network address given
@@ -215,5 +246,7 @@ class SoSIPMap(SoSMap):
         if _obf_network:
             _obf_network_s = str(_obf_network)
             self._networks[network] = _obf_network
-            self.dataset[str(network)] = _obf_network_s
-            self.obfuscated_ips.add(_obf_network_s.split('/', maxsplit=1)[0])
+            self._network_prefixlens.add(network.prefixlen)
+            self._broadcast_networks.setdefault(network.broadcast_address,
+                                                network)
+            self.insert_to_dataset(str(network), _obf_network_s)
@@ -112,17 +112,12 @@ class SoSCleanerParser():
         :returns:   The obfuscated line and the number of changes made
         :rtype:     ``str``, ``int``
         """
+        if self.mapping.single_pass_replace:
+            return self.mapping.replace_items(line)
         count = 0
         for item, reg in self.mapping.get_matched_items(line):
-            if self.mapping.use_token_lookup or reg.search(line):
-                line, _count = reg.subn(self.mapping.get(item), line)
-                count += _count
-                # break the cycle if no further search can apply;
-                # token-lookup parsers don't maintain compiled_search so
-                # we rely on get_matched_items() exhausting its results
-                if not self.mapping.use_token_lookup and \
-                        not self.mapping.compiled_search.search(line):
-                    break
+            line, _count = reg.subn(self.mapping.get(item), line)
+            count += _count
         return line, count
 
     def _parse_line(self, line):
@@ -142,7 +137,7 @@ class SoSCleanerParser():
             count += len(matches)
             for match in matches:
                 match = match.strip()
-                if match in self.mapping.dataset.values():
+                if self.mapping.value_in_dataset(match):
                     continue
                 new_match = self.mapping.get(match)
                 if new_match != match:
@@ -164,9 +159,10 @@ class SoSCleanerParser():
         :rtype: ``str``
         """
         if self.compile_regexes:
+            if self.mapping.single_pass_replace:
+                return self.mapping.replace_items(string_data)[0]
             for item, reg in self.mapping.get_matched_items(string_data):
-                if self.mapping.use_token_lookup or reg.search(string_data):
-                    string_data = reg.sub(self.mapping.get(item), string_data)
+                string_data = reg.sub(self.mapping.get(item), string_data)
         else:
             for k, ob in sorted(self.mapping.dataset.items(), reverse=True,
                                 key=lambda x: len(x[0])):
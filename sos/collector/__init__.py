@@ -29,6 +29,7 @@ from shlex import quote
 from sos.cleaner import SoSCleaner
 from sos.collector.sosnode import SosNode
 from sos.options import ClusterOption, str_to_bool
+from sos.archive import ARCHIVE_INDEX_SUFFIX
 from sos.component import SoSComponent
 from sos.utilities import bold
 from sos import __version__
@@ -1009,7 +1010,8 @@ class SoSCollector(SoSComponent):
             sos_options['sysroot'] = quote(self.opts.sysroot)
         if self.opts.chroot:
             sos_options['chroot'] = quote(self.opts.chroot)
-        if self.opts.compression_type != 'auto':
+        # zstd is only passed to the nodes supporting it, see SosNode
+        if self.opts.compression_type not in ('auto', 'zstd'):
             sos_options['compression-type'] = quote(self.opts.compression_type)
 
         for k, v in sos_options.items():
@@ -1406,6 +1408,11 @@ this utility or remote systems that it connects to.
                     dest = cleaner.obfuscate_string(dest)
                 name = os.path.join(self.tmpdir, fname)
                 self.archive.add_file(name, dest=dest)
+                # the index of an obfuscated archive was written by the
+                # cleaner, the one of the original archive is left out
+                if os.path.exists(name + ARCHIVE_INDEX_SUFFIX):
+                    self.archive.add_file(name + ARCHIVE_INDEX_SUFFIX,
+                                          dest=dest + ARCHIVE_INDEX_SUFFIX)
                 if map_file:
                     # regenerate the checksum for the obfuscated archive
                     checksum = cleaner.get_new_checksum(fname)
@@ -17,6 +17,7 @@ import os
 import re
 
 from shlex import quote
+from sos.archive import ARCHIVE_INDEX_SUFFIX, ZSTD_DEFAULT_LEVEL
 from sos.policies import load
 from sos.policies.init_systems import InitSystem
 from sos.collector.transports.juju import JujuSSH
@@ -69,6 +70,7 @@ class SosNode():
         self.retrieved = False
         self.hash_retrieved = False
         self.file_list = []
+        self.archive_index = False
         self.sos_info = {
             'version': None,
             'enabled': [],
@@ -663,6 +665,25 @@ class SosNode():
             if self.opts.low_priority:
                 sos_opts.append('--low-priority')
 
+        # sos-4.13 added zstd compression and --archive-index
+        if self.check_sos_version('4.13'):
+            if self.opts.compression_type == 'zstd':
+                sos_opts.append('--compression-type=zstd')
+                if self.opts.zstd_level != ZSTD_DEFAULT_LEVEL:
+                    sos_opts.append(
+                        f'--zstd-level={quote(str(self.opts.zstd_level))}'
+                    )
+            if self.opts.archive_index:
+                sos_opts.append('--archive-index')
+                self.archive_index = True
+        else:
+            if self.opts.compression_type == 'zstd':
+                self.log_info('zstd compression not supported by sos on '
+                              'node, using default compression type')
+            if self.opts.archive_index:
+                self.log_debug('Archive index requested but not supported by '
+                               'sos on node')
+
         self.update_cmd_from_cluster()
 
         sos_cmd = sos_cmd.replace(
@@ -889,10 +910,26 @@ class SosNode():
         if ret:
             self.ui_msg('Successfully collected sos report')
             self.file_list.append(self.sos_path.split('/')[-1])
+            if self.archive_index:
+                self.retrieve_archive_index()
             return True
         self.ui_msg('Failed to retrieve sos report')
         return False
 
+    def retrieve_archive_index(self):
+        """Collect the member index written alongside the sos report archive
+        by --archive-index. It is not added to the file list, as it is added
+        to the cluster archive along with the sos report it indexes.
+        """
+        index_path = self.sos_path + ARCHIVE_INDEX_SUFFIX
+        try:
+            if self.need_sudo or self.opts.become_root:
+                self.make_archive_readable(index_path)
+            if not self.retrieve_file(index_path):
+                self.log_info('Archive index not retrieved')
+        except Exception as err:
+            self.log_info(f"Failed to retrieve archive index: {err}")
+
     def remove_sos_archive(self):
         """Remove the sos report archive from the node, since we have
         collected it and it would be wasted space otherwise"""
@@ -907,6 +944,8 @@ class SosNode():
         removed = self.remove_file(self.sos_path)
         if not removed:
             self.log_error('Failed to remove sos report')
+        if self.archive_index:
+            self.remove_file(self.sos_path + ARCHIVE_INDEX_SUFFIX)
 
     def cleanup(self):
         """Remove the sos archive from the node once we have it locally"""
@@ -23,7 +23,8 @@ from getpass import getpass
 from shutil import rmtree
 from pathlib import Path
 from sos import __version__
-from sos.archive import TarFileArchive
+from sos.archive import (TarFileArchive, StreamingTarFileArchive,
+                         ZSTD_DEFAULT_LEVEL, zstd_available)
 from sos.options import SoSOptions
 from sos.utilities import TempFileUtil, shell_out
 
@@ -56,6 +57,7 @@ class SoSComponent():
     root_required = False
 
     _arg_defaults = {
+        "archive_index": False,
         "batch": False,
         "compression_type": 'auto',
         "config_file": '/etc/sos/sos.conf',
@@ -67,7 +69,8 @@ class SoSComponent():
         "threads": 4,
         "tmp_dir": '',
         "sysroot": None,
-        "verbosity": 0
+        "verbosity": 0,
+        "zstd_level": ZSTD_DEFAULT_LEVEL
     }
 
     # files in collected archive that might contain upload password
@@ -362,7 +365,7 @@ class SoSComponent():
         else:
             self._set_encrypt_from_env_vars()
 
-    def setup_archive(self, name=''):
+    def setup_archive(self, name='', streaming=False, dedup=False):
         if self.opts.encrypt:
             self._get_encryption_method()
         enc_opts = {
@@ -373,7 +376,21 @@ class SoSComponent():
         if not name:
             name = self.policy.get_archive_name()
         archive_name = os.path.join(self.tmpdir, name)
-        if self.opts.compression_type == 'auto':
+        if self.opts.compression_type == 'zstd' and not zstd_available():
+            self.ui_log.warning("zstd compression requires python 3.14 or "
+                                "later, or the python zstandard module. "
+                                "Using the default compression instead.")
+            self.opts.compression_type = 'auto'
+        if streaming:
+            self.archive = StreamingTarFileArchive(archive_name, self.tmpdir,
+                                                   self.policy,
+                                                   self.opts.threads,
+                                                   enc_opts, self.sysroot,
+                                                   self.manifest)
+            self.archive.method = self.opts.compression_type
+            # these are rewritten once the collection is over
+            self.archive.hold_paths = self.files_with_upload_passwd
+        elif self.opts.compression_type == 'auto':
             auto_archive = self.policy.get_preferred_archive()
             self.archive = auto_archive(archive_name, self.tmpdir,
                                         self.policy, self.opts.threads,
@@ -386,6 +403,11 @@ class SoSComponent():
                                           enc_opts, self.sysroot,
                                           self.manifest)
 
+        self.archive.zstd_level = self.opts.zstd_level
+        # the index of an encrypted archive would disclose its file names
+        self.archive.write_index = (self.opts.archive_index and
+                                    not enc_opts['encrypt'])
+        self.archive.dedup = dedup
         self.archive.set_debug(self.opts.verbosity > 2)
 
     def _obfuscate_upload_passwords(self):
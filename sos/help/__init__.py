@@ -101,6 +101,7 @@ class SoSHelper(SoSComponent):
             'collector.transports': 'RemoteTransport',
             'collector.clusters': 'Cluster',
             'policies': 'Policy',
+            'rebuild': 'SoSRebuild',
             'upload': 'SoSUpload'
         }
 
@@ -207,6 +208,7 @@ class SoSHelper(SoSComponent):
             'report.plugins.$plugin': 'Information on a specific $plugin',
             'clean':    'Detailed help on the clean command',
             'collect':  'Detailed help on the collect command',
+            'rebuild': 'Detailed help on the rebuild command',
             'upload': 'Detailed help on the upload command',
             'policies': 'How sos operates on different distributions',
         }
@@ -412,7 +412,7 @@ any third party.
             seealso.add_text(f"{' ':>8}{pol:<20}{value:<30}", newline=False)
 
     def display_results(self, archive, directory, checksum, archivestat=None,
-                        map_file=None):
+                        map_file=None, index_file=None):
         """Display final information about a generated archive
 
         :param archive: The name of the archive that was generated
@@ -430,6 +430,10 @@ any third party.
         :param map_file: If sos clean was invoked, the location of the mapping
                          file for this run
         :type map_file: ``str``
+
+        :param index_file: If --archive-index was used, the location of the
+                           index of the archive members
+        :type index_file: ``str``
         """
         # Logging is shut down, but there are some edge cases where automation
         # does not capture printed output (e.g. avocado CI). Use the ui_log to
@@ -456,6 +460,8 @@ any third party.
             self.ui_log.info(
                 _(f" Owner\t{getpwuid(archivestat.st_uid).pw_name}")
             )
+            if index_file:
+                self.ui_log.info(_(f" Index\t{index_file}"))
         else:
             self.ui_log.info(
                 _(f"Your sos report build tree has been generated in:"
@@ -0,0 +1,175 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import hashlib
+import json
+import os
+import sys
+
+from sos.archive import DELTA_INDEX, extract_tarfile, open_tarfile
+from sos.component import SoSComponent
+
+
+class SoSRebuild(SoSComponent):
+    """Rebuild the full content of a delta report, created by `sos report`
+    with the --baseline option, from that delta report and its baseline
+    report.
+
+    The delta report records the files it did not store in
+    ``sos_reports/delta.json``, along with the checksum of the baseline
+    report they are found in. The delta report is extracted, and each of
+    these files is then written from the baseline report, after checking
+    that its content is the one recorded.
+    """
+
+    desc = 'Rebuild a full report from a delta report and its baseline'
+    configure_logging = False
+    load_policy = False
+    load_probe = False
+
+    arg_defaults = {
+        'delta': '',
+        'baseline': None,
+        'output_dir': None
+    }
+
+    @classmethod
+    def add_parser_options(cls, parser):
+        parser.usage = 'sos rebuild DELTA [options]'
+        rebuild_grp = parser.add_argument_group(
+            'Rebuild Options',
+            'These options control how a delta report is rebuilt'
+        )
+        rebuild_grp.add_argument('delta', metavar='DELTA',
+                                 help='the delta report archive to rebuild')
+        rebuild_grp.add_argument('--baseline', default=None,
+                                 metavar='ARCHIVE',
+                                 help=('the baseline report archive, by '
+                                       'default the one named by the delta '
+                                       'report in the same directory'))
+        rebuild_grp.add_argument('--output-dir', dest='output_dir',
+                                 default=None, metavar='DIR',
+                                 help=('directory to write the rebuilt '
+                                       'report into, by default the '
+                                       'directory of the delta report'))
+
+    @classmethod
+    def display_help(cls, section):
+        section.set_title('SoS Rebuild Detailed Help')
+        section.add_text(
+            'The rebuild command writes the full content of a delta report, '
+            'created by \'sos report --baseline\', by extracting the delta '
+            'report and copying every file it references from its baseline '
+            'report.'
+        )
+
+    def _fail(self, msg):
+        print(f"Error: {msg}")
+        self._exit(1)
+
+    def execute(self):
+        delta_path = os.path.abspath(self.opts.delta)
+        output_dir = os.path.abspath(self.opts.output_dir or
+                                     os.path.dirname(delta_path))
+        if not os.path.isfile(delta_path):
+            self._fail(f"Delta report {delta_path} does not exist")
+
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            report_dir = extract_tarfile(delta_path, output_dir)
+            with open(os.path.join(report_dir, DELTA_INDEX), 'r',
+                      encoding='utf-8') as delta_file:
+                delta = json.load(delta_file)
+        except Exception as err:
+            self._fail(f"Could not read delta report {delta_path}: {err}")
+
+        baseline_path = os.path.abspath(
+            self.opts.baseline or
+            os.path.join(os.path.dirname(delta_path), delta['baseline'])
+        )
+        if self._checksum(baseline_path) != delta['baseline_sha256']:
+            self._fail(f"{baseline_path} is not the baseline report of "
+                       f"{delta_path}")
+
+        missing = self.copy_from_baseline(baseline_path, report_dir,
+                                          delta['files'])
+        if missing:
+            print(f"Error: {len(missing)} files could not be rebuilt from "
+                  "the baseline report:")
+            for rel_path in sorted(missing):
+                print(f"\t{rel_path}")
+            self._exit(1)
+
+        # the rebuilt report is a full report, and may in turn be used as the
+        # baseline of later reports
+        os.unlink(os.path.join(report_dir, DELTA_INDEX))
+        print(f"Rebuilt {len(delta['files'])} files from the baseline "
+              f"report into {report_dir}")
+        sys.exit(0)
+
+    @staticmethod
+    def _checksum(path):
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'rb') as archive:
+                for block in iter(lambda: archive.read(1024 * 1024), b''):
+                    digest.update(block)
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    @staticmethod
+    def copy_from_baseline(baseline_path, report_dir, files):
+        """Write the files referenced by a delta report from its baseline
+        report, with the permissions and modification time they have in the
+        baseline report.
+
+        :param baseline_path: The path of the baseline report archive
+        :type baseline_path: ``str``
+
+        :param report_dir: The extracted delta report directory
+        :type report_dir: ``str``
+
+        :param files: The hex SHA-256 digest of each referenced file, by its
+                      path relative to the report root
+        :type files: ``dict``
+
+        :returns: The relative paths of the files that were not found in the
+                  baseline report with the recorded content
+        :rtype: ``set``
+        """
+        missing = set(files)
+        is_root = os.getuid() == 0
+        root = os.path.realpath(report_dir)
+        with open_tarfile(baseline_path) as tar:
+            for member in tar:
+                rel_path = member.name.partition('/')[2]
+                if rel_path not in missing or not (member.isreg() or
+                                                   member.islnk()):
+                    continue
+                path = os.path.realpath(os.path.join(root, rel_path))
+                if not path.startswith(root + os.sep):
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                digest = hashlib.sha256()
+                with tar.extractfile(member) as src, \
+                        open(path, 'wb') as dest:
+                    for block in iter(lambda: src.read(1024 * 1024), b''):
+                        digest.update(block)
+                        dest.write(block)
+                if digest.hexdigest() != files[rel_path]:
+                    os.unlink(path)
+                    continue
+                if is_root:
+                    os.chown(path, member.uid, member.gid)
+                os.chmod(path, member.mode)
+                os.utime(path, (member.mtime, member.mtime))
+                missing.discard(rel_path)
+        return missing
+
+# vim: set et ts=4 sw=4 :
@@ -16,8 +16,11 @@ import os
 import errno
 import logging
 import hashlib
+import json
 import pdb
-from datetime import datetime
+import threading
+from collections import deque
+from datetime import datetime, timedelta
 import glob
 
 from concurrent.futures import ThreadPoolExecutor
@@ -25,14 +28,17 @@ from concurrent.futures import TimeoutError as FuturesTimeoutError
 from shutil import rmtree
 
 import sos.report.plugins
-from sos.utilities import (ImporterHelper, SoSTimeoutError, bold,
+from sos.utilities import (ImporterHelper, SoSTimeoutError, CommandCache, bold,
                            sos_get_command_output, TIMEOUT_DEFAULT, listdir,
                            is_executable, scrub_url_credential)
 
 from sos import _sos as _
 from sos import __version__
+from sos.archive import (ARCHIVE_INDEX_SUFFIX, DELTA_INDEX,
+                         StreamedPathError, report_content_index)
 from sos.component import SoSComponent
 import sos.policies
+from sos.report.scheduler import PluginCosts, CommandBoard
 from sos.report.reporting import (Report, Section, Command, CopiedFile,
                                   CreatedFile, Alert, Note, PlainTextReport,
                                   JSONReport, HTMLReport)
@@ -90,13 +96,16 @@ class SoSReport(SoSComponent):
     arg_defaults = {
         'alloptions': False,
         'all_logs': False,
+        'baseline': None,
         'build': False,
         'case_id': '',
         'chroot': 'auto',
         'clean': False,
+        'cmd_threads': 1,
         'pack_dir': [],
         'container_runtime': 'auto',
         'keep_binary_files': False,
+        'dedup_files': False,
         'desc': '',
         'domains': [],
         'disable_parsers': [],
@@ -115,9 +124,11 @@ class SoSReport(SoSComponent):
         'list_profiles': False,
         'log_size': 25,
         'low_priority': False,
+        'max_running_cmds': 0,
         'map_file': '/etc/sos/cleaner/default_mapping',
         'skip_commands': [],
         'skip_files': [],
+        'stream_archive': False,
         'skip_plugins': [],
         'namespaces': None,
         'no_report': False,
@@ -163,6 +174,8 @@ class SoSReport(SoSComponent):
         self._args = args
         self.sysroot = "/"
         self.estimated_plugsizes = {}
+        self.streamed_plugins = set()
+        self.baseline = None
 
         self.print_header()
         self._set_debug()
@@ -193,6 +206,15 @@ class SoSReport(SoSComponent):
         self._get_namespaces()
         self._get_hardware_devices()
 
+        # global limit on the number of commands being run at any one time,
+        # shared by every plugin via the commons dict
+        self.cmd_limiter = threading.BoundedSemaphore(
+            self.opts.max_running_cmds or self.opts.threads
+        )
+        self.cmd_board = CommandBoard()
+        self.cmd_cache = CommandCache()
+        self.plugin_costs = PluginCosts()
+
     @classmethod
     def add_parser_options(cls, parser):
         report_grp = parser.add_argument_group(
@@ -211,6 +233,11 @@ class SoSReport(SoSComponent):
                                 help="Escapes archived files older than date. "
                                      "This will also affect --all-logs. "
                                      "Format: YYYYMMDD[HHMMSS]")
+        report_grp.add_argument("--baseline", action="store",
+                                dest="baseline", default=None,
+                                metavar="ARCHIVE",
+                                help="only store the files that changed "
+                                     "since a previous report archive")
         report_grp.add_argument("--build", action="store_true",
                                 dest="build", default=False,
                                 help="preserve the temporary directory and do "
@@ -230,6 +257,10 @@ class SoSReport(SoSComponent):
         report_grp.add_argument("--container-runtime", default="auto",
                                 help="Default container runtime to use for "
                                      "collections. 'auto' for policy control.")
+        report_grp.add_argument("--dedup-files", action="store_true",
+                                dest="dedup_files", default=False,
+                                help="store identical collected files as "
+                                     "hardlinks to a single copy")
         report_grp.add_argument("--desc", "--description", type=str,
                                 action="store", default="",
                                 help="Description for a new preset",)
@@ -238,7 +269,8 @@ class SoSReport(SoSComponent):
         report_grp.add_argument("--estimate-only", action="store_true",
                                 help="Approximate disk space requirements for "
                                      "a real sos run; disables --clean and "
-                                     "--collect, sets --threads=1 and "
+                                     "--collect, sets --threads=1, "
+                                     "--cmd-threads=1 and "
                                      "--no-postproc")
         report_grp.add_argument("--experimental", action="store_true",
                                 dest="experimental", default=False,
@@ -302,6 +334,15 @@ class SoSReport(SoSComponent):
                                 help="set a timeout for all plugins")
         report_grp.add_argument("--cmd-timeout", default=None,
                                 help="set a command timeout for all plugins")
+        report_grp.add_argument("--cmd-threads", default=1, type=int,
+                                dest="cmd_threads",
+                                help="number of commands each plugin may run "
+                                     "concurrently")
+        report_grp.add_argument("--max-running-cmds", default=0, type=int,
+                                dest="max_running_cmds",
+                                help="maximum number of commands run at once "
+                                     "across all plugins (default: same as "
+                                     "--threads)")
         report_grp.add_argument("-p", "--profile", "--profiles",
                                 action="extend", dest="profiles", type=str,
                                 default=[],
@@ -313,6 +354,11 @@ class SoSReport(SoSComponent):
         report_grp.add_argument('--skip-files', default=[], action='extend',
                                 dest='skip_files',
                                 help="do not collect these files")
+        report_grp.add_argument("--stream-archive", action="store_true",
+                                dest="stream_archive", default=False,
+                                help="write collected files to the final "
+                                     "archive while other plugins are still "
+                                     "running")
         report_grp.add_argument("--verify", action="store_true",
                                 dest="verify", default=False,
                                 help="perform data verification during "
@@ -741,7 +787,10 @@ class SoSReport(SoSComponent):
             'verbosity': self.opts.verbosity,
             'cmdlineopts': self.opts,
             'devices': self.devices,
-            'namespaces': self.namespaces
+            'namespaces': self.namespaces,
+            'cmd_limiter': self.cmd_limiter,
+            'cmd_board': self.cmd_board,
+            'cmd_cache': self.cmd_cache
         }
 
     def get_temp_file(self):
@@ -1018,6 +1067,10 @@ class SoSReport(SoSComponent):
         if self.opts.threads > 1:
             ext_msg += [f"--threads={self.opts.threads} overridden to 1", ]
             self.opts.threads = 1
+        if self.opts.cmd_threads > 1:
+            ext_msg += [f"--cmd-threads={self.opts.cmd_threads} overridden "
+                        "to 1", ]
+            self.opts.cmd_threads = 1
         if not self.opts.build:
             ext_msg += ["--build enabled", ]
             self.opts.build = True
@@ -1244,8 +1297,10 @@ class SoSReport(SoSComponent):
         self.policy.pre_work()
         try:
             self.ui_log.info(_(" Setting up archive ..."))
-            self.setup_archive()
+            self.setup_archive(streaming=self._can_stream_archive(),
+                               dedup=self.opts.dedup_files)
             self._make_archive_paths()
+            self._load_baseline()
             return
         except OSError as e:
             # we must not use the logging subsystem here as it is potentially
@@ -1265,36 +1320,131 @@ class SoSReport(SoSComponent):
             self.ui_log.error(e)
         self._exit(1)
 
+    def _can_stream_archive(self):
+        """Check whether the archive can be written while plugins are being
+        collected, which requires the temporary directory to be left alone
+        until the archive is finalized"""
+        if not self.opts.stream_archive:
+            return False
+        conflicts = [opt for opt in ('baseline', 'build', 'clean',
+                                     'estimate_only', 'pack_dir')
+                     if getattr(self.opts, opt)]
+        if conflicts:
+            opts = ', '.join(f"--{opt.replace('_', '-')}" for opt in conflicts)
+            self.ui_log.warning(f"--stream-archive cannot be used with {opts}"
+                                ", the archive will be built once the "
+                                "collection is complete")
+            self.opts.stream_archive = False
+        return self.opts.stream_archive
+
+    def _load_baseline(self):
+        """Index the content of the baseline report given with --baseline,
+        which the files collected by this run are compared to once the
+        collection is complete"""
+        self.baseline = None
+        if not self.opts.baseline:
+            return
+        if self.opts.build or self.opts.estimate_only:
+            self.ui_log.warning("--baseline cannot be used with --build or "
+                                "--estimate-only, a full report will be "
+                                "created")
+            return
+        path = os.path.abspath(self.opts.baseline)
+        self.ui_log.info(_(f" Indexing baseline report {path} ..."))
+        try:
+            _top, files = report_content_index(path)
+        except Exception as err:
+            self.ui_log.error(f"Could not read baseline report {path}: {err}"
+                              ", a full report will be created")
+            return
+        if DELTA_INDEX in files:
+            self.ui_log.error(f"Baseline report {path} is itself a delta "
+                              "report, a full report will be created")
+            return
+        self.baseline = {
+            'archive': path,
+            'sha256': self._create_checksum(path, 'sha256'),
+            'files': files
+        }
+
+    def _apply_baseline(self):
+        """Remove the collected files that are identical in the baseline
+        report, and record references to them instead so that the full
+        report can be rebuilt from the baseline and this delta report"""
+        dropped, size = self.archive.drop_unchanged(self.baseline['files'])
+        delta = {
+            'baseline': os.path.basename(self.baseline['archive']),
+            'baseline_sha256': self.baseline['sha256'],
+            'files': dropped
+        }
+        self.archive.add_string(json.dumps(delta, indent=4, sort_keys=True),
+                                DELTA_INDEX)
+        self.report_md.add_section('baseline')
+        self.report_md.baseline.add_field('archive', delta['baseline'])
+        self.report_md.baseline.add_field('sha256', delta['baseline_sha256'])
+        self.report_md.baseline.add_field('files_referenced', len(dropped))
+        self.report_md.baseline.add_field('bytes_referenced', size)
+        self.ui_log.info(_(f" {len(dropped)} files are unchanged since the "
+                           "baseline report and were not stored"))
+
     def setup(self):
         self.ui_log.info(_(" Setting up plugins ..."))
+        # Manifest sections are created up front and in plugin order, so that
+        # the manifest does not depend on the order in which the setup() of
+        # each plugin finishes. Each plugin then only ever writes to its own
+        # section, and to its own collection lists, while being set up.
         for plugname, plug in self.loaded_plugins:
-            try:
-                self.report_md.plugins.add_section(plugname)
-                plug.set_plugin_manifest(getattr(self.report_md.plugins,
-                                                 plugname))
-                start = datetime.now()
-                plug.manifest.add_field('setup_start', start)
-                plug.archive = self.archive
-                plug.add_default_collections()
-                plug.setup()
-                self.env_vars.update(plug._env_vars)
-                if self.opts.verify:
-                    plug.setup_verify()
-                end = datetime.now()
-                plug.manifest.add_field('setup_end', end)
-                plug.manifest.add_field('setup_time', end - start)
-            except KeyboardInterrupt:
-                raise KeyboardInterrupt  # pylint: disable=raise-missing-from
-            except OSError as e:
-                if e.errno in fatal_fs_errors:
-                    self.ui_log.error("")
-                    self.ui_log.error(
-                        f" {e.strerror} while setting up plugins")
-                    self.ui_log.error("")
+            self.report_md.plugins.add_section(plugname)
+            plug.set_plugin_manifest(getattr(self.report_md.plugins,
+                                             plugname))
+            plug.archive = self.archive
+        executor = ThreadPoolExecutor(self.opts.threads)
+        try:
+            for fatal in executor.map(self._setup_plugin,
+                                      self.loaded_plugins):
+                if fatal:
+                    # stop here rather than in the worker thread, so that
+                    # the plugins not yet set up are never started
+                    executor.shutdown(wait=True, cancel_futures=True)
                     self._exit(1)
-                self.handle_exception(plugname, "setup")
-            except Exception:
-                self.handle_exception(plugname, "setup")
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        for plugname, plug in self.loaded_plugins:
+            self.env_vars.update(plug._env_vars)
+            if self.opts.stream_archive:
+                self.archive.claim(plugname, plug.get_claimed_paths())
+
+    def _setup_plugin(self, plugin):
+        """Run the setup phase of a single plugin, called concurrently for
+        all loaded plugins by setup().
+
+        Returns True if a fatal filesystem error was hit, in which case the
+        report must be aborted.
+        """
+        plugname, plug = plugin
+        try:
+            start = datetime.now()
+            plug.manifest.add_field('setup_start', start)
+            plug.add_default_collections()
+            plug.setup()
+            if self.opts.verify:
+                plug.setup_verify()
+            end = datetime.now()
+            plug.manifest.add_field('setup_end', end)
+            plug.manifest.add_field('setup_time', end - start)
+        except OSError as e:
+            if e.errno in fatal_fs_errors:
+                self.ui_log.error("")
+                self.ui_log.error(
+                    f" {e.strerror} while setting up plugins")
+                self.ui_log.error("")
+                return True
+            self.handle_exception(plugname, "setup")
+        except Exception:
+            self.handle_exception(plugname, "setup")
+        return False
 
     def version(self):
         """Fetch version information from all plugins and store in the report
@@ -1316,26 +1466,47 @@ class SoSReport(SoSComponent):
         for i in self.loaded_plugins:
             plugruncount += 1
             self.pluglist.append((plugruncount, i[0]))
+        # start the plugins that took longest in previous runs first, so that
+        # they do not end up being the last ones still running
+        self._plugin_queue = deque(
+            self.plugin_costs.order(self.pluglist, key=lambda p: p[1])
+        )
         try:
-            results = []
             with ThreadPoolExecutor(self.opts.threads) as executor:
-                results = executor.map(self._collect_plugin,
-                                       list(self.pluglist))
-            for res in results:
-                if not res:
-                    self.soslog.debug(f"Unexpected plugin task result: {res}")
+                workers = [
+                    executor.submit(self._collect_worker)
+                    for _ in range(self.opts.threads)
+                ]
+                for worker in workers:
+                    worker.result()
+            if not self.opts.dry_run:
+                self.plugin_costs.save()
             self.ui_log.info("")
         except KeyboardInterrupt:
             # We may not be at a newline when the user issues Ctrl-C
             self.ui_log.error("\nExiting on user cancel\n")
             os._exit(1)
 
+    def _collect_worker(self):
+        """Collect plugins from the queue until it is empty, then help the
+        plugins that are still running by stealing their queued commands"""
+        while True:
+            try:
+                plugin = self._plugin_queue.popleft()
+            except IndexError:
+                break
+            res = self._collect_plugin(plugin)
+            if not res:
+                self.soslog.debug(f"Unexpected plugin task result: {res}")
+        self.cmd_board.help()
+
     def _collect_plugin(self, plugin):
         """Wraps the collect_plugin() method so we can apply a timeout
         against the plugin as a whole"""
+        _plug = self.loaded_plugins[plugin[0]-1][1]
+        self.cmd_board.add_plugin(_plug)
         with ThreadPoolExecutor(1) as pool:
             try:
-                _plug = self.loaded_plugins[plugin[0]-1][1]
                 t = pool.submit(self.collect_plugin, plugin)
                 # Re-type int 0 to NoneType, as otherwise result() will treat
                 # it as a literal 0-second timeout
@@ -1346,6 +1517,8 @@ class SoSReport(SoSComponent):
                 end = datetime.now()
                 _plug.manifest.add_field('end_time', end)
                 _plug.manifest.add_field('run_time', end - start)
+                self.plugin_costs.update(plugin[1],
+                                         (end - start).total_seconds())
             except FuturesTimeoutError:
                 msg = f"Plugin {plugin[1]} timed out"
                 # log to ui_log.error to show the user, log to soslog.info
@@ -1355,8 +1528,13 @@ class SoSReport(SoSComponent):
                 self.soslog.info(msg)
                 self.running_plugs.remove(plugin[1])
                 self.loaded_plugins[plugin[0]-1][1].set_timeout_hit()
+                self.plugin_costs.update(plugin[1], timeout)
                 pool.shutdown(wait=True)
                 pool._threads.clear()
+            finally:
+                self.cmd_board.remove_plugin(_plug)
+        if self.opts.stream_archive and not _plug._timeout_hit:
+            self._stream_plugin(plugin[1], _plug)
         if self.opts.estimate_only:
             # call "du -s -B1" for the tmp dir to get the disk usage of the
             # data collected by the plugin - if the command fails, count with 0
@@ -1508,29 +1686,123 @@ class SoSReport(SoSComponent):
                     self.ui_log.error("")
                     self._exit(1)
 
+    def _stream_plugin(self, plugname, plug):
+        """Post-process the data of a plugin as soon as it is collected, then
+        hand the files it collected over to the streaming archive"""
+        self.streamed_plugins.add(plugname)
+        if not self.opts.no_postproc:
+            subs = self._postproc_plugin((plugname, plug))
+            if subs:
+                times = {}
+                try:
+                    self.archive.do_file_subs(subs, times=times)
+                except StreamedPathError as e:
+                    # recorded by the archive, the report is aborted later
+                    self.soslog.error(f"plugin {plugname}: {e}")
+                self._add_postproc_subs_time([(plug, subs)], times)
+        try:
+            streamed = self.archive.release(plugname,
+                                            plug.get_collected_paths())
+            self.soslog.debug(f"streamed {streamed} files of plugin "
+                              f"{plugname} to the archive")
+        except OSError as e:
+            if e.errno in fatal_fs_errors:
+                self.ui_log.error(
+                    f"\n {e.strerror} while streaming plugin data")
+                self._exit(1)
+            self.handle_exception(plugname, "stream")
+        except Exception:
+            self.handle_exception(plugname, "stream")
+
     def postproc(self):
-        for plugname, plug in self.loaded_plugins:
-            try:
-                if plug.get_option('postproc'):
-                    start = datetime.now()
-                    plug.manifest.add_field('postproc_start', start)
-                    plug.postproc()
-                    end = datetime.now()
-                    plug.manifest.add_field('postproc_end', end)
-                    plug.manifest.add_field('postproc_time', end - start)
-                else:
-                    self.soslog.info(
-                        f"Skipping postproc for plugin {plugname}")
-            except OSError as e:
-                if e.errno in fatal_fs_errors:
-                    self.ui_log.error("")
-                    self.ui_log.error(
-                        f" {e.strerror} while post-processing plugin data")
-                    self.ui_log.error("")
-                    self._exit(1)
-                self.handle_exception(plugname, "postproc")
-            except Exception:
-                self.handle_exception(plugname, "postproc")
+        # Plugins only queue their substitutions while their postproc() runs,
+        # and the batches are merged in plugin order so that every file sees
+        # its substitutions in the same order as when applied one by one.
+        # Plugins streamed to the archive were already post-processed.
+        plugins = [plugin for plugin in self.loaded_plugins
+                   if plugin[0] not in self.streamed_plugins]
+        with ThreadPoolExecutor(self.opts.threads) as executor:
+            batches = list(executor.map(self._postproc_plugin, plugins))
+        subs = {}
+        for batch in batches:
+            for path, _subs in batch.items():
+                subs.setdefault(path, []).extend(_subs)
+        if not subs:
+            return
+        start = datetime.now()
+        times = {}
+        try:
+            self.archive.do_file_subs(subs, workers=self.opts.threads,
+                                      times=times)
+        except StreamedPathError as e:
+            self.soslog.error(str(e))
+        end = datetime.now()
+        self.soslog.debug(f"applied substitutions to {len(subs)} files in "
+                          f"{end - start}")
+        self.report_md.add_section('postproc_subs')
+        self.report_md.postproc_subs.add_field('start_time', start)
+        self.report_md.postproc_subs.add_field('end_time', end)
+        self.report_md.postproc_subs.add_field('run_time', end - start)
+        self.report_md.postproc_subs.add_field('files', len(subs))
+        self._add_postproc_subs_time(
+            [(plugin[1], batch) for plugin, batch in zip(plugins, batches)],
+            times
+        )
+
+    def _add_postproc_subs_time(self, batches, times):
+        """Record in the manifest of each plugin the time spent applying the
+        substitutions its postproc() queued, as part of its postproc_time.
+        A file with substitutions queued by several plugins counts in the
+        time of each of them.
+
+        :param batches: The plugins, and the batch each of them queued
+        :type batches: ``list`` of ``tuple``
+
+        :param times: The seconds spent on the substitutions of each path
+        :type times: ``dict``
+        """
+        for plug, batch in batches:
+            if not batch:
+                continue
+            subs_time = timedelta(
+                seconds=sum(times.get(path, 0) for path in batch)
+            )
+            plug.manifest.add_field('postproc_subs_time', subs_time)
+            if plug.manifest.postproc_time:
+                plug.manifest.add_field(
+                    'postproc_time', plug.manifest.postproc_time + subs_time
+                )
+
+    def _postproc_plugin(self, plugin):
+        """Run the postproc() of a single plugin, returning the batch of file
+        substitutions that it requested"""
+        plugname, plug = plugin
+        subs = {}
+        try:
+            if plug.get_option('postproc'):
+                start = datetime.now()
+                plug.manifest.add_field('postproc_start', start)
+                plug.set_postproc_batch(subs)
+                plug.postproc()
+                end = datetime.now()
+                plug.manifest.add_field('postproc_end', end)
+                plug.manifest.add_field('postproc_time', end - start)
+            else:
+                self.soslog.info(
+                    f"Skipping postproc for plugin {plugname}")
+        except OSError as e:
+            if e.errno in fatal_fs_errors:
+                self.ui_log.error("")
+                self.ui_log.error(
+                    f" {e.strerror} while post-processing plugin data")
+                self.ui_log.error("")
+                self._exit(1)
+            self.handle_exception(plugname, "postproc")
+        except Exception:
+            self.handle_exception(plugname, "postproc")
+        finally:
+            plug.set_postproc_batch(None)
+        return subs
 
     def _create_checksum(self, archive, hash_name):
         if not archive:
@@ -1561,6 +1833,15 @@ class SoSReport(SoSComponent):
         map_file = None  # path of the map file generated for the report
 
         self.generate_manifest_tag_summary()
+        self.report_md.add_section('command_cache')
+        self.report_md.command_cache.add_field('hits', self.cmd_cache.hits)
+        self.report_md.command_cache.add_field('misses',
+                                               self.cmd_cache.misses)
+        if self.opts.dedup_files:
+            self.report_md.add_section('dedup')
+            self.report_md.dedup.add_field('files', self.archive.dedup_files)
+            self.report_md.dedup.add_field('bytes_saved',
+                                           self.archive.dedup_bytes)
 
         # use this instead of self.opts.clean beyond the initial check if
         # cleaning was requested in case SoSCleaner fails for some reason
@@ -1593,6 +1874,11 @@ class SoSReport(SoSComponent):
             if packed:
                 self.report_md.add_list('packed_dirs', packed)
 
+        # compare the final content of the report, after any cleaning and
+        # packing, to the baseline and only keep what changed
+        if self.baseline:
+            self._apply_baseline()
+
         self._add_sos_logs()
         if self.manifest is not None:
             self.archive.add_final_manifest_data(self.opts.compression_type)
@@ -1693,7 +1979,8 @@ class SoSReport(SoSComponent):
                 try:
                     # compute and store the archive checksum
                     hash_name = self.policy.get_preferred_hash_name()
-                    checksum = self._create_checksum(archive, hash_name)
+                    checksum = (self.archive.get_checksum(hash_name) or
+                                self._create_checksum(archive, hash_name))
                 except Exception:
                     print(_("Error generating archive checksum after "
                             "archive creation.\n"))
@@ -1716,6 +2003,7 @@ class SoSReport(SoSComponent):
 
                 archive_hash = archive + "." + hash_name
                 final_hash = final_name + "." + hash_name
+                archive_index = archive + ARCHIVE_INDEX_SUFFIX
 
                 # move the archive and checksum file
                 try:
@@ -1742,8 +2030,21 @@ class SoSReport(SoSComponent):
                 except OSError:
                     print(_(f"Error moving checksum file: {archive_hash}"))
 
+                # keep the member index of the archive alongside it, so that
+                # its members may be read without decompressing it whole
+                index_file = None
+                if os.path.exists(archive_index):
+                    try:
+                        os.rename(archive_index,
+                                  final_name + ARCHIVE_INDEX_SUFFIX)
+                        index_file = final_name + ARCHIVE_INDEX_SUFFIX
+                    except OSError:
+                        print(_("Error moving archive index file: "
+                                f"{archive_index}"))
+
                 self.policy.display_results(archive, directory, checksum,
-                                            archivestat, map_file=map_file)
+                                            archivestat, map_file=map_file,
+                                            index_file=index_file)
         else:
             self.policy.display_results(archive, directory, checksum,
                                         map_file=map_file)
@@ -1905,6 +2206,13 @@ class SoSReport(SoSComponent):
             else:
                 self.ui_log.info("Skipping post-processing of collected data")
             self.version()
+            if self.opts.stream_archive and self.archive.streamed_writes:
+                # the tarball lacks some rewrites, such as the sanitizing
+                # of a file, so it must not be handed out
+                self._exit(1, "Files streamed to the archive were rewritten "
+                           "later on: "
+                           f"{', '.join(sorted(self.archive.streamed_writes))}"
+                           "\nRun sos report again without --stream-archive")
             return self.final_work()
 
         except OSError:
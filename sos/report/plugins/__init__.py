@@ -19,13 +19,18 @@ import glob
 import re
 import signal
 import stat
-from time import time, sleep
+from time import time, sleep, monotonic
 import logging
 import fnmatch
 import errno
 import textwrap
+import threading
 
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import groupby
 from pathlib import Path
 
 from sos.utilities import (sos_get_command_output, import_module, grep,
@@ -54,6 +59,35 @@ def _mangle_command(command, name_max):
     return mangledname
 
 
+def _regex_literal_prefix(pattern):
+    """Return the literal text that every string matched by `pattern` at its
+    start must begin with, or an empty string if this cannot be determined.
+
+    This is conservative: any construct other than plain or escaped literal
+    characters ends the prefix.
+    """
+    if '|' in pattern:
+        return ''
+    prefix = ''
+    i = 1 if pattern.startswith('^') else 0
+    while i < len(pattern):
+        char = pattern[i]
+        step = 1
+        if char == '\\':
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break
+            char = pattern[i + 1]
+            step = 2
+        elif char in '.^$*+?{}[]()':
+            break
+        # a quantifier may make the preceding character optional
+        if pattern[i + step:i + step + 1] in ('*', '?', '{'):
+            break
+        prefix += char
+        i += step
+    return prefix
+
+
 def _node_type(st):
     """ return a string indicating the type of special node represented by
     the stat buffer st (block, character, fifo, socket).
@@ -399,6 +433,111 @@ class SoSCommand:
                          sorted(self.__dict__.items()))
 
 
+class SoSPathFilter():
+    """A compiled filter of the paths a plugin must not collect.
+
+    This merges the plugin's forbidden paths, which are regexes matched
+    against the start of a path, with the policy forbidden paths and the
+    paths excluded via ``--skip-files``, which are both shell-style globs,
+    into a single regex so that each candidate path is only matched once.
+
+    It can also tell when every path below a directory would be filtered, so
+    that the directory does not need to be listed at all.
+
+    :param forbidden:   The forbidden path regexes of the plugin
+    :type forbidden:    ``list``
+
+    :param policy:      The forbidden path globs of the policy
+    :type policy:       ``list``
+
+    :param skipped:     The globs of paths excluded by the user
+    :type skipped:      ``list``
+    """
+
+    # constructs that may make a regex match a path, but not a longer path
+    # starting with the same characters
+    _end_sensitive = re.compile(r'\$|\\[ZbB]|\(\?(=|!|<=|<!)')
+
+    def __init__(self, forbidden=None, policy=None, skipped=None):
+        self.forbidden = list(forbidden or [])
+        self._sources = [
+            ('forbidden', self.forbidden),
+            ('policy', [fnmatch.translate(g) for g in policy or []]),
+            ('skipped', [fnmatch.translate(g) for g in skipped or []])
+        ]
+        self._regex = self._combine(self._sources)
+        self._forbidden_regex = self._combine(self._sources[:1])
+        # a regex prunes a directory if matching the directory followed by a
+        # separator guarantees matching everything below it
+        pruners = [p for p in self.forbidden
+                   if not self._end_sensitive.search(p)]
+        pruners.extend(fnmatch.translate(g)
+                       for g in (policy or []) + (skipped or [])
+                       if g.endswith('*'))
+        self._pruner = self._combine([('prune', pruners)])
+
+    @staticmethod
+    def _combine(sources):
+        groups = [
+            f"(?P<{name}>{'|'.join(f'(?:{p})' for p in patterns)})"
+            for name, patterns in sources if patterns
+        ]
+        if not groups:
+            return None
+        try:
+            # group numbers shift once patterns are combined
+            if any(re.search(r'\\[1-9]|\(\?P=', p)
+                   for _, patterns in sources for p in patterns):
+                raise re.error('backreference')
+            return re.compile('|'.join(groups))
+        except re.error:
+            # e.g. patterns using backreferences or global inline flags, that
+            # cannot be combined; match them one by one instead
+            return [(name, re.compile(p))
+                    for name, patterns in sources for p in patterns]
+
+    @staticmethod
+    def _match(regex, path):
+        if regex is None:
+            return None
+        if isinstance(regex, list):
+            for name, _regex in regex:
+                if _regex.match(path):
+                    return name
+            return None
+        match = regex.match(path)
+        return match.lastgroup if match else None
+
+    def check(self, path):
+        """Check if a path is filtered
+
+        :param path:    The path to check
+        :type path:     ``str``
+
+        :returns: 'forbidden', 'policy' or 'skipped' depending on which kind
+                  of filter the path matched first, or None
+        :rtype: ``str`` or ``None``
+        """
+        return self._match(self._regex, path)
+
+    def is_forbidden(self, path):
+        """Check if a path matches one of the plugin's forbidden paths"""
+        return self._match(self._forbidden_regex, path) is not None
+
+    def prunes(self, path):
+        """Check if a directory, and everything below it, is filtered
+
+        :param path:    The path of the directory
+        :type path:     ``str``
+
+        :returns: True if the directory does not need to be listed
+        :rtype: ``bool``
+        """
+        return (self.check(path) is not None and
+                self._match(self._pruner, path.rstrip(os.sep) + os.sep)
+                is not None)
+
+
 class PluginOpt():
     """This is used to define options available to plugins. Plugins will need
     to define options alongside their distro-specific classes in order to add
@@ -542,6 +681,7 @@ class Plugin():
     plugin_timeout = TIMEOUT_DEFAULT
     cmd_timeout = TIMEOUT_DEFAULT
     _timeout_hit = False
+    _timeout_deadline = None
     cmdtags = {}
     filetags = {}
     option_list = []
@@ -555,12 +695,17 @@ class Plugin():
     def __init__(self, commons):
 
         self.copied_files = []
+        self._copied_by_srcpath = {}
+        self._copied_sorted = []
+        self._copied_sorted_dirty = False
+        self._copied_indexed = 0
         self.executed_commands = []
         self._env_vars = set()
         self.alerts = []
         self.custom_text = ""
         self.commons = commons
         self.forbidden_paths = []
+        self._path_filter = None
         self.copy_paths = set()
         self.container_copy_paths = []
         self.copy_strings = []
@@ -574,6 +719,13 @@ class Plugin():
         self.skip_commands = commons['cmdlineopts'].skip_commands
         self.default_environment = {}
         self._tail_files_list = []
+        self._cmd_fname_lock = threading.Lock()
+        self._reserved_cmd_fnames = set()
+        self._cmd_queue = deque()
+        self._cmd_queue_cond = threading.Condition()
+        self._cmd_chains_left = 0
+        self._cmd_chain_error = None
+        self._postproc_subs = None
 
         self.soslog = self.commons['soslog'] if 'soslog' in self.commons \
             else logging.getLogger('sos')
@@ -627,6 +779,7 @@ class Plugin():
         self.manifest.add_field('postproc_start', '')
         self.manifest.add_field('postproc_end', '')
         self.manifest.add_field('postproc_time', '')
+        self.manifest.add_field('postproc_subs_time', '')
         self.manifest.add_field('timeout', self.timeout)
         self.manifest.add_field('timeout_hit', False)
         self.manifest.add_field('command_timeout', self.cmdtimeout)
@@ -1219,7 +1372,8 @@ class Plugin():
                       `regexp`
         :type subst: ``str``
 
-        :returns: Number of replacements made
+        :returns: Number of replacements made, which is 0 when the
+                  substitution is queued for a batched postproc phase
         :rtype: ``int``
         """
         globstr = '*' + cmd + '*'
@@ -1243,6 +1397,10 @@ class Plugin():
                     continue
                 if fnmatch.fnmatch(called['cmd'], globstr):
                     path = os.path.join(self.commons['cmddir'], called['file'])
+                    if self._postproc_subs is not None:
+                        self._queue_file_sub(path, regexp, subst)
+                        replacements = 0
+                        continue
                     self._log_debug(f"applying substitution to '{path}'")
                     readable = self.archive.open_file(path)
                     result, replacements = re.subn(
@@ -1274,15 +1432,33 @@ class Plugin():
         """
         self._log_debug("Scrubbing certs and keys for paths matching "
                         f"{pathregex}")
-        match = re.compile(pathregex).match
         replace = f"{_cert_replace} {desc}" if desc else _cert_replace
-        file_list = [f for f in self.copied_files if match(f['srcpath'])]
+        file_list = self._get_copied_files_matching(pathregex)
         for i in file_list:
             path = i['dstpath']
             if not path:
                 continue
             self.do_file_sub(path, _certmatch, replace)
 
+    def set_postproc_batch(self, subs):
+        """Queue the substitutions requested by postproc() instead of
+        applying them immediately, so that they can be applied by a single
+        pass over each file once every plugin has run its postproc().
+
+        :param subs: The batch to queue substitutions into, keyed by path in
+                     the archive, or None to apply substitutions immediately
+        :type subs: ``dict`` or ``None``
+        """
+        self._postproc_subs = subs
+
+    def _queue_file_sub(self, path, regexp, subst, flags=0):
+        """Queue a substitution for a file in the archive in the current
+        postproc batch, keeping the semantics of applying it immediately"""
+        if hasattr(regexp, "pattern"):
+            flags |= regexp.flags
+            regexp = regexp.pattern
+        self._postproc_subs.setdefault(path, []).append((regexp, flags, subst))
+
     def do_file_sub(self, srcpath, regexp, subst):
         """Apply a regexp substitution to a file archived by sos report.
 
@@ -1296,7 +1472,8 @@ class Plugin():
                       within the file
         :type subst: ``str``
 
-        :returns: Number of replacements made
+        :returns: Number of replacements made, which is 0 when the
+                  substitution is queued for a batched postproc phase
         :rtype: ``int``
         """
         try:
@@ -1307,6 +1484,10 @@ class Plugin():
                             else regexp)
             if not path:
                 return 0
+            if self._postproc_subs is not None:
+                self._queue_file_sub(path, regexp, subst,
+                                     re.IGNORECASE | re.MULTILINE)
+                return 0
             replacements = self.archive.do_file_sub(path, regexp, subst)
         except OSError as e:
             # if trying to regexp a non-existing file, dont log it as an
@@ -1349,10 +1530,7 @@ class Plugin():
         :param subst: The substitution string to be used to replace matches
         :type subst: ``str``
         """
-        if not hasattr(pathexp, "match"):
-            pathexp = re.compile(pathexp)
-        match = pathexp.match
-        file_list = [f for f in self.copied_files if match(f['srcpath'])]
+        file_list = self._get_copied_files_matching(pathexp)
         for file in file_list:
             self.do_file_sub(file['srcpath'], regexp, subst)
 
@@ -1400,10 +1578,10 @@ class Plugin():
             self._log_debug(f"link '{linkdest}' is a directory, skipping...")
             return
 
-        self.copied_files.append({'srcpath': srcpath,
-                                  'dstpath': dstpath,
-                                  'symlink': "yes",
-                                  'pointsto': linkdest})
+        self._add_copied_file({'srcpath': srcpath,
+                               'dstpath': dstpath,
+                               'symlink': "yes",
+                               'pointsto': linkdest})
 
         # Check for indirect symlink loops by stat()ing the next step
         # in the link chain.
@@ -1448,18 +1626,84 @@ class Plugin():
                 return
             raise
 
+    def _add_copied_file(self, copied):
+        """Record a file copied into the archive, keeping the copied files
+        indexes up to date"""
+        self.copied_files.append(copied)
+        self._index_copied_files()
+
+    def _index_copied_files(self):
+        """Index any copied files that have not been indexed yet.
+
+        Copied files are indexed by source path, keeping the first copy of a
+        given path as the lookup did when scanning the list, and by position
+        in a list sorted by source path, used for literal prefix queries.
+        """
+        for seq in range(self._copied_indexed, len(self.copied_files)):
+            copied = self.copied_files[seq]
+            self._copied_by_srcpath.setdefault(copied['srcpath'],
+                                               copied['dstpath'])
+            self._copied_sorted.append((copied['srcpath'], seq))
+            self._copied_sorted_dirty = True
+        self._copied_indexed = len(self.copied_files)
+
+    def _get_copied_files_matching(self, regex):
+        """Get the copied files whose source path matches `regex`, in the
+        order they were copied.
+
+        When the regex starts with a literal prefix, only the copied files
+        whose source path starts with that prefix are tested against it.
+
+        :param regex: The regex to match source paths against
+        :type regex: ``str`` or compiled ``re`` object
+
+        :returns: The matching entries of `copied_files`
+        :rtype: ``list``
+        """
+        if not hasattr(regex, "match"):
+            regex = re.compile(regex)
+        self._index_copied_files()
+        prefix = ''
+        if not regex.flags & re.IGNORECASE:
+            prefix = _regex_literal_prefix(regex.pattern)
+        if not prefix:
+            return [f for f in self.copied_files if regex.match(f['srcpath'])]
+
+        # sorting is deferred to the first query, as queries usually only
+        # happen once all files have been copied
+        if self._copied_sorted_dirty:
+            self._copied_sorted.sort()
+            self._copied_sorted_dirty = False
+        seqs = []
+        idx = bisect_left(self._copied_sorted, (prefix, -1))
+        while idx < len(self._copied_sorted):
+            srcpath, seq = self._copied_sorted[idx]
+            if not srcpath.startswith(prefix):
+                break
+            if regex.match(srcpath):
+                seqs.append(seq)
+            idx += 1
+        return [self.copied_files[seq] for seq in sorted(seqs)]
+
     def _get_dest_for_srcpath(self, srcpath):
         if self.use_sysroot():
             srcpath = self.path_join(srcpath)
-        for copied in self.copied_files:
-            if srcpath == copied["srcpath"]:
-                return copied["dstpath"]
-        return None
+        self._index_copied_files()
+        return self._copied_by_srcpath.get(srcpath)
+
+    def _get_path_filter(self):
+        """Get the compiled filter of forbidden, policy forbidden and skipped
+        paths, rebuilding it if forbidden paths were added since it was
+        built"""
+        if (self._path_filter is None or
+                self._path_filter.forbidden != self.forbidden_paths):
+            self._path_filter = SoSPathFilter(self.forbidden_paths,
+                                              self.policy.forbidden_paths,
+                                              self.skip_files)
+        return self._path_filter
 
     def _is_forbidden_path(self, path):
-        return any(
-            re.match(forbid, path) for forbid in self.forbidden_paths
-        )
+        return self._get_path_filter().is_forbidden(path)
 
     def _is_policy_forbidden_path(self, path):
         return any(
@@ -1539,7 +1783,7 @@ class Plugin():
         else:
             self.archive.add_file(srcpath, dest, force=force)
 
-        self.copied_files.append({
+        self._add_copied_file({
             'srcpath': srcpath,
             'dstpath': dest,
             'symlink': "no"
@@ -1607,8 +1851,8 @@ class Plugin():
         """
 
         global_options = (
-            'all_logs', 'allow_system_changes', 'cmd_timeout', 'journal_size',
-            'log_size', 'plugin_timeout', 'since', 'verify'
+            'all_logs', 'allow_system_changes', 'cmd_threads', 'cmd_timeout',
+            'journal_size', 'log_size', 'plugin_timeout', 'since', 'verify'
         )
 
         if optionname in global_options:
@@ -1667,10 +1911,10 @@ class Plugin():
                 'files_copied': [],
                 'tags': tag
             }
-            matched_files = []
-            for cfile in self.copied_files:
-                if re.match(file_regex, cfile['srcpath']):
-                    matched_files.append(cfile['dstpath'].lstrip('/'))
+            matched_files = [
+                cfile['dstpath'].lstrip('/')
+                for cfile in self._get_copied_files_matching(file_regex)
+            ]
             if matched_files:
                 manifest_data['files_copied'] = matched_files
                 self.manifest.files.append(manifest_data)
@@ -1771,10 +2015,8 @@ class Plugin():
         def getmtime(path):
             """ Files should be sorted in most-recently-modified order, so
             that we collect the newest data first before reaching the limit."""
-            try:
-                return os.path.getmtime(path)
-            except OSError:
-                return 0
+            st = found[path][0]
+            return st.st_mtime if st else 0
 
         def time_filter(path):
             """ When --since is passed, or maxage is coming from the
@@ -1798,7 +2040,8 @@ class Plugin():
             if not container:
                 if self.use_sysroot():
                     copyspec = self.path_join(copyspec)
-                files = self._expand_copy_spec(copyspec)
+                found = self._expand_copy_spec(copyspec)
+                files = list(found)
                 if len(files) == 0:
                     continue
             else:
@@ -1864,35 +2107,37 @@ class Plugin():
             limit_reached = False
 
             _manifest_files = []
+            path_filter = self._get_path_filter()
 
             for _file in files:
                 if _file in self.copy_paths:
                     self._log_debug(f"skipping redundant file '{_file}'")
                     continue
-                if self._is_forbidden_path(_file):
+                filtered = path_filter.check(_file)
+                if filtered == 'forbidden':
                     self._log_debug(f"skipping forbidden path '{_file}'")
                     continue
-                if self._is_policy_forbidden_path(_file):
+                if filtered == 'policy':
                     self._log_debug(
                         f"skipping policy forbidden path '{_file}'")
                     continue
-                if self._is_skipped_path(_file):
+                if filtered == 'skipped':
                     self._log_debug(f"skipping excluded path '{_file}'")
                     continue
                 if limit_reached:
                     self._log_info(f"skipping '{_file}' over size limit")
                     continue
 
-                try:
-                    file_size = os.stat(_file)[stat.ST_SIZE]
-                except OSError:
+                st, islink = found[_file]
+                if st:
+                    file_size = st.st_size
+                elif islink:
                     # if _file is a broken symlink, we should collect it,
                     # otherwise skip it
-                    if self.path_islink(_file):
-                        file_size = 0
-                    else:
-                        self._log_info(f"failed to stat '{_file}', skipping")
-                        continue
+                    file_size = 0
+                else:
+                    self._log_info(f"failed to stat '{_file}', skipping")
+                    continue
                 current_size += file_size
 
                 if sizelimit and current_size > sizelimit:
@@ -2044,6 +2289,8 @@ class Plugin():
             kwargs['priority'] = 10
         if 'changes' not in kwargs:
             kwargs['changes'] = False
+        if 'concurrency_group' not in kwargs:
+            kwargs['concurrency_group'] = None
         if (not getattr(SoSCommand(**kwargs), "snap_cmd", False) and
            (self.get_option('all_logs') or kwargs['sizelimit'] == 0)):
             kwargs['sizelimit'] = 0
@@ -2121,7 +2368,7 @@ class Plugin():
                        changes=False, foreground=False, tags=[],
                        priority=10, cmd_as_tag=False, container=None,
                        to_file=False, runas=None, snap_cmd=False,
-                       runtime=None):
+                       runtime=None, concurrency_group=None):
         """Run a program or a list of programs and collect the output
 
         Output will be limited to `sizelimit`, collecting the last X amount
@@ -2207,6 +2454,11 @@ class Plugin():
 
         :param runtime: Specific runtime to use to run container cmd
         :type runtime: ``str``
+
+        :param concurrency_group: When commands are run concurrently, commands
+                                  sharing this group are run one at a time, in
+                                  the order they were added
+        :type concurrency_group: ``str``
         """
         if isinstance(cmds, str):
             cmds = [cmds]
@@ -2237,7 +2489,8 @@ class Plugin():
                                  foreground=foreground, priority=priority,
                                  cmd_as_tag=cmd_as_tag, to_file=to_file,
                                  container_cmd=container_cmd, runas=runas,
-                                 snap_cmd=snap_cmd)
+                                 snap_cmd=snap_cmd,
+                                 concurrency_group=concurrency_group)
 
     def add_cmd_tags(self, tagdict):
         """Retroactively add tags to any commands that have been run by this
@@ -2319,25 +2572,38 @@ class Plugin():
         outdir = os.path.join(self.commons['cmddir'], plugin_dir)
         outfn = self._mangle_command(exe)
 
-        # check for collisions
-        if os.path.exists(os.path.join(self.archive.get_tmp_dir(),
-                                       outdir, outfn)):
-            inc = 1
-            name_max = self.archive.name_max()
-            while True:
-                suffix = f".{inc}"
-                newfn = outfn
-                if name_max < len(newfn)+len(suffix):
-                    newfn = newfn[:(name_max-len(newfn)-len(suffix))]
-                newfn = newfn + suffix
-                if not os.path.exists(os.path.join(self.archive.get_tmp_dir(),
-                                                   outdir, newfn)):
-                    outfn = newfn
-                    break
-                inc += 1
+        def _taken(fname):
+            return (os.path.join(outdir, fname) in self._reserved_cmd_fnames
+                    or os.path.exists(os.path.join(self.archive.get_tmp_dir(),
+                                                   outdir, fname)))
+
+        # check for collisions, and reserve the name we settle on so that
+        # commands running concurrently never share an output file
+        with self._cmd_fname_lock:
+            if _taken(outfn):
+                inc = 1
+                name_max = self.archive.name_max()
+                while True:
+                    suffix = f".{inc}"
+                    newfn = outfn
+                    if name_max < len(newfn)+len(suffix):
+                        newfn = newfn[:(name_max-len(newfn)-len(suffix))]
+                    newfn = newfn + suffix
+                    if not _taken(newfn):
+                        outfn = newfn
+                        break
+                    inc += 1
+            self._reserved_cmd_fnames.add(os.path.join(outdir, outfn))
 
         return os.path.join(outdir, outfn)
 
+    def _release_command_filename(self, outfn):
+        """Release the reservation of a filename made by
+        _make_command_filename() for a command that wrote no output, so that
+        the name may be used by a later command."""
+        with self._cmd_fname_lock:
+            self._reserved_cmd_fnames.discard(outfn)
+
     def add_env_var(self, name):
         """Add an environment variable to the list of to-be-collected env vars.
 
@@ -2399,7 +2665,9 @@ class Plugin():
                             binary=False, sizelimit=None, subdir=None,
                             changes=False, foreground=False, tags=[],
                             priority=10, cmd_as_tag=False, to_file=False,
-                            tac=False, container_cmd=False, runas=None):
+                            tac=False, container_cmd=False, runas=None,
+                            concurrency_group=None, keep_output=True,
+                            journal=False):
         """Execute a command and save the output to a file for inclusion in the
         report.
 
@@ -2430,7 +2698,15 @@ class Plugin():
             :param to_file:             Write output directly to file instead
                                         of saving in memory
             :param tac:                 Reverse log lines order
+            :param journal:             Is `cmd` a journalctl command, of
+                                        which to write the newest records up
+                                        to the sizelimit to file?
             :param runas:               Run the `cmd` as the `runas` user
+            :param concurrency_group:   Group used by the command scheduler,
+                                        unused here
+            :param keep_output:         Return the output of the cmd? If not,
+                                        the output is written to the archive
+                                        with bounded memory use
 
         :returns:       dict containing status, output, and filename in the
                         archive for the executed cmd
@@ -2474,17 +2750,23 @@ class Plugin():
             out_file = os.path.join(self.archive.get_archive_path(), outfn)
         else:
             out_file = False
+        # large outputs are spooled to disk rather than held in memory
+        spool_dir = self.archive.get_tmp_dir()
 
-        start = time()
-
-        result = sos_get_command_output(
-            cmd, timeout=timeout, stdin=stdin, stderr=stderr, chroot=root,
-            chdir=runat, env=_env, binary=binary, sizelimit=sizelimit,
-            poller=self.check_timeout, foreground=foreground,
-            to_file=out_file, tac=tac, runas=runas
-        )
-
-        end = time()
+        with self._cmd_limiter():
+            if self._timeout_hit:
+                self._release_command_filename(outfn)
+                return None
+            start = time()
+            result = sos_get_command_output(
+                cmd, timeout=timeout, stdin=stdin, stderr=stderr, chroot=root,
+                chdir=runat, env=_env, binary=binary, sizelimit=sizelimit,
+                poller=self.check_timeout, foreground=foreground,
+                to_file=out_file, tac=tac, runas=runas,
+                deadline=self._timeout_deadline, keep_output=keep_output,
+                spool_dir=spool_dir, journal=journal
+            )
+            end = time()
         run_time = end - start
 
         if result['status'] == 124:
@@ -2516,12 +2798,16 @@ class Plugin():
                 if self.commons['cmdlineopts'].chroot != 'always':
                     self._log_info(f"command '{cmd.split()[0]}' not found in "
                                    f"{root} - re-trying in host root")
-                    result = sos_get_command_output(
-                        cmd, timeout=timeout, chroot=False, chdir=runat,
-                        env=env, binary=binary, sizelimit=sizelimit,
-                        stdin=stdin, poller=self.check_timeout,
-                        to_file=out_file, tac=tac,
-                    )
+                    with self._cmd_limiter():
+                        result = sos_get_command_output(
+                            cmd, timeout=timeout, chroot=False, chdir=runat,
+                            env=env, binary=binary, sizelimit=sizelimit,
+                            stdin=stdin, poller=self.check_timeout,
+                            to_file=out_file, tac=tac,
+                            deadline=self._timeout_deadline,
+                            keep_output=keep_output, spool_dir=spool_dir,
+                            journal=journal
+                        )
                     run_time = time() - start
             self._log_debug(f"could not run '{cmd}': command not found")
             # Exit here if the command was not found in the chroot check above
@@ -2529,6 +2815,7 @@ class Plugin():
             if result['status'] in [126, 127]:
                 if self.manifest:
                     self.manifest.commands.append(manifest_cmd)
+                    self._release_command_filename(outfn)
                     return result
 
         self._log_debug(f"collected output of '{cmd.split()[0]}' in {run_time}"
@@ -2544,7 +2831,14 @@ class Plugin():
                 os.rename(out_file, dest)
 
         if not to_file:
-            if binary:
+            reader = result.pop('reader', None)
+            if reader is not None:
+                try:
+                    self.archive.add_chunks(reader.iter_contents(), outfn,
+                                            binary=binary)
+                finally:
+                    reader.cleanup()
+            elif binary:
                 self.archive.add_binary(result['output'], outfn)
             else:
                 self.archive.add_string(result['output'], outfn)
@@ -2661,13 +2955,18 @@ class Plugin():
     def exec_cmd(self, cmd, timeout=None, stderr=True, stdin=None, chroot=True,
                  runat=None, env=None, binary=False, pred=None, sizelimit=None,
                  foreground=False, container=False, quotecmd=False,
-                 runas=None, runtime=None):
+                 runas=None, runtime=None, cache=False):
         """Execute a command right now and return the output and status, but
         do not save the output within the archive.
 
         Use this method in a plugin's setup() if command output is needed to
         build subsequent commands added to a report via add_cmd_output().
 
+        Read-only probes that other plugins are likely to run as well may set
+        `cache`, in which case the result of an identical earlier call made by
+        any plugin during this report is returned instead of running the
+        command again.
+
         :param cmd:                 The command to run
         :type cmd: ``str``
 
@@ -2716,6 +3015,11 @@ class Plugin():
                                     container command
         :type runtime: ``str``
 
+        :param cache:               Reuse the result of an identical earlier
+                                    call for the rest of the report if True,
+                                    or for up to this many seconds
+        :type cache: ``bool`` or ``int``
+
         :returns:                   Command exit status and output
         :rtype: ``dict``
         """
@@ -2745,11 +3049,20 @@ class Plugin():
                 self._log_info(f"Cannot run cmd '{cmd}' in container "
                                f"{container}: no such container is running.")
 
-        return sos_get_command_output(cmd, timeout=timeout, chroot=root,
-                                      chdir=runat, binary=binary, env=_env,
-                                      foreground=foreground, stdin=stdin,
-                                      stderr=stderr, sizelimit=sizelimit,
-                                      runas=runas)
+        def _exec():
+            return sos_get_command_output(cmd, timeout=timeout, chroot=root,
+                                          chdir=runat, binary=binary,
+                                          env=_env, foreground=foreground,
+                                          stdin=stdin, stderr=stderr,
+                                          sizelimit=sizelimit, runas=runas)
+
+        cmd_cache = self.commons.get('cmd_cache')
+        if not cache or cmd_cache is None:
+            return _exec()
+        key = (cmd, root, runat, tuple(sorted((_env or {}).items())), runas,
+               container, stdin, stderr, binary, sizelimit, foreground)
+        ttl = None if cache is True else cache
+        return cmd_cache.get(key, _exec, ttl=ttl)
 
     def _add_container_file_to_manifest(self, container, path, arcpath, tags):
         """Adds a file collection to the manifest for a particular container
@@ -3154,59 +3467,119 @@ class Plugin():
 
         fname = journal_cmd
         tac = False
+        journal = False
         if log_size > 0:
-            journal_cmd = f"{journal_cmd} --reverse"
-            tac = True
+            # journalctl does not take --since along with the cursors the
+            # windows of records are read from
+            if lines or since:
+                journal_cmd = f"{journal_cmd} --reverse"
+                tac = True
+            else:
+                # read the newest records backwards in windows of records,
+                # then write them out in order, see sos_get_journal_output()
+                journal = True
 
         self._log_debug(f"collecting journal: {journal_cmd}")
         self._add_cmd_output(cmd=journal_cmd, timeout=timeout,
-                             tac=tac, to_file=True, suggest_filename=fname,
-                             sizelimit=log_size, pred=pred, tags=tags,
-                             priority=priority)
+                             tac=tac, journal=journal, to_file=True,
+                             suggest_filename=fname, sizelimit=log_size,
+                             pred=pred, tags=tags, priority=priority)
 
     def _expand_copy_spec(self, copyspec):
-        def __expand(paths):
-            found_paths = []
-            paths = glob.glob(paths)
-            for path in paths:
+        """Expand a copyspec into the individual paths to collect.
+
+        Globs are expanded, and directories are walked recursively with
+        `os.scandir()`, skipping hidden entries below the copyspec as glob
+        expansion would. Symlinks are collected as they are, and never
+        followed into directories once below the copyspec.
+
+        Each path is stat()ed once, following symlinks, and the result is
+        returned so that callers do not need to stat it again.
+
+        :param copyspec: The file, directory, or glob to expand
+        :type copyspec: ``str``
+
+        :returns: The stat result, or None if it could not be obtained, and
+                  whether the path is a symlink, for each path to collect
+        :rtype: ``dict`` of ``tuple``
+        """
+        path_filter = self._get_path_filter()
+        found = {}
+
+        def _stat(path):
+            try:
+                return os.stat(path)
+            except OSError:
+                return None
+
+        def _walk(dirpath):
+            """Add the paths below dirpath to found. Returns None if dirpath
+            cannot be listed, else whether it has any entries at all"""
+            try:
+                with os.scandir(dirpath) as it:
+                    entries = list(it)
+            except OSError:
+                # when running in LXD, we've seen os.access return True for
+                # some /sys or /proc paths yet still get a PermissionError
+                # when listing them, so rather than rely on that, just ignore
+                # errors resulting from security modules like apparmor/selinux
+                # Ref: https://github.com/lxc/lxd/issues/5688
+                return None
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
                 try:
-                    # avoid recursive symlink dirs
-                    if self.path_isfile(path) or self.path_islink(path):
-                        found_paths.append(path)
-                    elif self.path_isdir(path) and self.listdir(path):
-                        found_paths.extend(__expand(self.path_join(path, '*')))
-                    else:
-                        found_paths.append(path)
-                except PermissionError:
-                    # when running in LXD, we've seen os.access return True for
-                    # some /sys or /proc paths yet still get a PermissionError
-                    # when calling os.listdir(), so rather than rely on that,
-                    # just catch and ignore permissions errors resulting from
-                    # security modules like apparmor/selinux
-                    # Ref: https://github.com/lxc/lxd/issues/5688
+                    if entry.is_symlink() or entry.is_file():
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            st = None
+                        found[entry.path] = (st, entry.is_symlink())
+                        continue
+                    if entry.is_dir():
+                        if path_filter.prunes(entry.path):
+                            # nothing below this directory could be collected
+                            self._log_debug("pruning filtered path "
+                                            f"'{entry.path}'")
+                            continue
+                        listed = _walk(entry.path)
+                        if listed is None or listed:
+                            continue
+                except OSError:
                     pass
-            return list(set(found_paths))
-
-        if (os.access(copyspec, os.R_OK) and self.path_isdir(copyspec) and
-                self.listdir(copyspec)):
-            # the directory exists and is non-empty, recurse through it
-            copyspec = self.path_join(copyspec, '*')
-        expanded = glob.glob(copyspec, recursive=True)
-        recursed_files = []
-        for _path in expanded:
+                found[entry.path] = (_stat(entry.path), False)
+            return bool(entries)
+
+        def _expand(path, st, islink):
+            """Add a path the copyspec itself expands to. Unlike the paths
+            found while walking, symlinks to directories are followed"""
+            if st and stat.S_ISDIR(st.st_mode):
+                if path_filter.prunes(path):
+                    self._log_debug(f"pruning filtered path '{path}'")
+                    return
+                listed = _walk(path)
+                if listed is None or listed:
+                    return
+            found[path] = (st, islink)
+
+        if os.access(copyspec, os.R_OK) and os.path.isdir(copyspec):
+            # the directory exists, expand to its contents as the glob of
+            # copyspec/* would
             try:
-                if self.path_isdir(_path) and self.listdir(_path):
-                    # remove the top level dir to avoid duplicate attempts to
-                    # copy the dir and its contents
-                    expanded.remove(_path)
-                    recursed_files.extend(__expand(os.path.join(_path, '*')))
-            except PermissionError:
-                # same as the above in __expand(), but this time remove the
-                # path so we don't hit another PermissionError during the
-                # actual copy
-                expanded.remove(_path)
-        expanded.extend(recursed_files)
-        return list(set(expanded))
+                with os.scandir(copyspec) as it:
+                    entries = list(it)
+            except OSError:
+                return found
+            if not entries:
+                found[copyspec] = (_stat(copyspec), False)
+            for entry in entries:
+                if not entry.name.startswith('.'):
+                    _expand(entry.path, _stat(entry.path), entry.is_symlink())
+            return found
+
+        for path in glob.glob(copyspec, recursive=True):
+            _expand(path, _stat(path), os.path.islink(path))
+        return found
 
     def _collect_copy_specs(self):
         for path in sorted(self.copy_paths, reverse=True):
@@ -3257,7 +3630,7 @@ class Plugin():
                     # archives, with no way to control that
                     self.archive.add_string(cpret['output'], arcdest)
                 self._add_container_file_to_manifest(con, path, arcdest, tags)
-                self.copied_files.append({
+                self._add_copied_file({
                     'srcpath': path,
                     'dstpath': arcdest,
                     'symlink': "no"
@@ -3278,7 +3651,7 @@ class Plugin():
                         else:
                             os.remove(fullname)
                     else:
-                        self.copied_files.append({
+                        self._add_copied_file({
                             'srcpath': absname,
                             'dstpath': f"sos_containers/{con}/{relname}",
                             'symlink': "no"
@@ -3287,15 +3660,96 @@ class Plugin():
                 self._log_info(f"error copying '{path}' from container "
                                f"'{con}': {cpret['output']}")
 
-    def _collect_cmds(self):
-        self.collect_cmds.sort(key=lambda x: x.priority)
-        for soscmd in self.collect_cmds:
+    def _cmd_limiter(self):
+        """Get the context manager used to hold one slot of the global limit
+        on concurrently running commands, if the report provides one.
+        """
+        return self.commons.get('cmd_limiter') or contextlib.nullcontext()
+
+    def _collect_soscmds(self, soscmds):
+        """Collect the output of a list of commands, one after another"""
+        for soscmd in soscmds:
             self._log_debug(f"unpacked command: {str(soscmd)}")
             user = ""
             if getattr(soscmd, "runas", None) is not None:
                 user = f", as the {soscmd.runas} user"
             self._log_info(f"collecting output of '{soscmd.cmd}'{user}")
-            self._collect_cmd_output(**soscmd.__dict__)
+            # the output of queued commands is only written to the archive
+            self._collect_cmd_output(keep_output=False, **soscmd.__dict__)
+
+    def steal_cmds(self):
+        """Run the next queued chain of commands for this plugin, if any.
+
+        This is used both by the plugin's own command workers and by idle
+        workers of the report, which steal commands from plugins that are
+        still running once there are no more plugins left to start.
+
+        :returns: True if a chain of commands was run, else False
+        :rtype: ``bool``
+        """
+        with self._cmd_queue_cond:
+            if not self._cmd_queue:
+                return False
+            chain = self._cmd_queue.popleft()
+        err = None
+        try:
+            self._collect_soscmds(chain)
+        except Exception as exc:
+            err = exc
+        with self._cmd_queue_cond:
+            if self._cmd_chain_error is None:
+                self._cmd_chain_error = err
+            self._cmd_chains_left -= 1
+            self._cmd_queue_cond.notify_all()
+        return True
+
+    def _drain_cmd_queue(self):
+        while self.steal_cmds():
+            pass
+
+    def _collect_cmds(self):
+        self.collect_cmds.sort(key=lambda x: x.priority)
+        cmd_threads = self.get_option('cmd_threads') or 1
+        if cmd_threads < 2 or len(self.collect_cmds) < 2:
+            self._collect_soscmds(self.collect_cmds)
+            return
+
+        # Each priority level acts as a barrier: every command of a given
+        # priority finishes before any command of a later priority starts.
+        # Within a level, commands sharing a concurrency_group form a single
+        # serial chain, and all other commands may run in parallel. Chains are
+        # queued so that idle workers of the report may also steal them.
+        first = len(self.manifest.commands) if self.manifest else 0
+        board = self.commons.get('cmd_board')
+        with ThreadPoolExecutor(cmd_threads - 1) as executor:
+            for _prio, soscmds in groupby(self.collect_cmds,
+                                          key=lambda x: x.priority):
+                chains = {}
+                for soscmd in soscmds:
+                    group = getattr(soscmd, 'concurrency_group', None)
+                    chains.setdefault(group or soscmd, []).append(soscmd)
+                with self._cmd_queue_cond:
+                    self._cmd_queue.extend(chains.values())
+                    self._cmd_chains_left = len(chains)
+                if board:
+                    board.announce()
+                for _ in range(min(cmd_threads, len(chains)) - 1):
+                    executor.submit(self._drain_cmd_queue)
+                self._drain_cmd_queue()
+                with self._cmd_queue_cond:
+                    self._cmd_queue_cond.wait_for(
+                        lambda: not self._cmd_chains_left
+                    )
+                    err, self._cmd_chain_error = self._cmd_chain_error, None
+                if err:
+                    raise err
+
+        # keep the manifest ordered as if the commands had been run serially
+        if self.manifest:
+            self.manifest.commands[first:] = sorted(
+                self.manifest.commands[first:],
+                key=lambda x: (x['priority'], x['start_time'])
+            )
 
     def _collect_tailed_files(self):
         for _file, _size in self._tail_files_list:
@@ -3393,6 +3847,10 @@ class Plugin():
     def collect_plugin(self):
         """Collect the data for a plugin."""
         start = time()
+        if self.timeout:
+            # lets commands wake up right when the plugin timeout is due
+            # rather than periodically polling check_timeout()
+            self._timeout_deadline = monotonic() + self.timeout
         self._collect_copy_specs()
         self._collect_container_copy_specs()
         self._collect_tailed_files()
@@ -3402,6 +3860,33 @@ class Plugin():
         self._log_debug(f"collected plugin '{self.name()}' in "
                         f"{time() - start}")
 
+    def get_claimed_paths(self):
+        """Get the paths in the archive that this plugin may add, or rewrite
+        when post-processing, based on the copy specs it set up.
+
+        :returns: Archive paths of the files and directories to be copied
+        :rtype: ``list``
+        """
+        return [self.strip_sysroot(path) for path in self.copy_paths]
+
+    def get_collected_paths(self):
+        """Get the paths in the archive of the files collected by this plugin,
+        including the output of the commands it ran and the strings it added.
+
+        :returns: Archive paths of the collected files
+        :rtype: ``list``
+        """
+        paths = [copied['dstpath'] for copied in self.copied_files]
+        paths.extend(file_name for _, file_name, _ in self.copy_strings)
+        archive_path = self.archive.get_archive_path()
+        for sos_dir in ('sos_commands', 'sos_strings'):
+            top = os.path.join(archive_path, sos_dir, self.name())
+            for root, _, files in os.walk(top):
+                paths.extend(os.path.relpath(os.path.join(root, name),
+                                             archive_path)
+                             for name in files)
+        return paths
+
     def get_description(self):
         """This function will return the description for the plugin"""
         try:
@@ -121,9 +121,9 @@ class Foreman(Plugin):
 
         # these DNS issues and SELinux cmd are not applicable to foremanctl
         if not self.container:
-            _hostname = self.exec_cmd('hostname')['output']
+            _hostname = self.exec_cmd('hostname', cache=True)['output']
             _hostname = _hostname.strip()
-            _host_f = self.exec_cmd('hostname -f')['output']
+            _host_f = self.exec_cmd('hostname -f', cache=True)['output']
             _host_f = _host_f.strip()
             self.add_cmd_output([
                 'foreman-selinux-relabel -nv',
@@ -41,7 +41,7 @@ class MellanoxFirmware(Plugin, IndependentPlugin):
 
         # Run only if mft package is installed.
         # flint is available from the mft package.
-        cout = self.exec_cmd('flint --version')
+        cout = self.exec_cmd('flint --version', cache=True)
         if cout['status'] != 0:
             return
 
@@ -88,7 +88,7 @@ class MellanoxFirmware(Plugin, IndependentPlugin):
         commands = []
 
         # mft package is installed if flint command is available
-        cout = self.exec_cmd('flint --version')
+        cout = self.exec_cmd('flint --version', cache=True)
         if cout['status'] != 0:
             # mstflint package commands
             # the commands do not support position independent arguments
@@ -21,7 +21,7 @@ class Puppet(Plugin, IndependentPlugin):
                 'puppetserver', 'puppetmaster', 'puppet-master')
 
     def setup(self):
-        _hostname = self.exec_cmd('hostname')['output']
+        _hostname = self.exec_cmd('hostname', cache=True)['output']
         _hostname = _hostname.strip()
 
         self.add_copy_spec([
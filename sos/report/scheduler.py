@@ -0,0 +1,166 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import json
+import logging
+import os
+import threading
+
+PLUGIN_COST_DB = '/var/lib/sos/plugin_costs.json'
+
+
+class PluginCosts():
+    """A small on-disk record of how long each plugin took to collect in
+    previous runs of sos report.
+
+    The recorded run times are used to start the most expensive plugins first
+    (longest-processing-time-first), so that slow plugins do not end up being
+    the last ones started and thus setting the end of the run.
+
+    :param path:    The location of the cost database
+    :type path:     ``str``
+    """
+
+    # weight given to the newest run time when updating a recorded cost
+    weight = 0.5
+
+    def __init__(self, path=PLUGIN_COST_DB):
+        self.path = path
+        self.soslog = logging.getLogger('sos')
+        self._lock = threading.Lock()
+        self.costs = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as dbfile:
+                costs = json.load(dbfile)
+            self.costs = {
+                name: float(cost) for name, cost in costs.items()
+                if isinstance(cost, (int, float))
+            }
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as err:
+            self.soslog.debug(f"Ignoring plugin cost database {self.path}: "
+                              f"{err}")
+
+    def get(self, plugname):
+        """Get the recorded cost of a plugin
+
+        :param plugname:    The name of the plugin
+        :type plugname:     ``str``
+
+        :returns:   The expected run time of the plugin in seconds, or None
+                    if the plugin has not been recorded before
+        :rtype:     ``float`` or ``None``
+        """
+        return self.costs.get(plugname)
+
+    def order(self, plugins, key=None):
+        """Sort plugins so that the most expensive plugins come first.
+
+        Plugins with no recorded cost are placed after every plugin known to
+        take any time at all, and ties keep the order they were given in, so
+        that the result is deterministic.
+
+        :param plugins: The plugins to order
+        :type plugins:  ``list``
+
+        :param key:     Function returning the plugin name for each item of
+                        `plugins`, if they are not plugin names already
+        :type key:      ``callable``
+
+        :returns:   The reordered plugins
+        :rtype:     ``list``
+        """
+        key = key or (lambda name: name)
+        return sorted(plugins, key=lambda plug: -(self.get(key(plug)) or 0))
+
+    def update(self, plugname, run_time):
+        """Record a new run time for a plugin
+
+        :param plugname:    The name of the plugin
+        :type plugname:     ``str``
+
+        :param run_time:    The time the plugin took to collect, in seconds
+        :type run_time:     ``float``
+        """
+        with self._lock:
+            prev = self.costs.get(plugname)
+            if prev is not None:
+                run_time = self.weight * run_time + (1 - self.weight) * prev
+            self.costs[plugname] = round(run_time, 3)
+
+    def save(self):
+        """Write the cost database back to disk. Failures are logged and
+        otherwise ignored, as the database is only ever used as a hint.
+        """
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            with self._lock, open(tmp, 'w', encoding='utf-8') as dbfile:
+                json.dump(self.costs, dbfile, indent=4, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as err:
+            self.soslog.debug(f"Could not save plugin cost database "
+                              f"{self.path}: {err}")
+
+
+class CommandBoard():
+    """Coordinates idle collection workers with plugins that are still running
+    so that the workers can help run queued commands instead of sitting idle.
+
+    Plugins that run their commands concurrently queue them on themselves,
+    then call `announce()`. Workers with nothing else to do call `help()`,
+    which steals queued commands from running plugins until no plugin is left
+    running.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._plugins = []
+
+    def add_plugin(self, plugin):
+        """Mark a plugin as running, making its queued commands stealable"""
+        with self._cond:
+            self._plugins.append(plugin)
+            self._generation += 1
+            self._cond.notify_all()
+
+    def remove_plugin(self, plugin):
+        """Mark a plugin as no longer running"""
+        with self._cond:
+            if plugin in self._plugins:
+                self._plugins.remove(plugin)
+            self._generation += 1
+            self._cond.notify_all()
+
+    def announce(self):
+        """Wake idle workers because new commands have been queued"""
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def help(self):
+        """Steal queued commands from running plugins until none are left
+        running. Blocks while running plugins have nothing left to steal.
+        """
+        while True:
+            with self._cond:
+                generation = self._generation
+                plugins = list(self._plugins)
+            if not plugins:
+                return
+            if any(plug.steal_cmds() for plug in plugins):
+                continue
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: (self._generation != generation or
+                             not self._plugins)
+                )
+
+# vim: set et ts=4 sw=4 :
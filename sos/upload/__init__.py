@@ -14,6 +14,7 @@ import logging
 import inspect
 import importlib
 
+from sos.archive import ARCHIVE_INDEX_SUFFIX
 from sos.component import SoSComponent
 from sos import _sos as _
 from sos import __version__
@@ -271,6 +272,22 @@ this utility.
         if cmdline_opts.low_priority:
             self.policy._configure_low_priority()
 
+    def upload_index(self):
+        """Upload the member index written alongside the archive by
+        --archive-index, if there is one. The archive is usable without it,
+        so failing to upload the index is not fatal.
+        """
+        index_file = self.archive + ARCHIVE_INDEX_SUFFIX
+        if not os.path.isfile(index_file):
+            return
+        try:
+            self.upload_target.upload_archive(index_file)
+            self.ui_log.info(_(f"File {index_file} uploaded successfully"))
+        except Exception as err:
+            self.ui_log.warning(_(f"Upload of archive index failed: {err}"))
+        finally:
+            self.upload_target.upload_archive_name = self.archive
+
     def execute(self):
         try:
             self.pre_work()
@@ -308,6 +325,7 @@ this utility.
                             self.ui_log.error(_(
                                 f"Upload attempt failed: {err}"))
                             sys.exit(1)
+                        self.upload_index()
                     else:
                         self.ui_log.error(_(f"{self.archive} is not a file."))
                 else:
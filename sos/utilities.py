@@ -10,7 +10,8 @@ import os
 import pwd
 import re
 import inspect
-from subprocess import Popen, PIPE, STDOUT, SubprocessError
+from subprocess import (Popen, PIPE, STDOUT, SubprocessError,
+                        TimeoutExpired)
 import logging
 import fnmatch
 import errno
@@ -23,6 +24,7 @@ import threading
 import time
 import io
 import mmap
+import selectors
 from contextlib import closing
 from collections import deque
 
@@ -50,9 +52,14 @@ recommended to install proper python3-magic package with the module.
 
 
 TIMEOUT_DEFAULT = 300
+# the number of records first read backwards from the end of the journal by
+# sos_get_journal_output()
+JOURNAL_WINDOW = 1000
 
 __all__ = [
     'TIMEOUT_DEFAULT',
+    'CommandCache',
+    'CommandMonitor',
     'ImporterHelper',
     'SoSTimeoutError',
     'TempFileUtil',
@@ -74,6 +81,7 @@ __all__ = [
     'recursive_dict_values_by_key',
     'shell_out',
     'sos_get_command_output',
+    'sos_get_journal_output',
     'tac_logs',
     'tail',
 ]
@@ -266,16 +274,45 @@ def scrub_url_credential(url: str):
 def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                            chroot=None, chdir=None, env=None, foreground=False,
                            binary=False, sizelimit=None, poller=None,
-                           to_file=False, tac=False, runas=None, stdin=None):
+                           to_file=False, tac=False, runas=None, stdin=None,
+                           deadline=None, keep_output=True, spool_dir=None,
+                           journal=False, reader=None):
     # pylint: disable=too-many-locals,too-many-branches
     """Execute a command and return a dictionary of status and output,
     optionally changing root or current working directory before
     executing command.
 
+    :param journal: If set along with ``to_file`` and ``sizelimit``, the
+        command is a journalctl command, and its newest records are collected
+        by ``sos_get_journal_output()``.
+
+    :param reader: A reader to feed the output to, instead of the one picked
+        from ``to_file`` and ``sizelimit``. Its ``f_src`` is set to the stdout
+        pipe of the command.
+
+    :param keep_output: If ``False``, and ``to_file`` is not set, the output
+        is not returned as a string. The ``TailReader`` holding it is
+        returned as ``reader`` instead, for the output to be written out
+        in chunks, after which its ``cleanup()`` must be called.
+
+    :param spool_dir: The directory that large outputs are spooled to, rather
+        than kept in memory, when ``to_file`` is not set.
+
     :param stdin: If not ``None``, open a pipe to the child's stdin and
         write this value (``str`` is encoded as UTF-8, ``bytes`` is sent
         as-is). If ``None``, the child inherits the parent's stdin.
+
+    :param deadline: An optional ``time.monotonic()`` value at which
+        ``poller`` is expected to start reporting a timeout, so that the
+        wait for the command can wake up right when it does.
     """
+    if journal and to_file and sizelimit:
+        return sos_get_journal_output(
+            command, sizelimit, to_file, timeout=timeout, stderr=stderr,
+            chroot=chroot, chdir=chdir, env=env, foreground=foreground,
+            poller=poller, runas=runas, deadline=deadline
+        )
+
     # Change root or cwd for child only. Exceptions in the prexec_fn
     # closure are caught in the parent (chroot and chdir are bound from
     # the enclosing scope).
@@ -295,12 +332,6 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
         elif runas:
             os.chdir(pwd_user.pw_dir)
 
-    def _check_poller(proc):
-        if poller() or proc.poll() == 124:
-            proc.terminate()
-            raise SoSTimeoutError
-        time.sleep(0.01)
-
     if runas:
         try:
             pwd_user = pwd.getpwnam(runas)
@@ -371,7 +402,9 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                    preexec_fn=_child_prep_fn) as p:
             stdin_writer = None
             try:
-                if to_file:
+                if reader is not None:
+                    reader.f_src = p.stdout
+                elif to_file:
                     if sizelimit:
                         if tac:
                             _output = tempfile.TemporaryFile(
@@ -381,39 +414,34 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                             # pylint: disable=consider-using-with
                             _output = open(to_file, 'wb')
                         reader = HeadReader(p.stdout, _output, sizelimit,
-                                            binary)
+                                            binary, threaded=False)
                     else:
                         reader = FakeReader(p, binary)
                 else:
-                    reader = TailReader(p.stdout, sizelimit, binary)
+                    reader = TailReader(p.stdout, sizelimit, binary,
+                                        threaded=False, spool_dir=spool_dir)
 
                 if stdin is not None:
                     stdin_writer = StdinWriter(p.stdin, stdin)
 
-                if poller:
-                    while reader.running:
-                        _check_poller(p)
-                else:
-                    try:
-                        # override timeout=0 to timeout=None, as Popen will
-                        # treat the former as a literal 0-second timeout
-                        p.wait(timeout if timeout else None)
-                    except Exception:
-                        p.terminate()
-                        if to_file:
-                            if tac:
-                                with open(to_file, 'wb') as f_dst:
-                                    tac_logs(_output, f_dst, True)
-                        # until we separate timeouts from the `timeout` command
-                        # handle per-cmd timeouts via Plugin status checks
-                        reader.running = False
-                        return {'status': 124,
-                                'output': reader.get_contents(),
-                                'truncated': reader.is_full}
-
-                # wait for Popen to set the returncode
-                while p.poll() is None:
-                    pass
+                monitor = CommandMonitor(
+                    p, reader,
+                    pipe=None if isinstance(reader, FakeReader) else p.stdout,
+                    poller=poller, deadline=deadline
+                )
+                # override timeout=0 to timeout=None, as Popen will treat the
+                # former as a literal 0-second timeout. When polling, leave
+                # per-cmd timeouts to the `timeout` command as before.
+                if not monitor.wait(None if poller else (timeout or None)):
+                    p.terminate()
+                    if to_file:
+                        if tac:
+                            with open(to_file, 'wb') as f_dst:
+                                tac_logs(_output, f_dst, True)
+                    # until we separate timeouts from the `timeout` command
+                    # handle per-cmd timeouts via Plugin status checks
+                    reader.running = False
+                    return _command_result(124, reader, keep_output)
 
                 if to_file and tac:
                     with open(to_file, 'wb') as f_dst:
@@ -421,15 +449,16 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                                  reader.is_full or p.returncode != 0)
 
                 if p.returncode in (126, 127):
-                    stdout = b""
-                else:
-                    stdout = reader.get_contents()
-
-                return {
-                    'status': p.returncode,
-                    'output': stdout,
-                    'truncated': reader.is_full
-                }
+                    result = {
+                        'status': p.returncode,
+                        'output': b"",
+                        'truncated': reader.is_full
+                    }
+                    if isinstance(reader, TailReader):
+                        reader.cleanup()
+                    return result
+
+                return _command_result(p.returncode, reader, keep_output)
             finally:
                 if stdin_writer is not None:
                     stdin_writer.join()
@@ -449,6 +478,134 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
             _output.close()
 
 
+def _command_result(status, reader, keep_output=True):
+    """Build the result of sos_get_command_output() from the reader of the
+    command output, leaving the output in the reader unless it is to be kept
+    """
+    if keep_output or not isinstance(reader, TailReader):
+        result = {
+            'status': status,
+            'output': reader.get_contents(),
+            'truncated': reader.is_full
+        }
+        if isinstance(reader, TailReader):
+            reader.cleanup()
+        return result
+    return {
+        'status': status,
+        'output': b'' if reader.binary else '',
+        'truncated': reader.is_full,
+        'reader': reader
+    }
+
+
+def sos_get_journal_output(command, sizelimit, to_file,
+                           timeout=TIMEOUT_DEFAULT, stderr=False,
+                           window=JOURNAL_WINDOW, **kwargs):
+    """Write the newest records of a journalctl command output that fit in
+    ``sizelimit`` MB to ``to_file``, in chronological order.
+
+    Windows of records are read backwards from the end of the journal, each
+    one starting after the cursor of the oldest record of the previous one,
+    and the records that fit are counted. They are then read forwards from the
+    cursor of the oldest window, skipping the records of that window that do
+    not fit, and written straight to ``to_file``. Only a line of output is
+    ever held in memory, and the output is written once, rather than first
+    to a temporary file to be reversed by ``tac_logs()``.
+
+    The output of journalctl on stderr is dropped, as it would be counted as
+    records. Other keyword arguments are passed to
+    ``sos_get_command_output()``.
+
+    If journalctl fails to read any window, or the records from the cursor
+    of the oldest one, the output is collected the way it used to be, by
+    reversing the output of 'journalctl --reverse'.
+
+    :param command:     The journalctl command, without any --lines, --since
+                        or cursor option
+    :type command:      ``str``
+
+    :param sizelimit:   The size limit of the output in MB
+    :type sizelimit:    ``int``
+
+    :param to_file:     The path of the file to write the output to
+    :type to_file:      ``str``
+
+    :param window:      The number of records of the first window
+    :type window:       ``int``
+
+    :returns: The status of the command and whether the output was truncated
+    :rtype: ``dict``
+    """
+    start = time.monotonic()
+
+    def _remaining():
+        if not timeout:
+            return timeout
+        return max(timeout - int(time.monotonic() - start), 1)
+
+    def _reversed_output():
+        return sos_get_command_output(
+            f"{command} --reverse", timeout=_remaining(), stderr=stderr,
+            sizelimit=sizelimit, to_file=to_file, tac=True, **kwargs
+        )
+
+    budget = sizelimit * 1048576
+    # the cursor of the oldest record read so far, the records read after it
+    # that do not fit, and the records that fit, newest first
+    cursor = None
+    skip = 0
+    records = 0
+    truncated = False
+    status = 0
+    while True:
+        cmd = f"{command} --reverse --show-cursor --lines {window}"
+        if cursor:
+            cmd += f" --after-cursor {shlex.quote(cursor)}"
+        counter = JournalWindowReader(budget)
+        res = sos_get_command_output(cmd, timeout=_remaining(),
+                                     reader=counter, **kwargs)
+        if res['status'] == 124:
+            status = 124
+            break
+        if res['status'] != 0:
+            # journalctl could not read the journal, is too old to show
+            # cursors, or does not take a cursor along with the options of
+            # the command, so collect it the way it used to be
+            return _reversed_output()
+        if counter.cursor is None:
+            # the oldest record was already read
+            break
+        cursor = counter.cursor
+        skip = counter.skipped
+        records += counter.fitted
+        budget -= counter.size
+        if counter.is_full:
+            truncated = True
+            break
+        if counter.fitted < window:
+            break
+        # size the next window after the records read so far
+        window = max(window, int(budget * records /
+                                 (sizelimit * 1048576 - budget)) + 1)
+
+    forward_cmd = command
+    if cursor:
+        forward_cmd = f"{command} --cursor {shlex.quote(cursor)}"
+    with open(to_file, 'wb') as f_dst:
+        writer = JournalReader(f_dst, skip, records)
+        res = sos_get_command_output(forward_cmd, timeout=_remaining(),
+                                     reader=writer, **kwargs)
+    if not status and not writer.done:
+        # journalctl is stopped once the records are written, which ends in
+        # a SIGPIPE if it has more to write, so only a status it ends with
+        # before that is a failure
+        status = res['status']
+        if status not in (0, 124):
+            return _reversed_output()
+    return {'status': status, 'output': '', 'truncated': truncated}
+
+
 def tac_logs(f_src, f_dst, drop_last_log=False):
     """Python implementation of the tac utility with support
     for multiline logs (starting with space). It is intended
@@ -726,18 +883,22 @@ class FakeReader():
 class HeadReader(threading.Thread):
     """Used to 'head' the command output (f_src) to a given size
     without deadlocking sos. Takes a sizelimit value in MB.
+
+    If ``threaded`` is ``False`` the reader does not start its own thread,
+    and is instead fed by a ``CommandMonitor`` via ``feed()`` and ``close()``.
     """
 
     COPY_BUFSIZE = 1024*1024
 
-    def __init__(self, f_src, f_dst, sizelimit, binary):
+    def __init__(self, f_src, f_dst, sizelimit, binary, threaded=True):
         super().__init__()
         self.f_src = f_src
         self.f_dst = f_dst
         self.remaining = sizelimit * 1048576  # convert to bytes
         self.binary = binary
         self.running = True
-        self.start()
+        if threaded:
+            self.start()
 
     def run(self):
         """Reads from the f_src (Popen stdout pipe) until we reach sizelimit.
@@ -745,10 +906,24 @@ class HeadReader(threading.Thread):
         """
         while self.remaining > 0:
             buf = self.f_src.read(min(self.remaining, self.COPY_BUFSIZE))
-            if not buf:
+            if not buf or not self.feed(buf):
                 break
-            self.f_dst.write(buf)
-            self.remaining -= len(buf)
+        self.close()
+
+    def feed(self, buf):
+        """Write a chunk of output to f_dst, up to the sizelimit
+
+        :returns: ``True`` if more output is wanted, else ``False``
+        """
+        buf = buf[:self.remaining]
+        self.f_dst.write(buf)
+        self.remaining -= len(buf)
+        return self.remaining > 0
+
+    def close(self):
+        """Close f_src, so that the command gets a SIGPIPE if it has more
+        output to write than we are willing to collect
+        """
         self.f_src.close()
         self.running = False
 
@@ -760,15 +935,89 @@ class HeadReader(threading.Thread):
         return self.remaining <= 0
 
 
+class RingBufferFile():
+    """A temporary file that keeps the last ``capacity`` bytes written to it,
+    overwriting the oldest data once full, so that the tail of an output of
+    any size is kept on disk rather than in memory.
+
+    :param capacity:    The number of bytes to keep, or ``None`` to keep all
+    :type capacity:     ``int``
+
+    :param tmpdir:      The directory to create the file in
+    :type tmpdir:       ``str``
+    """
+
+    def __init__(self, capacity=None, tmpdir=None):
+        self.capacity = capacity
+        self.written = 0
+        # pylint: disable=consider-using-with
+        self._file = tempfile.TemporaryFile(dir=tmpdir)
+
+    def write(self, data):
+        """Append ``data``, dropping the oldest data beyond the capacity"""
+        if not self.capacity:
+            self._file.write(data)
+            self.written += len(data)
+            return
+        data = memoryview(data)
+        if len(data) > self.capacity:
+            self.written += len(data) - self.capacity
+            data = data[-self.capacity:]
+        pos = self.written % self.capacity
+        first = min(len(data), self.capacity - pos)
+        self._file.seek(pos)
+        self._file.write(data[:first])
+        if first < len(data):
+            self._file.seek(0)
+            self._file.write(data[first:])
+        self.written += len(data)
+
+    @property
+    def truncated(self):
+        """Whether the file is full, in which case older data may have been
+        dropped, the same way that a full ``TailReader`` deque is"""
+        return bool(self.capacity) and self.written >= self.capacity
+
+    def iter_contents(self, size=1048576):
+        """Yield the data kept, oldest first, in chunks of up to ``size``
+        bytes"""
+        if self.truncated:
+            pos = self.written % self.capacity
+            ranges = [(pos, self.capacity), (0, pos)]
+        else:
+            ranges = [(0, self.written)]
+        for start, end in ranges:
+            self._file.seek(start)
+            while start < end:
+                chunk = self._file.read(min(size, end - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                yield chunk
+
+    def close(self):
+        self._file.close()
+
+
 class TailReader(threading.Thread):
     """Used to tail the command output to a given size without deadlocking
     sos.
 
     Takes a sizelimit value in MB, and will compile stdout from Popen into a
     string that is limited to the given sizelimit.
+
+    Output is kept in memory until it exceeds ``spool_size``, after which it
+    is spooled to a ``RingBufferFile`` in ``spool_dir``, so that memory use
+    stays bounded for outputs of any size.
+
+    If ``threaded`` is ``False`` the reader does not start its own thread,
+    and is instead fed by a ``CommandMonitor`` via ``feed()`` and ``close()``.
     """
 
-    def __init__(self, channel, sizelimit, binary):
+    spool_size = 4 * 1048576
+
+    def __init__(self, channel, sizelimit, binary, threaded=True,
+                 spool_dir=None):
         super().__init__()
         self.chan = channel
         self.binary = binary
@@ -778,8 +1027,25 @@ class TailReader(threading.Thread):
             sizelimit = sizelimit * 1048576  # convert to bytes
             self.slots = int(sizelimit / self.chunksize)
         self.deque = deque(maxlen=self.slots)
+        self.spool_dir = spool_dir
+        self.ring = None
+        self._pending = b''
+        self._output_done = threading.Event()
         self.running = True
-        self.start()
+        if threaded:
+            self.start()
+
+    def _append(self, chunk):
+        if self.ring is not None:
+            self.ring.write(chunk)
+            return
+        self.deque.append(chunk)
+        if len(self.deque) * self.chunksize > self.spool_size:
+            capacity = self.slots * self.chunksize if self.slots else None
+            self.ring = RingBufferFile(capacity, self.spool_dir)
+            for _chunk in self.deque:
+                self.ring.write(_chunk)
+            self.deque.clear()
 
     def run(self):
         """Reads from the channel (pipe) that is the output pipe for a
@@ -796,30 +1062,418 @@ class TailReader(threading.Thread):
                 if not line:
                     # Pipe can remain open after output has completed
                     break
-                self.deque.append(line)
+                self._append(line)
         except (ValueError, IOError):
             # pipe has closed, meaning command output is done
             pass
+        self.close()
+
+    def feed(self, buf):
+        """Add a chunk of output of any size to the deque. Output is split
+        into chunksize slots, the same as when reading from the pipe in
+        run(), so that truncation behaves identically.
+
+        :returns: ``True``, as we always want more output to tail
+        """
+        data = self._pending + buf
+        full = len(data) - (len(data) % self.chunksize)
+        for idx in range(0, full, self.chunksize):
+            self._append(data[idx:idx + self.chunksize])
+        self._pending = data[full:]
+        return True
+
+    def close(self):
+        """Flush any partial chunk and mark the output as complete"""
+        if self._pending:
+            self._append(self._pending)
+            self._pending = b''
         self.running = False
+        self._output_done.set()
 
-    def get_contents(self):
-        """Returns the contents of the deque as a string"""
+    def iter_contents(self):
+        """Yield the collected output as chunks of bytes, without joining it
+        in memory"""
         # block until command completes or timesout (separate from the plugin
         # hitting a timeout)
-        while self.running:
-            time.sleep(0.01)
+        if self.running:
+            self._output_done.wait()
+        if self.ring is not None:
+            yield from self.ring.iter_contents()
+        else:
+            yield from self.deque
+
+    def get_contents(self):
+        """Returns the contents of the deque as a string"""
         if not self.binary:
-            return ''.join(ln.decode('utf-8', 'ignore') for ln in self.deque)
-        return b''.join(ln for ln in self.deque)
+            return b''.join(self.iter_contents()).decode('utf-8', 'ignore')
+        return b''.join(self.iter_contents())
+
+    def cleanup(self):
+        """Release the memory or spool file holding the output"""
+        self.deque.clear()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
 
     @property
     def is_full(self):
         """Checks if the deque is full, implying that output was truncated"""
+        if self.ring is not None:
+            return self.ring.truncated
         if not self.slots:
             return False
         return len(self.deque) == self.slots
 
 
+class _JournalLineReader():
+    """Base of the readers of journalctl output fed by a ``CommandMonitor``,
+    which handle the output a line at a time.
+
+    A record is a line followed by any lines starting with a space, as
+    journalctl prints multiline messages. Lines starting with ``-- ``, such as
+    boot separators and the cursor shown by --show-cursor, are not records.
+    """
+
+    binary = False
+
+    def __init__(self):
+        self.f_src = None
+        self.running = True
+        self._partial = b''
+
+    def feed(self, buf):
+        """Handle each complete line of a chunk of output
+
+        :returns: ``True`` if more output is wanted, else ``False``
+        """
+        lines = (self._partial + buf).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            if not self._line(line + b'\n'):
+                return False
+        return True
+
+    def _line(self, line):
+        raise NotImplementedError
+
+    def _end(self):
+        """Called once all of the output was read"""
+
+    def close(self):
+        """Close f_src, so that the command gets a SIGPIPE if it has more
+        output to write than we want
+        """
+        if self.running:
+            if self._partial:
+                self._line(self._partial)
+                self._partial = b''
+            self._end()
+        if self.f_src is not None:
+            self.f_src.close()
+        self.running = False
+
+    def get_contents(self):
+        return ''
+
+    @property
+    def is_full(self):
+        return False
+
+
+class JournalWindowReader(_JournalLineReader):
+    """Count the records of a window of 'journalctl --reverse --show-cursor'
+    output, newest first, that fit in ``budget`` bytes, and the records that
+    follow them in the window, without keeping any of them.
+
+    :param budget:  The size in bytes available to the records
+    :type budget:   ``int``
+    """
+
+    def __init__(self, budget):
+        super().__init__()
+        self.budget = budget
+        self.cursor = None
+        self.size = 0
+        self.fitted = 0
+        self.skipped = 0
+        self._full = False
+        self._record = None
+
+    def _end_record(self):
+        if self._record is None:
+            return
+        if not self._full and self.size + self._record <= self.budget:
+            self.size += self._record
+            self.fitted += 1
+        else:
+            self._full = True
+            self.skipped += 1
+        self._record = None
+
+    def _line(self, line):
+        if line.startswith(b'-- '):
+            if line.startswith(b'-- cursor: '):
+                self.cursor = line[11:].strip().decode('utf-8', 'ignore')
+            self._end_record()
+        elif line.startswith(b' '):
+            if self._record is not None:
+                self._record += len(line)
+        else:
+            self._end_record()
+            self._record = len(line)
+        return True
+
+    def _end(self):
+        self._end_record()
+
+    @property
+    def is_full(self):
+        return self._full
+
+
+class JournalReader(_JournalLineReader):
+    """Write journalctl output to ``f_dst`` a record at a time, skipping the
+    first ``skip`` records and stopping after the next ``records`` ones.
+
+    :param f_dst:   The file to write the records to
+    :type f_dst:    ``file``
+
+    :param skip:    The number of records to skip
+    :type skip:     ``int``
+
+    :param records: The number of records to write
+    :type records:  ``int``
+    """
+
+    def __init__(self, f_dst, skip, records):
+        super().__init__()
+        self.f_dst = f_dst
+        self.skip = skip
+        self.last = skip + records
+        self.seen = 0
+        self.done = False
+
+    def _line(self, line):
+        if self.done:
+            return False
+        if not line.startswith((b' ', b'-- ')):
+            if self.seen == self.last:
+                self.done = True
+                return False
+            self.seen += 1
+        if self.seen > self.skip:
+            self.f_dst.write(line)
+        return True
+
+
+class CommandMonitor():
+    """Wait for a command started by sos_get_command_output() to finish,
+    without busy-waiting on the child process or on reader threads.
+
+    The monitor blocks in a selector on the command's output pipe, on a pidfd
+    for the child where the kernel and python support it, and on the nearest
+    of the command timeout, the plugin timeout ``deadline`` or the next
+    ``poller`` check. Output read from the pipe is handed to a non-threaded
+    ``HeadReader`` or ``TailReader`` via ``feed()``.
+
+    On systems without pidfd support, waiting for the child exit once the
+    output pipe is closed falls back to ``Popen.wait()``.
+
+    :param process:     The running command
+    :type process:      ``subprocess.Popen``
+
+    :param reader:      The reader that collects the command's output
+    :type reader:       ``HeadReader``, ``TailReader`` or ``FakeReader``
+
+    :param pipe:        The output pipe of the command, if any
+    :type pipe:         File object or ``None``
+
+    :param poller:      A method that returns ``True`` once the command
+                        should be terminated, e.g. ``Plugin.check_timeout``
+    :type poller:       ``callable``
+
+    :param deadline:    The ``time.monotonic()`` value at which ``poller`` is
+                        expected to start returning ``True``
+    :type deadline:     ``float``
+    """
+
+    # the longest we sleep between poller checks when no deadline is known
+    POLLER_INTERVAL = 1.0
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, process, reader, pipe=None, poller=None,
+                 deadline=None):
+        self.process = process
+        self.reader = reader
+        self.pipe = pipe
+        self.poller = poller
+        self.deadline = deadline
+
+    def _check_poller(self):
+        if self.poller and (self.poller() or self.process.poll() == 124):
+            self.process.terminate()
+            raise SoSTimeoutError
+
+    def _next_wakeup(self, expires):
+        """Get the number of seconds we may block for, or ``None`` to block
+        until the next event on the pipe or the child
+        """
+        now = time.monotonic()
+        waits = []
+        if expires is not None:
+            waits.append(expires - now)
+        if self.poller:
+            waits.append(self.POLLER_INTERVAL)
+            if self.deadline is not None and self.deadline > now:
+                waits.append(self.deadline - now)
+        if not waits:
+            return None
+        return max(0, min(waits))
+
+    def _read(self):
+        """Read available output from the pipe and feed it to the reader
+
+        :returns: ``True`` if the pipe should still be watched
+        """
+        try:
+            buf = os.read(self.pipe.fileno(), self.READ_SIZE)
+        except OSError:
+            return False
+        if not buf:
+            return False
+        return self.reader.feed(buf)
+
+    @staticmethod
+    def _pidfd_open(pid):
+        if not hasattr(os, 'pidfd_open'):
+            return None
+        try:
+            return os.pidfd_open(pid)
+        except OSError:
+            # kernels older than 5.3
+            return None
+
+    def wait(self, timeout=None):
+        """Block until the command has exited and all of its output has been
+        read, or until ``timeout`` seconds have passed.
+
+        :param timeout: The number of seconds to wait for, or ``None``
+        :type timeout:  ``int``
+
+        :returns:   ``True`` if the command finished, ``False`` on timeout
+        :rtype:     ``bool``
+
+        :raises:    ``SoSTimeoutError`` if ``poller`` reports a timeout
+        """
+        expires = time.monotonic() + timeout if timeout else None
+        reading = self.pipe is not None
+        pidfd = self._pidfd_open(self.process.pid)
+        try:
+            with selectors.DefaultSelector() as sel:
+                if reading:
+                    sel.register(self.pipe, selectors.EVENT_READ)
+                if pidfd is not None:
+                    sel.register(pidfd, selectors.EVENT_READ)
+                while True:
+                    if not reading and self.process.poll() is not None:
+                        return True
+                    self._check_poller()
+                    if expires is not None and time.monotonic() >= expires:
+                        return False
+                    wait = self._next_wakeup(expires)
+                    if not reading and pidfd is None:
+                        # nothing left to select on, block in waitpid()
+                        try:
+                            self.process.wait(wait)
+                        except TimeoutExpired:
+                            pass
+                        continue
+                    for key, _ in sel.select(wait):
+                        if key.fileobj is self.pipe:
+                            if not self._read():
+                                sel.unregister(self.pipe)
+                                self.reader.close()
+                                reading = False
+                        else:
+                            # the pidfd is readable once the child exits
+                            sel.unregister(pidfd)
+                            os.close(pidfd)
+                            pidfd = None
+                            self.process.poll()
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+
+
+class CommandCache():
+    """A run-scoped, thread-safe store of command results, shared by all
+    plugins of a report so that identical read-only probes (e.g. `lsblk` or
+    `podman ps`) are only executed once.
+
+    Concurrent lookups of the same key wait for the first caller to run the
+    command rather than all running it at once. Results of commands that
+    timed out are handed to the callers waiting on them, but not kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self._running = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, func, ttl=None):
+        """Get the result for `key`, calling `func` to produce it when there
+        is no usable cached result.
+
+        :param key:     The hashable identity of the command
+        :type key:      ``tuple``
+
+        :param func:    Called without arguments to run the command
+        :type func:     ``callable`` returning a ``dict``
+
+        :param ttl:     The age in seconds beyond which a cached result is
+                        not reused, or ``None`` to reuse it for the whole run
+        :type ttl:      ``int``
+
+        :returns:   A copy of the command result
+        :rtype:     ``dict``
+        """
+        while True:
+            with self._lock:
+                cached = self._results.get(key)
+                if cached and (ttl is None or
+                               time.monotonic() - cached[0] <= ttl):
+                    self.hits += 1
+                    return dict(cached[1])
+                running = self._running.get(key)
+                if running is None:
+                    running = self._running[key] = (threading.Event(), [])
+                    self.misses += 1
+                    break
+            running[0].wait()
+            if running[1]:
+                return dict(running[1][0])
+            # the first caller failed to produce a result, try again
+
+        try:
+            result = func()
+            running[1].append(result)
+            if result.get('status') != 124:
+                with self._lock:
+                    self._results[key] = (time.monotonic(), dict(result))
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+            running[0].set()
+        return result
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._results.clear()
+
+
 class ImporterHelper:
     """Provides a list of modules that can be imported in a package.
     Importable modules are located along the module __path__ list and modules
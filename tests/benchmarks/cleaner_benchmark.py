@@ -0,0 +1,121 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+"""Benchmark of known item substitution by the cleaner.
+
+Loads --items host names into a hostname parser, then times the
+substitution of the known items of --size MiB of log-like lines, some of
+which mention them, through the matcher of the map. With --regexes, the
+same substitution is also timed with a search regex of every item and a
+regex per item, the way it used to be done.
+
+    python3 tests/benchmarks/cleaner_benchmark.py --size 1024 --items 10000
+"""
+
+import argparse
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from sos.cleaner.parsers.hostname_parser import SoSHostnameParser
+
+
+def make_parser(workdir, items):
+    """Return a hostname parser knowing `items` short host names"""
+    parser = SoSHostnameParser(config={}, workdir=workdir)
+    parser.mapping.initializing = True
+    for num in range(items):
+        parser.mapping.add(f"node{num:05}x")
+    parser.generate_item_regexes()
+    return parser
+
+
+def make_lines(items, seed=0):
+    """Return a batch of log-like lines, a tenth of which mention a known
+    item"""
+    rand = random.Random(seed)
+    words = ['kernel', 'systemd', 'eth0', 'link', 'up', 'down', 'error',
+             'started', 'stopped', 'session', 'user', 'root', 'audit']
+    lines = []
+    for num in range(10000):
+        host = f"node{rand.randrange(items):05}x" if num % 10 == 0 else 'vm'
+        lines.append(
+            f"Oct 18 {rand.randint(0, 23):02}:{rand.randint(0, 59):02} "
+            f"{host} {rand.choice(words)}[{rand.randint(1, 65535)}]: "
+            f"{' '.join(rand.choices(words, k=6))} "
+            f"0x{rand.getrandbits(32):08x}"
+        )
+    return lines
+
+
+def regex_substitution(parser):
+    """Return a function substituting the known items of a line with the
+    search regex and the regexes of every item"""
+    mapping = parser.mapping
+    keys = sorted(mapping._regexes_made, key=len, reverse=True)
+    search = re.compile(mapping.get_regex_fullword(
+        '|'.join(mapping.get_regex_escape(k) for k in keys)), re.I)
+    regexes = [(k, mapping.get_regex_result(k)) for k in keys]
+
+    def substitute(line):
+        count = 0
+        if not search.search(line):
+            return line, count
+        for item, reg in regexes:
+            if reg.search(line):
+                line, _count = reg.subn(mapping.get(item), line)
+                count += _count
+                if not search.search(line):
+                    break
+        return line, count
+    return substitute
+
+
+def run(name, substitute, lines, size):
+    batch = sum(len(line) + 1 for line in lines)
+    total = 0
+    changes = 0
+    start = time.perf_counter()
+    while total < size * 1024 * 1024:
+        for line in lines:
+            changes += substitute(line)[1]
+        total += batch
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {total / 1048576:8.0f} MiB {elapsed:8.2f}s "
+          f"{total / 1048576 / elapsed:8.2f} MiB/s  {changes} changes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1024,
+                        help='MiB of lines to substitute the items of')
+    parser.add_argument('--items', type=int, default=10000,
+                        help='number of known items')
+    parser.add_argument('--regexes', action='store_true',
+                        help='also time the substitution with regexes')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sos-cleaner-bench-')
+    try:
+        hostname_parser = make_parser(workdir, args.items)
+        lines = make_lines(args.items)
+        run('matcher', hostname_parser.mapping.replace_items, lines,
+            args.size)
+        if args.regexes:
+            run('regexes', regex_substitution(hostname_parser), lines,
+                args.size)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: set et ts=4 sw=4 :
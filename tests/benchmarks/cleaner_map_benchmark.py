@@ -0,0 +1,96 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+"""Benchmark of the cleaner maps holding the mapping of a previous run.
+
+Loads --entries items into the keyword and IP maps the way a map file of
+a previous run is loaded, then times --lookups checks of whether items
+are to be ignored as already obfuscated values, the parsing of lines
+mentioning obfuscated addresses, the obfuscation of new addresses of a
+single network, and of new single addresses past the ones of the
+previous run.
+
+    python3 tests/benchmarks/cleaner_map_benchmark.py --entries 100000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+from sos.cleaner.mappings.ip_map import SoSIPMap
+from sos.cleaner.parsers.ip_parser import SoSIPParser
+from sos.cleaner.parsers.keyword_parser import SoSKeywordParser
+
+
+def make_addr(num):
+    """Return the num-th address of the 10.0.0.0/8 network"""
+    return f"10.{(num >> 16) % 256}.{(num >> 8) % 256}.{num % 256}"
+
+
+def make_parsers(workdir, entries):
+    """Return a keyword and an IP parser loaded with a map file of `entries`
+    items for each"""
+    ip_map = {}
+    cnt = SoSIPMap._saddr_cnt
+    for num in range(entries):
+        cnt += 1
+        while cnt % 256 in (0, 255):
+            cnt += 1
+        ip_map[make_addr(num)] = \
+            f"{cnt >> 24}.{(cnt >> 16) % 256}.{(cnt >> 8) % 256}.{cnt % 256}"
+    config = {
+        'keyword_map': {
+            f"keyword{num}": f"obfuscatedword{num}" for num in range(entries)
+        },
+        'ip_map': ip_map,
+    }
+    return (SoSKeywordParser(config=config, workdir=workdir),
+            SoSIPParser(config=config, workdir=workdir))
+
+
+def run(name, func, args):
+    start = time.perf_counter()
+    for arg in args:
+        func(arg)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} {len(args):8} calls {elapsed:8.3f}s "
+          f"{elapsed / len(args) * 1000000:10.2f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000,
+                        help='number of items of the map of each parser')
+    parser.add_argument('--lookups', type=int, default=10000,
+                        help='number of lookups to time')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sos-cleaner-map-bench-')
+    try:
+        kw_parser, ip_parser = make_parsers(workdir, args.entries)
+        step = max(args.entries // args.lookups, 1)
+        values = [f"obfuscatedword{num}"
+                  for num in range(0, args.entries, step)][:args.lookups]
+        run('ignore_item', kw_parser.mapping.ignore_item, values)
+        addrs = list(ip_parser.mapping.dataset.values())
+        lines = [f"link to {addrs[num % len(addrs)]} is up"
+                 for num in range(0, args.lookups * step, step)]
+        run('parse_line', ip_parser.parse_line, lines)
+        run('cidr_address', ip_parser.mapping.get,
+            [f"{make_addr(num)}/16" for num in range(args.lookups)])
+        run('single_address', ip_parser.mapping.get,
+            [make_addr(args.entries + num) for num in range(args.lookups)])
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: set et ts=4 sw=4 :
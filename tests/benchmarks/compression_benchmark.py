@@ -0,0 +1,85 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+"""Benchmark of final archive compression, single threaded and in parallel.
+
+Fills an archive with --size MiB of log-like text, then times
+TarFileArchive.finalize() for each compression method with one thread and
+with --threads threads, reporting the wall time and compression ratio.
+
+    python3 tests/benchmarks/compression_benchmark.py --size 512 --threads 8
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from sos.archive import TarFileArchive
+from sos.policies import Policy
+
+
+def fill_archive(archive, size, seed=0):
+    """Add `size` MiB of log-like text to `archive`, split over files of up
+    to 4 MiB, and return the number of bytes added"""
+    rand = random.Random(seed)
+    words = ['kernel', 'systemd', 'eth0', 'link', 'up', 'down', 'error',
+             'started', 'stopped', 'session', 'user', 'root', 'audit']
+    total = 0
+    num = 0
+    while total < size * 1024 * 1024:
+        lines = []
+        for _ in range(40000):
+            lines.append(
+                f"Oct 18 {rand.randint(0, 23):02}:{rand.randint(0, 59):02} "
+                f"host {rand.choice(words)}[{rand.randint(1, 65535)}]: "
+                f"{' '.join(rand.choices(words, k=6))} "
+                f"0x{rand.getrandbits(32):08x}\n"
+            )
+        content = ''.join(lines)
+        archive.add_string(content, f"var/log/bench/file{num}.log")
+        total += len(content)
+        num += 1
+    return total
+
+
+def run(method, threads, size):
+    tmpdir = tempfile.mkdtemp(prefix='sos-compression-bench-')
+    try:
+        archive = TarFileArchive('bench', tmpdir, Policy(), threads,
+                                 {'encrypt': False}, '/')
+        raw = fill_archive(archive, size)
+        start = time.perf_counter()
+        name = archive.finalize(method)
+        elapsed = time.perf_counter() - start
+        ratio = raw / os.stat(name).st_size
+        print(f"{method:<5} threads={threads:<3} {elapsed:8.2f}s  "
+              f"ratio {ratio:6.2f}")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=256,
+                        help='MiB of data to compress')
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    parser.add_argument('--methods', nargs='+', default=['xz', 'gzip'])
+    args = parser.parse_args()
+
+    for method in args.methods:
+        for threads in sorted({1, args.threads}):
+            run(method, threads, args.size)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,114 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+"""Microbenchmark of copyspec expansion over a synthetic file tree.
+
+Builds a tree of --files files spread over nested directories, then times
+Plugin._expand_copy_spec() and a full add_copy_spec() call against it, with
+and without a size limit so that files are sorted by mtime.
+
+    python3 tests/benchmarks/copyspec_benchmark.py --files 100000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from sos.policies.distros import LinuxPolicy
+from sos.policies.init_systems import InitSystem
+from sos.report.plugins import Plugin
+
+
+class BenchOptions:
+    all_logs = False
+    dry_run = False
+    since = None
+    log_size = 25
+    allow_system_changes = False
+    plugin_timeout = None
+    cmd_timeout = None
+    cmd_threads = 1
+    chroot = 'auto'
+    skip_files = ['*/skipme/*']
+    skip_commands = []
+
+
+class BenchPlugin(Plugin):
+
+    plugin_name = 'bench'
+
+
+def build_tree(root, files, per_dir):
+    """Create `files` small files under `root`, `per_dir` per directory,
+    with directories nested three levels deep"""
+    made = 0
+    while made < files:
+        idx = made // per_dir
+        dirpath = os.path.join(root, f"a{idx % 10}", f"b{idx % 100}",
+                               f"c{idx}")
+        os.makedirs(dirpath, exist_ok=True)
+        for num in range(min(per_dir, files - made)):
+            with open(os.path.join(dirpath, f"f{num}.log"), 'w',
+                      encoding='utf-8') as f:
+                f.write('x' * (num % 64))
+        made += per_dir
+    os.makedirs(os.path.join(root, 'skipme', 'deep'))
+
+
+def run(label, func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<40} {best:8.3f}s  ({result} paths)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--per-dir', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='sos-copyspec-bench-')
+    try:
+        build_tree(root, args.files, args.per_dir)
+
+        def plugin():
+            plug = BenchPlugin({
+                'cmdlineopts': BenchOptions(),
+                'policy': LinuxPolicy(init=InitSystem(), probe_runtime=False),
+                'sysroot': '/',
+                'devices': {}
+            })
+            plug.manifest = None
+            return plug
+
+        def expand():
+            return len(plugin()._expand_copy_spec(root))
+
+        def add(sizelimit):
+            plug = plugin()
+            plug.add_copy_spec(root, sizelimit=sizelimit)
+            return len(plug.copy_paths)
+
+        run('expand copyspec', expand, args.repeat)
+        run('add_copy_spec, no size limit', lambda: add(0), args.repeat)
+        run('add_copy_spec, 1MiB size limit', lambda: add(1), args.repeat)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: set et ts=4 sw=4 :
@@ -7,11 +7,21 @@
 # See the LICENSE file in the source distribution for further information.
 import unittest
 import os
+import re
 import tarfile
 import tempfile
 import shutil
+import subprocess
 
-from sos.archive import TarFileArchive
+from unittest.mock import patch
+
+from sos.archive import (TarFileArchive, StreamingTarFileArchive,
+                         ARCHIVE_INDEX_SUFFIX, ArchiveIndex,
+                         ParallelCompressor, copy_file_data,
+                         extract_tarfile, file_digest, is_tarfile,
+                         open_tarfile, report_content_index, zstd_available,
+                         P_FILE, StreamedPathError)
+from sos.rebuild import SoSRebuild
 from sos.utilities import tail
 from sos.policies import Policy
 
@@ -35,6 +45,42 @@ class TarFileArchiveTest(unittest.TestCase):
         self.assertTrue(os.path.exists(os.path.join(self.tmpdir,
                                                     'test.tar.xz')))
 
+    def test_checksum_while_writing(self):
+        methods = [('none', 1), ('gzip', 1), ('xz', 1), ('gzip', 2)]
+        if zstd_available():
+            methods.append(('zstd', 1))
+        enc = {'encrypt': False}
+        for method, threads in methods:
+            with self.subTest(method=method, threads=threads):
+                tf = TarFileArchive(f'test-{method}-{threads}', self.tmpdir,
+                                    Policy(), threads, enc, '/')
+                tf.add_string('some content', 'tests/file.txt')
+                name = tf.finalize(method)
+                self.assertTrue(is_tarfile(name))
+                self.assertEqual(tf.get_checksum('sha256'),
+                                 file_digest(name).hex())
+                self.assertIsNone(tf.get_checksum('md5'))
+
+    def test_add_chunks(self):
+        # a multibyte character split across chunks, and an invalid byte
+        chunks = [b'caf', b'\xc3', b'\xa9 \xff ok\n']
+        self.tf.add_chunks(iter(chunks), 'tests/text')
+        self.tf.add_chunks(iter(chunks), 'tests/binary', binary=True)
+        with open(self.tf.dest_path('tests/text'), 'rb') as text:
+            self.assertEqual(text.read(), 'caf\u00e9  ok\n'.encode())
+        with open(self.tf.dest_path('tests/binary'), 'rb') as binary:
+            self.assertEqual(binary.read(), b''.join(chunks))
+
+    def test_add_chunks_without_path_lock(self):
+        def chunks():
+            # other threads may add files while the content is produced
+            self.assertFalse(self.tf._path_lock.locked())
+            yield b'chunk'
+
+        self.tf.add_chunks(chunks(), 'tests/chunks')
+        with open(self.tf.dest_path('tests/chunks'), 'rb') as f:
+            self.assertEqual(f.read(), b'chunk')
+
     def test_add_file(self):
         self.tf.add_file('tests/unittests/ziptest')
         self.tf.finalize('auto')
@@ -113,6 +159,381 @@ class TarFileArchiveTest(unittest.TestCase):
     def test_compress(self):
         self.tf.finalize("auto")
 
+    def test_do_file_subs(self):
+        self.tf.add_string('user=admin\npass=secret\n', 'tests/one.txt')
+        self.tf.add_string('token=abc\n', 'tests/two.txt')
+        subs = {
+            'tests/one.txt': [(r'(pass=).*', 0, r'\1****'),
+                              (r'\*+', 0, 'X')],
+            'tests/two.txt': [(r'TOKEN=.*', re.I, 'token=****')],
+            'tests/missing.txt': [(r'.*', 0, '')]
+        }
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                times = {}
+                res = self.tf.do_file_subs(subs, workers=workers,
+                                           times=times)
+                self.assertEqual(res['tests/missing.txt'], 0)
+                self.assertEqual(sorted(times), sorted(subs))
+                afp = self.tf.open_file('tests/one.txt')
+                self.assertEqual('user=admin\npass=X\n', afp.read())
+                afp = self.tf.open_file('tests/two.txt')
+                self.assertEqual('token=****\n', afp.read())
+
+    def test_copy_file_data(self):
+        src = os.path.join(self.tmpdir, 'src')
+        with open(src, 'wb') as f:
+            f.write(os.urandom(3 * 1024 * 1024 + 17))
+        for path in (src, '/proc/self/status'):
+            with self.subTest(path=path):
+                dest = os.path.join(self.tmpdir, 'dest')
+                with open(path, 'rb') as fsrc, open(dest, 'wb') as fdst:
+                    copy_file_data(fsrc, fdst)
+                with open(path, 'rb') as fsrc, open(dest, 'rb') as fdst:
+                    if path == src:
+                        self.assertEqual(fsrc.read(), fdst.read())
+                    else:
+                        self.assertTrue(fdst.read().startswith(b'Name:'))
+
+    def test_add_file_skips_fifo_and_missing(self):
+        fifo = os.path.join(self.tmpdir, 'fifo')
+        os.mkfifo(fifo)
+        self.tf.add_file(fifo)
+        self.tf.add_file(os.path.join(self.tmpdir, 'missing'))
+        self.assertFalse(os.path.exists(self.tf.dest_path(fifo)))
+        self.assertFalse(os.path.exists(
+            self.tf.dest_path(os.path.join(self.tmpdir, 'missing'))))
+
+    def test_host_metadata_recorded_at_copy(self):
+        src = os.path.join(self.tmpdir, 'src')
+        with open(src, 'w', encoding='utf-8') as f:
+            f.write('data')
+        os.chmod(src, 0o640)
+        os.utime(src, (1000000000, 1000000000))
+        self.tf.add_file(src)
+        # later changes on the host are not reflected in the archive
+        os.chmod(src, 0o600)
+        os.utime(src, (1200000000, 1200000000))
+        self.tf.finalize('auto')
+        with tarfile.open(os.path.join(self.tmpdir, 'test.tar.xz')) as rtf:
+            member = rtf.getmember(f"test{src}")
+            self.assertEqual(member.mode & 0o777, 0o640)
+            self.assertEqual(member.mtime, 1000000000)
+        self.assertEqual(self.tf._host_metadata, {})
+
+
+class DedupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        enc = {'encrypt': False}
+        self.tf = TarFileArchive('test', self.tmpdir, Policy(), 1, enc, '/')
+        self.tf.dedup = True
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def inode(self, path):
+        return os.stat(self.tf.dest_path(path)).st_ino
+
+    def test_identical_files_linked(self):
+        self.tf.add_string('same content', 'tests/one.txt')
+        self.tf.add_string('same content', 'tests/two.txt')
+        self.tf.add_string('diff content', 'tests/three.txt')
+        self.tf.add_string('same content', 'sos_logs/log.txt')
+        self.assertEqual(self.inode('tests/one.txt'),
+                         self.inode('tests/two.txt'))
+        self.assertNotEqual(self.inode('tests/one.txt'),
+                            self.inode('tests/three.txt'))
+        self.assertNotEqual(self.inode('tests/one.txt'),
+                            self.inode('sos_logs/log.txt'))
+        self.assertEqual(self.tf.dedup_files, 1)
+        self.assertEqual(self.tf.dedup_bytes, len('same content'))
+        name = self.tf.finalize('gzip')
+        with tarfile.open(name) as rtf:
+            links = [m for m in rtf.getmembers() if m.islnk()]
+            self.assertEqual(len(links), 1)
+            for path in ('one', 'two'):
+                member = rtf.extractfile(f'test/tests/{path}.txt')
+                self.assertEqual(member.read(), b'same content')
+
+    def test_rewrites_break_links(self):
+        for path in ('one', 'two', 'three'):
+            self.tf.add_string('user=admin pass=secret', f'tests/{path}.txt')
+        self.tf.add_string('user=admin pass=XXXXXX', 'tests/one.txt')
+        self.tf.do_file_subs({'tests/two.txt': [(r'pass=\w+', 0, 'pass=Y')]})
+        contents = []
+        for path in ('one', 'two', 'three'):
+            with self.tf.open_file(f'tests/{path}.txt') as f:
+                contents.append(f.read())
+        self.assertEqual(contents, ['user=admin pass=XXXXXX',
+                                    'user=admin pass=Y',
+                                    'user=admin pass=secret'])
+
+    def test_streamed_links(self):
+        enc = {'encrypt': False}
+        tf = StreamingTarFileArchive('stream', self.tmpdir, Policy(), 1, enc,
+                                     '/')
+        tf.dedup = True
+        tf.add_string('same content', 'tests/one.txt')
+        tf.add_string('same content', 'tests/two.txt')
+        tf.release('tests', ['tests/one.txt'])
+        tf.release('tests', ['tests/two.txt'])
+        name = tf.finalize('gzip')
+        with tarfile.open(name) as rtf:
+            self.assertTrue(rtf.getmember('stream/tests/two.txt').islnk())
+            member = rtf.extractfile('stream/tests/two.txt')
+            self.assertEqual(member.read(), b'same content')
+
+
+class BaselineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.enc = {'encrypt': False}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def build(self, name, files, dedup=False):
+        archive = TarFileArchive(name, os.path.join(self.tmpdir, name),
+                                 Policy(), 1, self.enc, '/')
+        archive.dedup = dedup
+        for path, content in files.items():
+            archive.add_string(content, path)
+        return archive
+
+    def test_content_index(self):
+        files = {'etc/one': 'same content', 'etc/two': 'same content',
+                 'etc/three': 'other content'}
+        name = self.build('base', files, dedup=True).finalize('gzip')
+        top, index = report_content_index(name)
+        self.assertEqual(top, 'base')
+        self.assertEqual(index['etc/one'], index['etc/two'])
+        self.assertNotEqual(index['etc/one'], index['etc/three'])
+
+    def test_delta_rebuild(self):
+        files = {'etc/one': 'same content', 'etc/two': 'same content',
+                 'etc/three': 'old content', 'sos_logs/sos.log': 'log'}
+        base = self.build('base', files, dedup=True).finalize('gzip')
+        _top, index = report_content_index(base)
+
+        files.update({'etc/three': 'new content', 'etc/four': 'added'})
+        delta = self.build('delta', files)
+        dropped, size = delta.drop_unchanged(index)
+        self.assertEqual(sorted(dropped), ['etc/one', 'etc/two'])
+        self.assertEqual(size, 2 * len('same content'))
+        name = delta.finalize('gzip')
+        with tarfile.open(name) as rtf:
+            names = rtf.getnames()
+        self.assertNotIn('delta/etc/one', names)
+        self.assertIn('delta/etc/three', names)
+        self.assertIn('delta/sos_logs/sos.log', names)
+
+        report_dir = extract_tarfile(name, os.path.join(self.tmpdir, 'out'))
+        missing = SoSRebuild.copy_from_baseline(base, report_dir, dropped)
+        self.assertFalse(missing)
+        for path, content in files.items():
+            with open(os.path.join(report_dir, path), 'r') as rebuilt:
+                self.assertEqual(rebuilt.read(), content)
+
+    def test_rebuild_checks_content(self):
+        base = self.build('base', {'etc/one': 'content'}).finalize('gzip')
+        report_dir = os.path.join(self.tmpdir, 'out')
+        os.makedirs(report_dir)
+        missing = SoSRebuild.copy_from_baseline(
+            base, report_dir, {'etc/one': '0' * 64, 'etc/two': '0' * 64}
+        )
+        self.assertEqual(missing, {'etc/one', 'etc/two'})
+        self.assertFalse(os.path.exists(os.path.join(report_dir, 'etc/one')))
+
+
+class ParallelCompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        enc = {'encrypt': False}
+        self.tf = TarFileArchive('test', self.tmpdir, Policy(), 4, enc, '/')
+        self.content = ''.join(f"line {i} of the test file\n"
+                               for i in range(20000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_archive(self, method):
+        self.tf.add_string(self.content, 'tests/big.txt')
+        with patch.object(ParallelCompressor, 'block_size', 64 * 1024), \
+                patch('os.sched_getaffinity', return_value={0, 1, 2, 3}):
+            name = self.tf.finalize(method)
+        with tarfile.open(name) as rtf:
+            member = rtf.extractfile('test/tests/big.txt')
+            self.assertEqual(member.read().decode(), self.content)
+        return name
+
+    def test_xz(self):
+        name = self.check_archive('xz')
+        self.assertTrue(name.endswith('.tar.xz'))
+        if shutil.which('xz'):
+            subprocess.run(['xz', '-t', name], check=True)
+
+    def test_gzip(self):
+        name = self.check_archive('gzip')
+        self.assertTrue(name.endswith('.tar.gz'))
+        if shutil.which('gzip'):
+            subprocess.run(['gzip', '-t', name], check=True)
+
+    def test_member_index(self):
+        for method in ('gzip', 'xz'):
+            with self.subTest(method=method):
+                tf = TarFileArchive(f'index-{method}', self.tmpdir, Policy(),
+                                    1, {'encrypt': False}, '/')
+                tf.dedup = True
+                tf.write_index = True
+                tf.add_string('small file', 'tests/small.txt')
+                tf.add_string(self.content, 'tests/big.txt')
+                tf.add_string(self.content, 'tests/big-copy.txt')
+                tf.add_string(self.content[::-1], 'tests/reversed.txt')
+                tf.add_link('big.txt', 'tests/big-link.txt')
+                with patch.object(ParallelCompressor, 'block_size',
+                                  64 * 1024):
+                    name = tf.finalize(method)
+                index = ArchiveIndex.load(name)
+                self.assertIsNotNone(index)
+                self.assertGreater(len(index.blocks), 1)
+                top = f'index-{method}/tests'
+                self.assertEqual(index.read(f'{top}/small.txt'),
+                                 b'small file')
+                for path in ('big.txt', 'big-copy.txt', 'big-link.txt'):
+                    self.assertEqual(index.read(f'{top}/{path}').decode(),
+                                     self.content)
+                self.assertEqual(index.read(f'{top}/reversed.txt').decode(),
+                                 self.content[::-1])
+                with self.assertRaises(KeyError):
+                    index.read(f'{top}/missing.txt')
+
+    def test_no_index_by_default(self):
+        tf = TarFileArchive('single', self.tmpdir, Policy(), 1,
+                            {'encrypt': False}, '/')
+        tf.add_string(self.content, 'tests/big.txt')
+        with patch.object(ParallelCompressor, '__init__') as compressor:
+            name = tf.finalize('gzip')
+            compressor.assert_not_called()
+        self.assertFalse(os.path.exists(name + ARCHIVE_INDEX_SUFFIX))
+        with tarfile.open(name) as rtf:
+            member = rtf.extractfile('single/tests/big.txt')
+            self.assertEqual(member.read().decode(), self.content)
+
+    def test_stale_index_ignored(self):
+        self.tf.write_index = True
+        self.tf.add_string(self.content, 'tests/big.txt')
+        name = self.tf.finalize('gzip')
+        self.assertIsNotNone(ArchiveIndex.load(name))
+        with open(name, 'ab') as archive:
+            archive.write(b'\0')
+        self.assertIsNone(ArchiveIndex.load(name))
+
+
+class StreamingTarFileArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        enc = {'encrypt': False}
+        self.tf = StreamingTarFileArchive('test', self.tmpdir, Policy(), 1,
+                                          enc, '/')
+        self.tf.method = 'gzip'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_release_streams_unclaimed_files(self):
+        self.tf.claim('one', ['etc/one'])
+        self.tf.claim('two', ['etc'])
+        self.tf.add_string('one', 'etc/one/file')
+        self.tf.add_string('cmd', 'sos_commands/one/cmd')
+        # etc/ is still claimed by 'two', which may rewrite etc/one/file
+        self.assertEqual(
+            self.tf.release('one', ['etc/one/file', 'sos_commands/one/cmd']),
+            1
+        )
+        self.assertTrue(os.path.exists(self.tf.dest_path('etc/one/file')))
+        self.assertFalse(
+            os.path.exists(self.tf.dest_path('sos_commands/one/cmd')))
+        self.assertEqual(self.tf.release('two', []), 1)
+        self.assertFalse(os.path.exists(self.tf.dest_path('etc/one/file')))
+        # streamed files are not collected again
+        self.assertIsNone(self.tf.check_path('etc/one/file', P_FILE))
+
+    def test_substitution_of_streamed_file_refused(self):
+        self.tf.claim('one', ['etc/one'])
+        self.tf.add_string('password=secret', 'etc/one/file')
+        self.tf.add_string('password=secret', 'etc/two/file')
+        self.assertEqual(self.tf.release('one', ['etc/one/file']), 1)
+        # a later plugin sanitizing a file that was already streamed
+        subs = {path: [(r'(password=).*', 0, r'\1******')]
+                for path in ['etc/one/file', 'etc/two/file']}
+        with self.assertRaises(StreamedPathError) as err:
+            self.tf.do_file_subs(subs)
+        self.assertEqual(err.exception.paths, ['etc/one/file'])
+        self.assertEqual(self.tf.streamed_writes, {'etc/one/file'})
+        with open(self.tf.dest_path('etc/two/file')) as f:
+            self.assertEqual(f.read(), 'password=******')
+        with self.assertRaises(StreamedPathError):
+            self.tf.do_file_sub('etc/one/file', r'secret', '******')
+        with self.assertRaises(StreamedPathError):
+            self.tf.add_string('password=******', 'etc/one/file')
+
+    def test_hold_paths(self):
+        self.tf.hold_paths = ['sos_commands/process/ps_*']
+        self.tf.add_string('ps', 'sos_commands/process/ps_aux')
+        self.assertEqual(self.tf.release('process',
+                                         ['sos_commands/process/ps_aux']), 0)
+        self.assertTrue(
+            os.path.exists(self.tf.dest_path('sos_commands/process/ps_aux')))
+
+    def test_finalize(self):
+        self.tf.add_string('streamed', 'tests/streamed.txt')
+        self.tf.release('tests', ['tests/streamed.txt'])
+        self.tf.add_string('held', 'tests/held.txt')
+        self.tf.add_string('1.0', 'version.txt')
+        name = self.tf.finalize('gzip')
+        self.assertTrue(name.endswith('.tar.gz'))
+        with tarfile.open(name) as rtf:
+            names = rtf.getnames()
+            self.assertEqual(len(names), len(set(names)))
+            for path, content in [('streamed', b'streamed'),
+                                  ('held', b'held')]:
+                member = rtf.extractfile(f'test/tests/{path}.txt')
+                self.assertEqual(member.read(), content)
+            self.assertIn('test/version.txt', names)
+
+
+@unittest.skipUnless(zstd_available(), 'zstd support is not available')
+class ZstdArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        enc = {'encrypt': False}
+        self.tf = TarFileArchive('test', self.tmpdir, Policy(), 1, enc, '/')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_zstd_archive(self):
+        self.tf.add_string('first', 'tests/first.txt')
+        self.tf.add_string('second', 'tests/second.txt')
+        self.tf.zstd_level = 3
+        name = self.tf.finalize('zstd')
+        self.assertTrue(name.endswith('.tar.zst'))
+        self.assertTrue(is_tarfile(name))
+        if shutil.which('zstd'):
+            subprocess.run(['zstd', '-q', '-t', name], check=True)
+        with open_tarfile(name) as rtf:
+            second = rtf.extractfile('test/tests/second.txt').read()
+            # reading an earlier member seeks backwards in the stream
+            first = rtf.extractfile('test/tests/first.txt').read()
+        self.assertEqual(first, b'first')
+        self.assertEqual(second, b'second')
+
 
 if __name__ == "__main__":
     unittest.main()
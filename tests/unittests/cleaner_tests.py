@@ -6,18 +6,22 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
+import shutil
+import tempfile
 import unittest
 from ipaddress import ip_interface
 from os.path import join
 from unittest import mock
 
 import sos.policies
+from sos.archive import ArchiveIndex, TarFileArchive
 from sos.cleaner.parsers.ip_parser import SoSIPParser
 from sos.cleaner.parsers.mac_parser import SoSMacParser
 from sos.cleaner.parsers.hostname_parser import SoSHostnameParser
 from sos.cleaner.parsers.keyword_parser import SoSKeywordParser
 from sos.cleaner.parsers.ipv6_parser import SoSIPv6Parser
 from sos.cleaner.parsers.username_parser import SoSUsernameParser
+from sos.cleaner.mappings import ItemMatcher, SoSMap
 from sos.cleaner.mappings.ip_map import SoSIPMap
 from sos.cleaner.mappings.mac_map import SoSMacMap
 from sos.cleaner.mappings.hostname_map import SoSHostnameMap
@@ -85,6 +89,13 @@ class CleanerMapTests(unittest.TestCase):
         _hostnosub = self.ip_map.get('192.168.4.1')
         self.assertEqual(_hostwsub.split('/')[0], _hostnosub)
 
+    def test_ip_map_get_without_cidr_no_prefix_match(self):
+        _hostwsub = self.ip_map.get('192.168.5.12/24')
+        _hostnosub = self.ip_map.get('192.168.5.1')
+        self.assertNotEqual(_hostwsub.split('/')[0], _hostnosub)
+        self.assertTrue(ip_interface(_hostnosub).ip in
+                        ip_interface(_hostwsub).network)
+
     def test_ip_skip_ignores(self):
         _test = self.ip_map.get('127.0.0.1')
         self.assertEqual(_test, '127.0.0.1')
@@ -171,6 +182,86 @@ class CleanerMapTests(unittest.TestCase):
                         "First hextet of global network obfuscation over 256"
                         " not expected '54'")
 
+    def test_item_matcher_finds_overlapping_items(self):
+        matcher = ItemMatcher()
+        for key in ('he', 'she', 'hers', 'his'):
+            matcher.add(key, key.upper())
+        self.assertEqual(sorted(matcher.finditer('ushers')),
+                         [(1, 4, 'SHE'), (2, 4, 'HE'), (2, 6, 'HERS')])
+
+    def test_item_matcher_finds_items_added_after_build(self):
+        matcher = ItemMatcher()
+        matcher.min_pending = 2
+        for key in ('he', 'she', 'hers', 'his'):
+            matcher.add(key, key.upper())
+        self.assertEqual(len(list(matcher.finditer('ushers'))), 3)
+        self.assertEqual(matcher._pending_keys, 0)
+        matcher.add('us', 'US')
+        self.assertEqual(sorted(matcher.finditer('ushers')),
+                         [(0, 2, 'US'), (1, 4, 'SHE'), (2, 4, 'HE'),
+                          (2, 6, 'HERS')])
+        self.assertEqual(matcher._pending_keys, 1)
+
+
+class CleanerNewMapTests(unittest.TestCase):
+    """Tests of maps starting from an empty workdir of their own"""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+
+    def test_ip_map_hosts_handed_out_in_order(self):
+        ip_map = SoSIPMap(self.workdir)
+        _net = ip_interface(ip_map.get('10.123.45.0/24')).network
+        for i in range(1, 5):
+            _free = next(h for h in _net.hosts()
+                         if not ip_map.ip_in_dataset(h))
+            _host = ip_interface(ip_map.get(f'10.123.45.{i}/24')).ip
+            self.assertEqual(_host, _free)
+
+    def test_replace_items_needs_full_words(self):
+        sos_map = SoSMap(self.workdir)
+        self.assertFalse(sos_map.single_pass_replace)
+        with self.assertRaises(ValueError):
+            sos_map.replace_items('any line')
+
+    def test_hostname_replace_items_single_pass(self):
+        host_map = SoSHostnameMap(self.workdir)
+        _host = host_map.add('myhost')
+        _db = host_map.add('myhost-db')
+        line, count = host_map.replace_items(
+            'myhost-db, MyHost and notmyhost, myhost_x')
+        self.assertEqual(
+            line, f'{_db}, {_host} and notmyhost, {_host}_x'
+        )
+        self.assertEqual(count, 3)
+
+    def test_hostname_new_item_matched_without_rebuild(self):
+        host_map = SoSHostnameMap(self.workdir)
+        with mock.patch.object(host_map, 'generate_compiled_regexes') \
+                as generate:
+            _new = host_map.add('newhost')
+            line, count = host_map.replace_items('seen newhost')
+        generate.assert_not_called()
+        self.assertEqual(line, f'seen {_new}')
+
+    def test_value_in_dataset_follows_updates(self):
+        kw_map = SoSKeywordMap(self.workdir)
+        kw_map.conf_update({'foo': 'obfuscatedword0'})
+        self.assertTrue(kw_map.value_in_dataset('obfuscatedword0'))
+        self.assertTrue(kw_map.ignore_item('obfuscatedword0'))
+        kw_map.insert_to_dataset('foo', 'obfuscatedword1')
+        self.assertFalse(kw_map.value_in_dataset('obfuscatedword0'))
+        self.assertEqual(kw_map.get('bar'), 'obfuscatedword0')
+
+    def test_keyword_maps_replay_shared_cache(self):
+        first = SoSKeywordMap(self.workdir)
+        second = SoSKeywordMap(self.workdir)
+        self.assertEqual(first.add('foobar'), 'obfuscatedword0')
+        self.assertEqual(second.add('multi\nline'), 'obfuscatedword1')
+        self.assertEqual(first.add('multi\nline'), 'obfuscatedword1')
+        self.assertEqual(SoSKeywordMap(self.workdir).dataset, second.dataset)
+
 
 class CleanerParserTests(unittest.TestCase):
 
@@ -723,3 +814,42 @@ class PackedDirTarballTests(unittest.TestCase):
         with mock.patch.object(self.archive, 'get_file_content',
                                return_value='{"components": {"report": {}}}'):
             self.assertEqual(self.archive._load_packed_dirs(), [])
+
+
+class IndexedArchiveTests(unittest.TestCase):
+    """Verify that files are read through the member index of an archive
+    when it has one, rather than by decompressing the archive"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        report = TarFileArchive('sosreport-indextest', self.tmpdir,
+                                sos.policies.Policy(), 1,
+                                {'encrypt': False}, '/')
+        report.write_index = True
+        report.add_string('indextest\n', 'etc/hostname')
+        self.archive = SoSReportArchive(
+            archive_path=report.finalize('gzip'),
+            keep_binary_files=[],
+            tmpdir=self.tmpdir,
+            treat_certificates='obfuscate'
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_content_read_from_index(self):
+        self.assertIsNotNone(self.archive.index)
+        with mock.patch.object(self.archive.tarobj, 'extractfile') as extr:
+            self.assertEqual(self.archive.get_file_content('etc/hostname'),
+                             'indextest\n')
+            self.assertEqual(self.archive.get_file_content('etc/missing'), '')
+            extr.assert_not_called()
+
+    def test_obfuscated_archive_indexed(self):
+        self.archive.extract(quiet=True)
+        self.archive.compress('gz')
+        index = ArchiveIndex.load(self.archive.final_archive_path)
+        self.assertIsNotNone(index)
+        self.assertEqual(
+            index.read('sosreport-indextest/etc/hostname'), b'indextest\n'
+        )
@@ -10,12 +10,17 @@ import os
 import tempfile
 import shutil
 import random
+import re
 
 from io import StringIO
 from string import ascii_lowercase
 from sos.report.plugins import (Plugin, regex_findall,
-                                _mangle_command, PluginOpt)
+                                _mangle_command, _regex_literal_prefix,
+                                PluginOpt, SoSPathFilter)
 from sos.archive import TarFileArchive
+from sos.utilities import CommandCache
+from sos.component import SoSMetadata
+from sos.policies import Policy
 from sos.policies.distros import LinuxPolicy
 from sos.policies.init_systems import InitSystem
 
@@ -123,6 +128,10 @@ class MockOptions:
     log_size = 25
     allow_system_changes = False
     no_postproc = False
+    plugin_timeout = None
+    cmd_timeout = None
+    cmd_threads = 1
+    chroot = 'auto'
     skip_files = []
     skip_commands = []
     sysroot = None
@@ -166,6 +175,38 @@ class PluginToolTests(unittest.TestCase):
         expected = longcmd[0:name_max].replace(' ', '_')
         self.assertEqual(expected, _mangle_command(longcmd, name_max))
 
+    def test_regex_literal_prefix(self):
+        self.assertEqual("/etc/foo", _regex_literal_prefix("/etc/foo.conf"))
+        self.assertEqual("/etc/fo", _regex_literal_prefix("^/etc/foo?"))
+        self.assertEqual("/etc/foo.con",
+                         _regex_literal_prefix(r"/etc/foo\.conf*"))
+        self.assertEqual("/proc/", _regex_literal_prefix(r"/proc/\d+"))
+        self.assertEqual("", _regex_literal_prefix("/etc/a|/etc/b"))
+        self.assertEqual("", _regex_literal_prefix(".*"))
+
+    def test_path_filter(self):
+        pfilter = SoSPathFilter(['/sys/kernel/debug', '/etc/foo$'],
+                                ['*.pyc', '/etc/shadow'], ['/var/log/*'])
+        self.assertEqual('forbidden', pfilter.check('/sys/kernel/debug/x'))
+        self.assertEqual('forbidden', pfilter.check('/etc/foo'))
+        self.assertIsNone(pfilter.check('/etc/foo.conf'))
+        self.assertEqual('policy', pfilter.check('/usr/lib/a.pyc'))
+        self.assertEqual('skipped', pfilter.check('/var/log/messages'))
+        self.assertTrue(pfilter.is_forbidden('/sys/kernel/debug'))
+        self.assertFalse(pfilter.is_forbidden('/var/log/messages'))
+        self.assertTrue(pfilter.prunes('/sys/kernel/debug'))
+        self.assertTrue(pfilter.prunes('/var/log/journal'))
+        self.assertFalse(pfilter.prunes('/etc/foo'))
+        self.assertFalse(pfilter.prunes('/var/log'))
+        self.assertFalse(pfilter.prunes('/usr/lib'))
+        self.assertIsNone(SoSPathFilter().check('/etc/foo'))
+
+    def test_path_filter_uncombinable(self):
+        pfilter = SoSPathFilter([r'/etc/(a)\1', '/sys'])
+        self.assertEqual('forbidden', pfilter.check('/etc/aa'))
+        self.assertEqual('forbidden', pfilter.check('/sys/x'))
+        self.assertIsNone(pfilter.check('/etc/a'))
+
 
 class PluginTests(unittest.TestCase):
 
@@ -349,6 +390,26 @@ class PluginTests(unittest.TestCase):
         p.postproc()
         self.assertTrue(p.did_postproc)
 
+    def test_exec_cmd_cache(self):
+        commons = {
+            'sysroot': '/',
+            'policy': LinuxPolicy(init=InitSystem(), probe_runtime=False),
+            'cmdlineopts': MockOptions(),
+            'devices': {},
+            'cmd_cache': CommandCache()
+        }
+        first, second = MockPlugin(commons), MockPlugin(commons)
+        cmd = 'date +%N'
+        out = first.exec_cmd(cmd, cache=True)['output']
+        self.assertEqual(second.exec_cmd(cmd, cache=True)['output'], out)
+        self.assertNotEqual(second.exec_cmd(cmd)['output'], out)
+        self.assertNotEqual(
+            second.exec_cmd(cmd, env={'TZ': 'UTC'}, cache=True)['output'],
+            out
+        )
+        self.assertEqual((commons['cmd_cache'].hits,
+                          commons['cmd_cache'].misses), (1, 2))
+
     def test_set_default_cmd_env(self):
         p = MockPlugin({
             'sysroot': self.sysroot,
@@ -364,6 +425,27 @@ class PluginTests(unittest.TestCase):
         self.assertEqual(p.default_environment['GREATESTSPORT'], 'hockey')
         self.assertEqual(p.default_environment['TORVALDS'], 'Linus')
 
+    def test_copied_files_index(self):
+        self.mp.sysroot = '/'
+        paths = ['/etc/b', '/proc/1/status', '/etc/a', '/etc/b', '/etc/ab']
+        for path in paths:
+            self.mp._add_copied_file({'srcpath': path, 'dstpath': path[1:],
+                                      'symlink': 'no'})
+        # entries appended directly are still indexed
+        self.mp.copied_files.append({'srcpath': '/etc/c', 'dstpath': 'c',
+                                     'symlink': 'no'})
+        self.assertEqual(self.mp._get_dest_for_srcpath('/etc/b'), 'etc/b')
+        self.assertEqual(self.mp._get_dest_for_srcpath('/etc/c'), 'c')
+        self.assertIsNone(self.mp._get_dest_for_srcpath('/etc/d'))
+        for regex in (r'/etc/a', r'/etc/.*', r'/etc/[ab]$', r'.*/b',
+                      re.compile(r'/ETC/A', re.I)):
+            with self.subTest(regex=regex):
+                pattern = re.compile(regex)
+                expected = [f for f in self.mp.copied_files
+                            if pattern.match(f['srcpath'])]
+                self.assertEqual(
+                    self.mp._get_copied_files_matching(regex), expected)
+
 
 class AddCopySpecTests(unittest.TestCase):
 
@@ -447,6 +529,27 @@ class AddCopySpecTests(unittest.TestCase):
         ], 1)
         self.assertEqual(len(self.mp.copy_paths), 2)
 
+    def test_expand_directory(self):
+        self.mp.sysroot = '/'
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for subdir in ('a/b', 'a/empty', 'c', '.hidden'):
+            os.makedirs(os.path.join(tmpdir, subdir))
+        for name in ('a/b/one', 'a/.two', 'c/three', '.hidden/four'):
+            with open(os.path.join(tmpdir, name), 'w',
+                      encoding='utf-8') as f:
+                f.write(name)
+        os.symlink('c', os.path.join(tmpdir, 'a', 'link'))
+        found = self.mp._expand_copy_spec(tmpdir)
+        self.assertEqual(sorted(found), [
+            os.path.join(tmpdir, p)
+            for p in ('a/b/one', 'a/empty', 'a/link', 'c/three')
+        ])
+        st, islink = found[os.path.join(tmpdir, 'a/b/one')]
+        self.assertEqual(st.st_size, len('a/b/one'))
+        self.assertFalse(islink)
+        self.assertTrue(found[os.path.join(tmpdir, 'a/link')][1])
+
 
 class CheckEnabledTests(unittest.TestCase):
 
@@ -510,6 +613,74 @@ class RegexSubTests(unittest.TestCase):
         self.assertEqual(1, replacements)
         self.assertTrue("foobar" in self.mp.archive.m.get(j('tail_test.txt')))
 
+    def test_batched_replacements(self):
+        self.mp.sysroot = '/'
+        self.mp.add_copy_spec(j("tail_test.txt"))
+        self.mp.collect_plugin()
+        subs = {}
+        self.mp.set_postproc_batch(subs)
+        self.assertEqual(0, self.mp.do_file_sub(
+            j("tail_test.txt"), r"(tail)", "foobar"))
+        self.mp.do_path_regex_sub(r".*tail_test.*", r"foo", "bar")
+        self.assertEqual(subs, {j('tail_test.txt'): [
+            ("(tail)", re.IGNORECASE | re.MULTILINE, "foobar"),
+            ("foo", re.IGNORECASE | re.MULTILINE, "bar")
+        ]})
+
+
+class CollectCmdsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = MockOptions()
+        self.opts.cmd_threads = 4
+        self.mp = MockPlugin({
+            'cmdlineopts': self.opts,
+            'policy': LinuxPolicy(init=InitSystem(), probe_runtime=False),
+            'sysroot': '/',
+            'cmddir': 'sos_commands',
+            'devices': {}
+        })
+        self.mp.archive = TarFileArchive('test', self.tmpdir, Policy(), 1,
+                                         {'encrypt': False}, '/')
+        self.mp.set_plugin_manifest(SoSMetadata())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parallel_cmds_respect_priority(self):
+        self.mp.add_cmd_output(['sleep 0.3', 'sleep 0.3'], priority=1)
+        self.mp.add_cmd_output('echo late', priority=5)
+        self.mp.collect_plugin()
+        cmds = self.mp.manifest.commands
+        self.assertEqual([c['priority'] for c in cmds], [1, 1, 5])
+        # both sleeps overlap, and the later priority waits for them
+        self.assertLess(cmds[1]['start_time'], cmds[0]['end_time'])
+        self.assertGreaterEqual(cmds[2]['start_time'],
+                                max(cmds[0]['end_time'], cmds[1]['end_time']))
+
+    def test_parallel_cmds_unique_filenames(self):
+        self.mp.add_cmd_output(['echo same'] * 3)
+        self.mp.collect_plugin()
+        names = sorted(c['filepath'] for c in self.mp.manifest.commands)
+        self.assertEqual(names, ['sos_commands/mockplugin/echo_same',
+                                 'sos_commands/mockplugin/echo_same.1',
+                                 'sos_commands/mockplugin/echo_same.2'])
+
+    def test_not_found_cmd_releases_filename(self):
+        self.mp._collect_cmd_output('sos_no_such_command')
+        self.assertEqual(
+            self.mp._make_command_filename('sos_no_such_command'),
+            'sos_commands/mockplugin/sos_no_such_command'
+        )
+
+    def test_concurrency_group_runs_serially(self):
+        self.mp.add_cmd_output(['sleep 0.2', 'sleep 0.2 '],
+                               concurrency_group='sleepers')
+        self.mp.collect_plugin()
+        first, second = self.mp.manifest.commands
+        self.assertGreaterEqual(second['start_time'], first['end_time'])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -5,7 +5,9 @@
 # version 2 of the GNU General Public License.
 #
 # See the LICENSE file in the source distribution for further information.
+import errno
 import logging
+import time
 import unittest
 
 try:
@@ -13,6 +15,7 @@ try:
 except ImportError:
     import simplejson as json
 
+from sos.component import SoSMetadata
 from sos.report import SoSReport
 from sos.report.plugins import Plugin, PluginOpt
 from sos.report.reporting import (Report, Section, Command, CopiedFile,
@@ -221,6 +224,65 @@ class SetTunablesPresetSpacesTest(unittest.TestCase):
             self.set_tunables(['mock.bogus = True'])
 
 
+class SetupPlugin(Plugin):
+    """Plugin whose setup() finishes later the earlier it is loaded"""
+
+    delay = 0
+
+    def setup(self):
+        time.sleep(self.delay)
+        self.add_cmd_output([f'echo {self.name()} {i}' for i in range(3)])
+        self.add_copy_spec(f'/etc/{self.name()}')
+
+
+class SetupThreadsTest(unittest.TestCase):
+
+    def run_setup(self, threads, plugins=None):
+        opts = MockOptions()
+        opts.threads = threads
+        opts.verify = False
+        opts.stream_archive = False
+        opts.since = None
+        opts.plugin_timeout = None
+        opts.cmd_timeout = None
+        opts.cmd_threads = 1
+        commons = {
+            'sysroot': '/',
+            'policy': LinuxPolicy(init=InitSystem()),
+            'cmdlineopts': opts,
+            'devices': {}
+        }
+        report = SoSReport.__new__(SoSReport)
+        report.opts = opts
+        report.ui_log = logging.getLogger('sos_test_setup_threads')
+        report.report_md = SoSMetadata()
+        report.report_md.add_section('plugins')
+        report.archive = None
+        report.env_vars = set()
+        report.loaded_plugins = []
+        for i, plugin in enumerate(plugins or [SetupPlugin] * 6):
+            plug = type(f'setup{i}', (plugin,),
+                        {'delay': (6 - i) * 0.01})(commons)
+            report.loaded_plugins.append((plug.name(), plug))
+        report.setup()
+        cmds = [(name, [cmd.cmd for cmd in plug.collect_cmds])
+                for name, plug in report.loaded_plugins]
+        plugins = json.loads(report.report_md.plugins.get_json())
+        manifest = [(name, list(fields)) for name, fields in plugins.items()]
+        return cmds, manifest
+
+    def test_setup_order_does_not_depend_on_threads(self):
+        self.assertEqual(self.run_setup(1), self.run_setup(4))
+
+    def test_fatal_error_aborts_setup(self):
+        class FullPlugin(SetupPlugin):
+            def setup(self):
+                raise OSError(errno.ENOSPC, 'No space left on device')
+
+        with self.assertRaises(SystemExit):
+            self.run_setup(4, [SetupPlugin, FullPlugin, SetupPlugin])
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,97 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from sos.report.scheduler import PluginCosts, CommandBoard
+
+
+class MockStealPlugin:
+
+    def __init__(self, chains):
+        self.chains = chains
+        self.stolen = []
+
+    def steal_cmds(self):
+        if not self.chains:
+            return False
+        self.stolen.append(self.chains.pop(0))
+        return True
+
+
+class PluginCostsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sos', 'plugin_costs.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_missing_database(self):
+        costs = PluginCosts(self.path)
+        self.assertEqual(costs.costs, {})
+        self.assertEqual(costs.order(['b', 'a']), ['b', 'a'])
+
+    def test_corrupt_database(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w', encoding='utf-8') as dbfile:
+            dbfile.write('not json')
+        self.assertEqual(PluginCosts(self.path).costs, {})
+
+    def test_longest_first(self):
+        costs = PluginCosts(self.path)
+        costs.update('sar', 30)
+        costs.update('logs', 10)
+        self.assertEqual(costs.order(['anaconda', 'logs', 'sar', 'boot']),
+                         ['sar', 'logs', 'anaconda', 'boot'])
+        plugs = [(1, 'logs'), (2, 'sar')]
+        self.assertEqual(costs.order(plugs, key=lambda p: p[1]),
+                         [(2, 'sar'), (1, 'logs')])
+
+    def test_update_averages(self):
+        costs = PluginCosts(self.path)
+        costs.update('sar', 10)
+        costs.update('sar', 20)
+        self.assertEqual(costs.get('sar'), 15)
+
+    def test_save_and_load(self):
+        costs = PluginCosts(self.path)
+        costs.update('sar', 12.5)
+        costs.save()
+        self.assertEqual(PluginCosts(self.path).get('sar'), 12.5)
+
+
+class CommandBoardTest(unittest.TestCase):
+
+    def test_help_without_plugins(self):
+        CommandBoard().help()
+
+    def test_help_steals_until_plugins_finish(self):
+        board = CommandBoard()
+        plug = MockStealPlugin([['a'], ['b']])
+        board.add_plugin(plug)
+        helper = threading.Thread(target=board.help)
+        helper.start()
+        helper.join(0.2)
+        self.assertTrue(helper.is_alive())
+        self.assertEqual(plug.stolen, [['a'], ['b']])
+        plug.chains.append(['c'])
+        board.announce()
+        board.remove_plugin(plug)
+        helper.join(5)
+        self.assertFalse(helper.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
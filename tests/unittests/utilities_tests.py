@@ -6,15 +6,21 @@
 #
 # See the LICENSE file in the source distribution for further information.
 import os.path
+import shutil
 import tempfile
 import threading
+import time
 import unittest
+import unittest.mock
 
 # PYCOMPAT
 from io import StringIO
 
 from sos.utilities import (grep, is_executable, sos_get_command_output,
-                           find, tail, shell_out, tac_logs, StdinWriter)
+                           find, tail, shell_out, tac_logs, StdinWriter,
+                           CommandMonitor, CommandCache, RingBufferFile,
+                           SoSTimeoutError, TailReader, JournalReader,
+                           JournalWindowReader, sos_get_journal_output)
 
 TEST_DIR = os.path.dirname(__file__)
 
@@ -100,6 +106,142 @@ class ExecutableTest(unittest.TestCase):
         self.assertEqual("executed\n", shell_out('echo executed'))
 
 
+class CommandMonitorTest(unittest.TestCase):
+
+    def test_tail_sizelimit(self):
+        result = sos_get_command_output("head -c 3145728 /dev/zero",
+                                        sizelimit=1, binary=True)
+        self.assertEqual(result['status'], 0)
+        self.assertEqual(len(result['output']), 1048576)
+        self.assertTrue(result['truncated'])
+
+    def test_tail_spooled_to_ring_buffer(self):
+        cmd = "seq 1 1000000"
+        expected = sos_get_command_output(cmd)['output']
+        with unittest.mock.patch.object(TailReader, 'spool_size', 65536):
+            result = sos_get_command_output(cmd, sizelimit=1,
+                                            keep_output=False)
+            reader = result['reader']
+            self.assertIsNotNone(reader.ring)
+            self.assertEqual(reader.ring.capacity, 1048576)
+            self.assertTrue(result['truncated'])
+            tailed = b''.join(reader.iter_contents()).decode()
+            reader.cleanup()
+            self.assertEqual(tailed, expected[-1048576:])
+            full = sos_get_command_output(cmd)
+            self.assertEqual(full['output'], expected)
+            self.assertFalse(full['truncated'])
+
+    def test_head_sizelimit_to_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out = os.path.join(tmpdir, 'out')
+            result = sos_get_command_output("head -c 3145728 /dev/zero",
+                                            sizelimit=1, to_file=out)
+            self.assertTrue(result['truncated'])
+            self.assertEqual(os.path.getsize(out), 1048576)
+
+    def test_poller_terminates_command(self):
+        with self.assertRaises(SoSTimeoutError):
+            sos_get_command_output("sleep 10", poller=lambda: True)
+
+    def test_poller_woken_at_deadline(self):
+        deadline = time.monotonic() + 0.2
+        start = time.monotonic()
+        with self.assertRaises(SoSTimeoutError):
+            sos_get_command_output(
+                "sleep 10", deadline=deadline,
+                poller=lambda: time.monotonic() >= deadline
+            )
+        self.assertLess(time.monotonic() - start,
+                        CommandMonitor.POLLER_INTERVAL)
+
+    def test_command_timeout(self):
+        start = time.monotonic()
+        result = sos_get_command_output("sleep 10", timeout=1)
+        self.assertEqual(result['status'], 124)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+class RingBufferFileTest(unittest.TestCase):
+
+    def test_keeps_tail(self):
+        ring = RingBufferFile(capacity=10)
+        ring.write(b'0123456')
+        self.assertFalse(ring.truncated)
+        self.assertEqual(b''.join(ring.iter_contents()), b'0123456')
+        ring.write(b'789abc')
+        self.assertTrue(ring.truncated)
+        self.assertEqual(b''.join(ring.iter_contents(size=3)), b'3456789abc')
+        ring.write(b'defghijklmnopq')
+        self.assertEqual(b''.join(ring.iter_contents()), b'hijklmnopq')
+        ring.close()
+
+    def test_unbounded(self):
+        ring = RingBufferFile()
+        for _ in range(3):
+            ring.write(b'x' * 1000)
+        self.assertFalse(ring.truncated)
+        self.assertEqual(b''.join(ring.iter_contents()), b'x' * 3000)
+        ring.close()
+
+
+class CommandCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CommandCache()
+        self.runs = []
+
+    def run_cmd(self, status=0):
+        self.runs.append(status)
+        return {'status': status, 'output': f"run {len(self.runs)}"}
+
+    def test_hit_and_miss(self):
+        first = self.cache.get(('true',), self.run_cmd)
+        first['output'] = 'changed by caller'
+        self.assertEqual(self.cache.get(('true',), self.run_cmd),
+                         {'status': 0, 'output': 'run 1'})
+        self.cache.get(('false',), self.run_cmd)
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_ttl(self):
+        self.cache.get(('true',), self.run_cmd)
+        self.cache.get(('true',), self.run_cmd, ttl=60)
+        time.sleep(0.01)
+        self.cache.get(('true',), self.run_cmd, ttl=0)
+        self.assertEqual(len(self.runs), 2)
+
+    def test_timeout_not_cached(self):
+        self.cache.get(('sleep',), lambda: self.run_cmd(124))
+        self.cache.get(('sleep',), lambda: self.run_cmd(124))
+        self.assertEqual(self.runs, [124, 124])
+
+    def test_concurrent_callers_run_once(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return self.run_cmd()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(self.cache.get(('x',), slow))
+            ) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+            started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(self.cache.misses, 1)
+
+
 class FindTest(unittest.TestCase):
 
     def test_find_leaf(self):
@@ -212,6 +354,91 @@ class TacTest(unittest.TestCase):
         self.assertEqual(self.tac_logs_str(tac, False), cat)
 
 
+class JournalReaderTest(unittest.TestCase):
+
+    reverse = (b"line 4\n"
+               b"multiline 3.0\n"
+               b" multiline 3.1\n"
+               b"-- Boot 1234 --\n"
+               b"line 2\n"
+               b"line 1\n"
+               b"-- cursor: s=1;i=1\n")
+
+    def test_window_counts_records_that_fit(self):
+        reader = JournalWindowReader(budget=40)
+        # feed the output split across records
+        for chunk in (self.reverse[:10], self.reverse[10:30],
+                      self.reverse[30:]):
+            self.assertTrue(reader.feed(chunk))
+        reader.close()
+        self.assertEqual(reader.cursor, 's=1;i=1')
+        self.assertEqual((reader.fitted, reader.skipped, reader.size),
+                         (2, 2, 36))
+        self.assertTrue(reader.is_full)
+
+    def test_writes_records_after_skipped_ones(self):
+        cat = (b"line 1\n"
+               b"line 2\n"
+               b"-- Boot 1234 --\n"
+               b"multiline 3.0\n"
+               b" multiline 3.1\n"
+               b"line 4\n"
+               b"line 5\n")
+        with tempfile.TemporaryFile() as f_dst:
+            reader = JournalReader(f_dst, skip=2, records=2)
+            self.assertTrue(reader.feed(cat[:30]))
+            self.assertFalse(reader.feed(cat[30:]))
+            self.assertTrue(reader.done)
+            f_dst.seek(0)
+            self.assertEqual(f_dst.read(), cat[30:-7])
+
+
+class JournalOutputTest(unittest.TestCase):
+
+    # stands for a journalctl that, as the real one does, refuses --since
+    # along with a cursor, and ignores --lines
+    journalctl = '''#!/bin/sh
+case "$*" in
+    *--since*--cursor*|*--since*--after-cursor*)
+        echo "Please specify only one of --since=, --cursor=, and" \\
+             "--after-cursor=." >&2
+        exit 1;;
+    *--reverse*--show-cursor*)
+        printf 'line 3\\nline 2\\nline 1\\n-- cursor: s=1;i=1\\n';;
+    *--reverse*)
+        printf 'line 3\\nline 2\\nline 1\\n';;
+    *)
+        printf 'line 1\\nline 2\\nline 3\\n';;
+esac
+'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cmd = os.path.join(self.tmpdir, 'journalctl')
+        with open(self.cmd, 'w', encoding='utf-8') as script:
+            script.write(self.journalctl)
+        os.chmod(self.cmd, 0o755)
+        self.out = os.path.join(self.tmpdir, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_output(self, window):
+        res = sos_get_journal_output(f"{self.cmd} --since yesterday", 1,
+                                     self.out, window=window)
+        self.assertEqual(res['status'], 0)
+        with open(self.out, 'rb') as output:
+            self.assertEqual(output.read(), b"line 1\nline 2\nline 3\n")
+
+    def test_since_with_later_window(self):
+        # the second window is read after the cursor of the first one
+        self.check_output(window=2)
+
+    def test_since_with_single_window(self):
+        # the records are read forwards from the cursor of the only window
+        self.check_output(window=10)
+
+
 class StdinWriterTest(unittest.TestCase):
 
     def test_write_failure_recorded_as_text(self):